@@ -3,7 +3,7 @@
 """
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Website, ArchiveSnapshot, ArchivedPage, ArchivedAsset
+from .models import Website, ArchiveSnapshot, ArchivedPage, ArchivedAsset, UrlCapture
 
 
 @admin.register(Website)
@@ -11,10 +11,10 @@ class WebsiteAdmin(admin.ModelAdmin):
     """
     Админ для веб-сайтов
     """
-    list_display = ['domain', 'title', 'created_by', 'is_active', 'created_at', 'snapshots_count']
+    list_display = ['domain', 'title', 'created_by', 'is_active', 'created_at', 'next_crawl_at', 'snapshots_count']
     list_filter = ['is_active', 'created_at', 'created_by']
     search_fields = ['domain', 'title', 'url']
-    readonly_fields = ['id', 'created_at']
+    readonly_fields = ['id', 'created_at', 'change_rate', 'recrawl_interval']
     
     def snapshots_count(self, obj):
         """Количество снапшотов"""
@@ -88,4 +88,15 @@ class ArchivedAssetAdmin(admin.ModelAdmin):
     def file_size_kb(self, obj):
         """Размер файла в КБ"""
         return f"{obj.file_size / 1024:.2f} КБ"
-    file_size_kb.short_description = 'Размер' 
\ No newline at end of file
+    file_size_kb.short_description = 'Размер'
+
+
+@admin.register(UrlCapture)
+class UrlCaptureAdmin(admin.ModelAdmin):
+    """
+    Админ для индекса захватов URL
+    """
+    list_display = ['url_key', 'timestamp', 'status_code', 'snapshot']
+    list_filter = ['status_code']
+    search_fields = ['url_key']
+    readonly_fields = ['url_key', 'host_key', 'url', 'timestamp', 'snapshot', 'page', 'status_code', 'content_hash']
@@ -7,4 +7,8 @@ class ArchiveConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'archive'
-    verbose_name = 'Веб-архив' 
\ No newline at end of file
+    verbose_name = 'Веб-архив'
+
+    def ready(self):
+        # Регистрация обработчиков сигналов
+        from . import signals  # noqa: F401
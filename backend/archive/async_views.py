@@ -0,0 +1,335 @@
+"""
+Асинхронные (ASGI) views для тяжелых по вводу-выводу эндпоинтов архива
+
+Запросы к БД выполняются через async ORM, а расшифровка и перезапись
+контента - в пуле потоков, поэтому event loop не блокируется и один
+процесс обслуживает много одновременных просмотров архива.
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+)
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.clickjacking import xframe_options_sameorigin
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .batch import decrypt_page, missing_records, record_line, select_batch_pages
+from .http_cache import (
+    apply_cache_headers, is_immutable, not_modified_response, page_etag
+)
+from .metadata import cache_metadata, decrypt_metadata, get_cached_metadata
+from .models import ArchiveSnapshot, ArchivedPage
+from .query_cache import private_cache
+from .replay import (
+    REPLAY_CSP, UrlRewriter, find_asset, find_nearest_capture, find_page,
+    iter_replay_html, replay_cache_key, replay_url, restore_replay_url
+)
+from .serializers import BatchContentSerializer
+from .streaming import iter_json_with_content
+
+# Пул потоков для расшифровки (PBKDF2 + AES) и перезаписи HTML
+CRYPTO_EXECUTOR = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ARCHIVE_CRYPTO_WORKERS', 4),
+    thread_name_prefix='archive-crypto'
+)
+
+# Размер фрагмента при чтении файлов ресурсов
+FILE_CHUNK_SIZE = 64 * 1024
+
+_EXHAUSTED = object()
+
+
+async def run_in_executor(func, *args):
+    """Выполнение синхронной функции в пуле расшифровки"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(CRYPTO_EXECUTOR, func, *args)
+
+
+async def iterate_in_executor(iterator: Iterator) -> AsyncIterator:
+    """
+    Асинхронная обертка над синхронным итератором
+
+    Каждый шаг (расшифровка фрагмента, перезапись HTML, чтение файла)
+    выполняется в пуле потоков.
+    """
+    while True:
+        item = await run_in_executor(next, iterator, _EXHAUSTED)
+        if item is _EXHAUSTED:
+            return
+        yield item
+
+
+def iter_file(file_path: str) -> Iterator[bytes]:
+    """Чтение файла фрагментами"""
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(FILE_CHUNK_SIZE):
+            yield chunk
+
+
+async def load_encrypted_content(page: ArchivedPage) -> ArchivedPage:
+    """Догрузка отложенного зашифрованного контента страницы"""
+    await page.arefresh_from_db(fields=['_encrypted_content'])
+    return page
+
+
+@require_GET
+async def page_content(request, pk):
+    """
+    Получение контента конкретной страницы
+
+    GET /api/v1/archive/snapshots/{id}/page_content/?url=<page_url>
+    """
+    snapshot = await aget_object_or_404(ArchiveSnapshot, pk=pk)
+    page_url = request.GET.get('url')
+
+    if not page_url:
+        return JsonResponse({'error': 'Параметр url обязателен'}, status=400)
+
+    page = await snapshot.pages.by_url(page_url).defer('_encrypted_content', 'search_vector').afirst()
+    if page is None:
+        return JsonResponse({'error': 'Страница не найдена в архиве'}, status=404)
+
+    # Проверяем валидатор до загрузки и расшифровки контента
+    etag = page_etag(page, snapshot.status)
+    immutable = is_immutable(snapshot.status)
+    not_modified = not_modified_response(request, etag, immutable)
+    if not_modified is not None:
+        return not_modified
+
+    await load_encrypted_content(page)
+    response = StreamingHttpResponse(
+        iterate_in_executor(page.iter_content()),
+        content_type='text/html; charset=utf-8'
+    )
+    return apply_cache_headers(response, etag, immutable)
+
+
+async def get_snapshot_metadata(snapshot: ArchiveSnapshot) -> dict:
+    """
+    Метаданные снапшота из кеша; при промахе расшифровываются в пуле потоков
+
+    Зашифрованное поле загружается из БД только при промахе кеша.
+    """
+    metadata = await sync_to_async(get_cached_metadata)(snapshot.pk)
+    if metadata is not None:
+        return metadata
+
+    await snapshot.arefresh_from_db(fields=['_encrypted_metadata'])
+    metadata = await run_in_executor(decrypt_metadata, snapshot._encrypted_metadata)
+    await sync_to_async(cache_metadata)(snapshot.pk, metadata)
+    return metadata
+
+
+async def get_page_with_snapshot(pk) -> ArchivedPage:
+    """Страница со снапшотом без тяжелых полей"""
+    return await aget_object_or_404(
+        ArchivedPage.objects.select_related('snapshot').defer(
+            '_encrypted_content', 'search_vector', 'snapshot___encrypted_metadata'
+        ),
+        pk=pk
+    )
+
+
+@require_GET
+async def page_content_json(request, pk):
+    """
+    Расшифрованный контент страницы с метаданными (JSON, потоково)
+
+    GET /api/v1/archive/pages/{id}/content/
+    """
+    page = await get_page_with_snapshot(pk)
+
+    etag = page_etag(page, page.snapshot.status)
+    immutable = is_immutable(page.snapshot.status)
+    not_modified = not_modified_response(request, etag, immutable)
+    if not_modified is not None:
+        return not_modified
+
+    await load_encrypted_content(page)
+
+    try:
+        # Метаданные расшифровываем заранее, чтобы ошибка вернулась статусом 500
+        metadata = await get_snapshot_metadata(page.snapshot)
+    except Exception as e:
+        return JsonResponse({'error': f'Ошибка расшифровки контента: {str(e)}'}, status=500)
+
+    payload = {
+        'url': page.url,
+        'title': page.title,
+        'metadata': metadata,
+        'status_code': page.status_code,
+        'content_type': page.content_type,
+        'created_at': page.archived_at
+    }
+
+    # HTML контент расшифровывается фрагментами прямо в тело JSON
+    content_chunks = page.iter_content() if page._encrypted_content else None
+    response = StreamingHttpResponse(
+        iterate_in_executor(iter_json_with_content(payload, content_chunks)),
+        content_type='application/json; charset=utf-8'
+    )
+    return apply_cache_headers(response, etag, immutable)
+
+
+@require_GET
+async def page_raw(request, pk):
+    """
+    Расшифрованный контент страницы без JSON обертки (потоково)
+
+    GET /api/v1/archive/pages/{id}/raw/
+    """
+    page = await get_page_with_snapshot(pk)
+
+    etag = page_etag(page, page.snapshot.status)
+    immutable = is_immutable(page.snapshot.status)
+    not_modified = not_modified_response(request, etag, immutable)
+    if not_modified is not None:
+        return not_modified
+
+    content_type = page.content_type or 'text/html'
+    if 'charset' not in content_type:
+        content_type = f'{content_type}; charset=utf-8'
+
+    await load_encrypted_content(page)
+    response = StreamingHttpResponse(iterate_in_executor(page.iter_content()), content_type=content_type)
+    return apply_cache_headers(response, etag, immutable)
+
+
+async def aiter_batch_ndjson(queryset, requested_ids=None, requested_urls=None) -> AsyncIterator[str]:
+    """
+    Поток NDJSON: строки читаются async ORM, расшифровываются в пуле потоков
+
+    Одновременно в работе не более ARCHIVE_BATCH_WORKERS * 2 страниц.
+    """
+    loop = asyncio.get_running_loop()
+    window = max(1, getattr(settings, 'ARCHIVE_BATCH_WORKERS', 4) * 2)
+    in_flight = deque()
+    found_ids = set()
+    found_urls = set()
+
+    async def emit(future):
+        record = await future
+        found_ids.add(record['id'])
+        found_urls.add(record['url'])
+        return record_line(record)
+
+    async for page in queryset.aiterator(chunk_size=100):
+        in_flight.append(loop.run_in_executor(CRYPTO_EXECUTOR, decrypt_page, page))
+        if len(in_flight) >= window:
+            yield await emit(in_flight.popleft())
+    while in_flight:
+        yield await emit(in_flight.popleft())
+
+    for record in missing_records(requested_ids, requested_urls, found_ids, found_urls):
+        yield record_line(record)
+
+
+@csrf_exempt
+@require_POST
+async def page_batch(request):
+    """
+    Пакетная выгрузка расшифрованного контента (NDJSON, потоково)
+
+    POST /api/v1/archive/pages/batch/
+    {"ids": ["uuid", ...]}
+    {"snapshot_id": "uuid", "urls": ["https://...", ...]}
+    {"snapshot_id": "uuid"}  - все страницы снапшота
+
+    Эндпоинт только читает данные, поэтому CSRF-проверка не нужна.
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError as e:
+        return JsonResponse({'error': 'Неверные данные', 'details': str(e)}, status=400)
+
+    serializer = BatchContentSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse({'error': 'Неверные данные', 'details': serializer.errors}, status=400)
+
+    data = serializer.validated_data
+    snapshot = None
+    if data.get('snapshot_id'):
+        snapshot = await aget_object_or_404(ArchiveSnapshot, pk=data['snapshot_id'])
+
+    queryset = select_batch_pages(ids=data.get('ids'), snapshot=snapshot, urls=data.get('urls'))
+    return StreamingHttpResponse(
+        aiter_batch_ndjson(queryset, data.get('ids'), data.get('urls')),
+        content_type='application/x-ndjson; charset=utf-8'
+    )
+
+
+@require_GET
+@xframe_options_sameorigin
+async def replay(request, snapshot_id, url):
+    """
+    Воспроизведение архивированного URL с переписанными ссылками
+
+    GET /api/v1/archive/replay/<snapshot_id>/<url>
+    """
+    snapshot = await aget_object_or_404(ArchiveSnapshot, pk=snapshot_id)
+    url = restore_replay_url(url, request.META.get('QUERY_STRING', ''))
+    immutable = is_immutable(snapshot.status)
+
+    page = await sync_to_async(find_page)(snapshot, url)
+    if page is not None:
+        etag = page_etag(page, snapshot.status)
+        not_modified = not_modified_response(request, etag, immutable)
+        if not_modified is not None:
+            return not_modified
+
+        store = private_cache() if immutable else None
+        cached = await store.aget(replay_cache_key(page, snapshot.pk)) if store is not None else None
+        if cached is not None:
+            response = HttpResponse(cached, content_type='text/html; charset=utf-8')
+        else:
+            await load_encrypted_content(page)
+            response = StreamingHttpResponse(
+                iterate_in_executor(iter_replay_html(page, snapshot.pk, cacheable=immutable)),
+                content_type='text/html; charset=utf-8'
+            )
+        response['Content-Security-Policy'] = REPLAY_CSP
+        return apply_cache_headers(response, etag, immutable)
+
+    asset = await sync_to_async(find_asset)(snapshot, url)
+    if asset is not None and os.path.exists(asset.file_path):
+        content_type = asset.content_type or 'application/octet-stream'
+        etag = f'"a-{asset.pk}-{asset.file_size}"'
+        not_modified = not_modified_response(request, etag, immutable)
+        if not_modified is not None:
+            return not_modified
+
+        if content_type.startswith('text/css') or asset.asset_type == 'css':
+            # Ссылки внутри CSS (шрифты, изображения, @import) тоже переписываются
+            css = await run_in_executor(rewrite_css_file, snapshot.pk, asset.url, asset.file_path)
+            response = HttpResponse(css, content_type='text/css; charset=utf-8')
+        else:
+            response = StreamingHttpResponse(
+                iterate_in_executor(iter_file(asset.file_path)),
+                content_type=content_type
+            )
+            response['Content-Length'] = os.path.getsize(asset.file_path)
+        return apply_cache_headers(response, etag, immutable)
+
+    # В снапшоте нет такого URL - перенаправляем в ближайший по времени снапшот
+    # (по захваченному URL: запрошенный мог отличаться схемой, www или слешем)
+    nearest = await sync_to_async(find_nearest_capture)(snapshot, url)
+    if nearest is not None:
+        nearest_id, captured_url = nearest
+        return HttpResponseRedirect(replay_url(nearest_id, captured_url))
+
+    raise Http404('URL не найден в архиве')
+
+
+def rewrite_css_file(snapshot_id, asset_url: str, file_path: str) -> str:
+    """Чтение архивированного CSS с перезаписью ссылок"""
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        return UrlRewriter(snapshot_id, asset_url).rewrite_css(f.read())
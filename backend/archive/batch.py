@@ -0,0 +1,79 @@
+"""
+Пакетная выгрузка расшифрованного контента страниц (NDJSON)
+"""
+import json
+import logging
+from typing import Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ArchivedPage, compute_url_hash
+
+logger = logging.getLogger(__name__)
+
+# Поля страницы, загружаемые одним запросом вместе с контентом
+BATCH_FIELDS = (
+    'id', 'snapshot_id', 'url', 'title', 'status_code',
+    'content_type', 'archived_at', 'content_hash', '_encrypted_content'
+)
+
+
+def select_batch_pages(ids=None, snapshot=None, urls=None):
+    """
+    Выборка страниц пакета одним запросом
+
+    Args:
+        ids: Список ID страниц
+        snapshot: Снапшот (все страницы или только urls)
+        urls: Список URL внутри снапшота
+
+    Returns:
+        QuerySet страниц
+    """
+    queryset = ArchivedPage.objects.only(*BATCH_FIELDS)
+    if ids:
+        return queryset.filter(pk__in=ids).order_by('pk')
+
+    queryset = queryset.filter(snapshot=snapshot)
+    if urls:
+        # Поиск по индексу (snapshot, url_hash) с проверкой URL от коллизий
+        queryset = queryset.filter(
+            url_hash__in=[compute_url_hash(url) for url in urls],
+            url__in=urls
+        )
+    return queryset.order_by('url')
+
+
+def decrypt_page(page: ArchivedPage) -> dict:
+    """Запись NDJSON для одной страницы"""
+    record = {
+        'id': page.pk,
+        'snapshot_id': page.snapshot_id,
+        'url': page.url,
+        'title': page.title,
+        'status_code': page.status_code,
+        'content_type': page.content_type,
+        'archived_at': page.archived_at,
+        'content_hash': page.content_hash,
+    }
+    try:
+        record['content'] = page.content
+    except ValueError as e:
+        logger.error(f"Ошибка расшифровки страницы {page.pk}: {e}")
+        record['error'] = str(e)
+    return record
+
+
+def record_line(record: dict) -> str:
+    """Строка NDJSON"""
+    return json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def missing_records(requested_ids, requested_urls, found_ids, found_urls) -> Iterator[dict]:
+    """Записи об отсутствующих в архиве страницах"""
+    for page_id in requested_ids or []:
+        if page_id not in found_ids:
+            yield {'id': str(page_id), 'error': 'Страница не найдена'}
+    for url in requested_urls or []:
+        if url not in found_urls:
+            yield {'url': url, 'error': 'Страница не найдена'}
@@ -0,0 +1,162 @@
+"""
+CDX-подобный индекс захватов URL
+
+Каждая архивированная страница получает запись UrlCapture с каноническим
+ключом URL в формате SURT (com,example)/path?a=1). Ключ упорядочен от
+общего к частному, поэтому все захваты URL, префикса URL или хоста
+находятся одним диапазонным сканированием индекса.
+"""
+from typing import Tuple
+from urllib.parse import SplitResult, urlsplit, parse_qsl, urlencode
+
+from django.db.models import Q
+
+from .models import ArchivedPage, UrlCapture
+
+# Ограничение длины ключа, чтобы запись гарантированно помещалась в btree
+MAX_URL_KEY_LENGTH = 1024
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+
+def surt_host(host: str) -> str:
+    """
+    Преобразование хоста в SURT форму: www.example.com -> com,example
+
+    Args:
+        host: Имя хоста (возможно с портом)
+
+    Returns:
+        str: Хост в обратном порядке без www
+    """
+    host = host.lower().strip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    return ','.join(reversed(host.split('.')))
+
+
+def canonical_host_key(parts: SplitResult) -> str:
+    """SURT ключ хоста; порт сохраняется, только если он не порт по умолчанию схемы"""
+    host_key = surt_host(parts.hostname or '')
+    if parts.port and str(parts.port) != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host_key = f"{host_key}:{parts.port}"
+    return host_key
+
+
+def canonical_query(query: str) -> str:
+    """Параметры запроса в отсортированном и единообразно закодированном виде"""
+    return urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+
+
+def split_lookup_url(url: str) -> SplitResult:
+    """
+    Разбор URL из запроса к индексу, где схему можно не указывать
+
+    Без схемы подразумевается http, а с портом 443 - https, чтобы порт
+    по умолчанию отбрасывался так же, как при записи захвата.
+    """
+    url = url.strip()
+    if '://' in url:
+        return urlsplit(url)
+    parts = urlsplit(f"http://{url}")
+    if parts.port == 443:
+        parts = urlsplit(f"https://{url}")
+    return parts
+
+
+def canonicalize_url(url: str) -> Tuple[str, str]:
+    """
+    Канонический ключ URL для индекса захватов
+
+    Схема и фрагмент отбрасываются, хост приводится к SURT форме,
+    порт по умолчанию удаляется, параметры запроса сортируются.
+
+    Args:
+        url: Исходный URL
+
+    Returns:
+        Tuple[str, str]: (ключ URL, ключ хоста)
+    """
+    parts = urlsplit(url.strip())
+    host_key = canonical_host_key(parts)
+
+    path = parts.path or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/')
+    url_key = f"{host_key}){path.lower()}"
+
+    if parts.query:
+        url_key = f"{url_key}?{canonical_query(parts.query)}"
+
+    return url_key[:MAX_URL_KEY_LENGTH], host_key
+
+
+def canonicalize_prefix(url_prefix: str) -> str:
+    """
+    Канонический ключ для поиска по префиксу URL
+
+    Хост, порт и параметры запроса нормализуются так же, как в
+    canonicalize_url; в отличие от него завершающий слэш не отбрасывается
+    и не добавляется, чтобы префикс example.com/blog совпадал с /blog/...
+    """
+    parts = split_lookup_url(url_prefix)
+    key = f"{canonical_host_key(parts)}){parts.path.lower()}"
+    if parts.query:
+        key = f"{key}?{canonical_query(parts.query)}"
+    return key[:MAX_URL_KEY_LENGTH]
+
+
+def record_capture(page: ArchivedPage) -> UrlCapture:
+    """
+    Добавление (или обновление) записи индекса для архивированной страницы
+
+    Args:
+        page: Сохраненная архивированная страница
+
+    Returns:
+        UrlCapture: Запись индекса
+    """
+    url_key, host_key = canonicalize_url(page.url)
+    capture, _ = UrlCapture.objects.update_or_create(
+        page_id=page.pk,
+        defaults={
+            'url_key': url_key,
+            'host_key': host_key,
+            'url': page.url,
+            'timestamp': page.archived_at,
+            'snapshot_id': page.snapshot_id,
+            'status_code': page.status_code,
+            'content_hash': page.content_hash,
+        }
+    )
+    return capture
+
+
+def lookup_captures(url: str, match_type: str = 'exact'):
+    """
+    Поиск захватов URL во всех снапшотах
+
+    Args:
+        url: URL, префикс URL или хост
+        match_type: exact - точный URL, prefix - все URL с префиксом,
+                    host - все URL хоста
+
+    Returns:
+        QuerySet записей UrlCapture
+    """
+    queryset = UrlCapture.objects.all()
+
+    if match_type == 'host':
+        return queryset.filter(host_key=canonical_host_key(split_lookup_url(url)))
+
+    if match_type == 'prefix':
+        prefix = canonicalize_prefix(url)
+        condition = Q(url_key__startswith=prefix)
+        if prefix.endswith('/') and not prefix.endswith(')/'):
+            # Ключ самой страницы /blog/ хранится без завершающего слэша
+            page_key = prefix.rstrip('/')
+            condition |= Q(url_key=page_key) | Q(url_key__startswith=f"{page_key}?")
+        return queryset.filter(condition)
+
+    url_key, _ = canonicalize_url(split_lookup_url(url).geturl())
+    return queryset.filter(url_key=url_key)
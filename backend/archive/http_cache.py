@@ -0,0 +1,81 @@
+"""
+HTTP-кеширование архивного контента (ETag, 304 Not Modified, Cache-Control)
+
+Страницы завершенного снапшота больше не меняются и отдаются с долгоживущим
+Cache-Control: immutable. Карточка снапшота включает данные сайта, которые
+могут измениться и после завершения, поэтому всегда перепроверяется по ETag,
+как и контент незавершенных снапшотов.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+# Год - максимальный рекомендуемый срок для immutable ресурсов
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def quote_etag(value: str) -> str:
+    """Сильный ETag в кавычках"""
+    return f'"{value}"'
+
+
+def snapshot_etag(snapshot) -> str:
+    """
+    ETag карточки снапшота
+
+    Пока снапшот обрабатывается, меняются статус и счетчики; карточка
+    также включает данные сайта (website_info) - все это входит в ETag.
+    """
+    website = snapshot.website
+    website_key = hashlib.sha256(
+        f"{website.pk}\0{website.domain}\0{website.title}\0{website.url}".encode('utf-8')
+    ).hexdigest()[:16]
+    return quote_etag(
+        f"s-{snapshot.pk}-{snapshot.status}-{snapshot.pages_count}-"
+        f"{snapshot.assets_count}-{snapshot.total_size}-{website_key}"
+    )
+
+
+def page_etag(page, snapshot_status: str) -> str:
+    """
+    ETag контента страницы на основе content_hash
+
+    Статус снапшота входит в ETag, так как от него зависит Cache-Control.
+    """
+    content_key = page.content_hash or f"{page.pk}-{page.archived_at.timestamp()}"
+    return quote_etag(f"p-{content_key}-{snapshot_status}")
+
+
+def is_immutable(snapshot_status: str) -> bool:
+    """Контент завершенного снапшота не меняется"""
+    return snapshot_status == 'completed'
+
+
+def not_modified_response(request, etag: str, immutable: bool):
+    """
+    Проверка If-None-Match до расшифровки контента
+
+    Returns:
+        HttpResponseNotModified с заголовками кеширования или None
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        apply_cache_headers(response, etag, immutable)
+    return response
+
+
+def apply_cache_headers(response, etag: str, immutable: bool):
+    """
+    Установка ETag и Cache-Control
+
+    Args:
+        response: HTTP ответ
+        etag: Значение ETag
+        immutable: Контент неизменяем (снапшот завершен)
+    """
+    response['ETag'] = etag
+    if immutable:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
@@ -0,0 +1,61 @@
+"""
+Заполнение хешей URL для страниц и ресурсов, сохраненных до появления колонки url_hash
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from archive.models import ArchivedAsset, ArchivedPage, compute_url_hash
+
+
+class Command(BaseCommand):
+    """
+    Онлайн-заполнение url_hash небольшими пакетами
+
+    Каждый пакет обновляется в отдельной короткой транзакции, поэтому
+    блокировки строк держатся миллисекунды и команду можно запускать
+    на работающей базе. Таблица проходится по первичному ключу
+    (id > последнего обработанного), поэтому каждая строка читается
+    один раз, а не при каждом пакете.
+    """
+    help = 'Заполняет колонку url_hash у ArchivedPage и ArchivedAsset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество строк в одной транзакции')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Пауза между пакетами (секунды) для снижения нагрузки')
+
+    def handle(self, *args, **options):
+        for model in (ArchivedPage, ArchivedAsset):
+            updated = self.backfill(model, options['batch_size'], options['sleep'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural}: заполнено {updated}"
+            ))
+
+    def backfill(self, model, batch_size: int, sleep: float) -> int:
+        """Заполнение url_hash для одной модели"""
+        updated = 0
+        last_id = None
+        while True:
+            with transaction.atomic():
+                queryset = model.objects.filter(url_hash__isnull=True)
+                if last_id is not None:
+                    queryset = queryset.filter(id__gt=last_id)
+                batch = list(
+                    queryset.order_by('id')
+                    .select_for_update()
+                    .only('id', 'url')[:batch_size]
+                )
+                if not batch:
+                    return updated
+                last_id = batch[-1].id
+
+                for obj in batch:
+                    obj.url_hash = compute_url_hash(obj.url)
+                model.objects.bulk_update(batch, ['url_hash'])
+
+            updated += len(batch)
+            if sleep:
+                time.sleep(sleep)
@@ -0,0 +1,34 @@
+"""
+Перестроение CDX-индекса захватов URL
+"""
+from django.core.management.base import BaseCommand
+
+from archive.cdx import record_capture
+from archive.models import ArchivedPage
+
+
+class Command(BaseCommand):
+    """
+    Добавление в индекс захватов страниц, сохраненных до его появления
+    """
+    help = 'Перестраивает индекс захватов URL (UrlCapture) для таймкарты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Переиндексировать все страницы, а не только отсутствующие в индексе')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество страниц, загружаемых за один запрос')
+
+    def handle(self, *args, **options):
+        queryset = ArchivedPage.objects.only(
+            'id', 'url', 'archived_at', 'snapshot_id', 'status_code', 'content_hash'
+        )
+        if not options['all']:
+            queryset = queryset.filter(capture__isnull=True)
+
+        recorded = 0
+        for page in queryset.order_by('pk').iterator(chunk_size=options['batch_size']):
+            record_capture(page)
+            recorded += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Добавлено захватов в индекс: {recorded}"))
@@ -0,0 +1,39 @@
+"""
+Перестроение полнотекстового индекса архивированных страниц
+"""
+from django.core.management.base import BaseCommand
+
+from archive.models import ArchivedPage
+from archive.search import index_page
+
+
+class Command(BaseCommand):
+    """
+    Индексация страниц, сохраненных до появления поиска
+    """
+    help = 'Перестраивает поисковый индекс (search_vector) архивированных страниц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Переиндексировать все страницы, а не только неиндексированные')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Количество страниц, загружаемых за один запрос')
+
+    def handle(self, *args, **options):
+        queryset = ArchivedPage.objects.only('id', 'url', 'title', '_encrypted_content')
+        if not options['all']:
+            queryset = queryset.filter(search_vector__isnull=True)
+
+        indexed = 0
+        failed = 0
+        for page in queryset.order_by('pk').iterator(chunk_size=options['batch_size']):
+            try:
+                index_page(page, page.content)
+                indexed += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Ошибка индексации страницы {page.pk}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Проиндексировано страниц: {indexed}, ошибок: {failed}"
+        ))
@@ -0,0 +1,80 @@
+"""
+Кеш расшифрованных метаданных снапшотов
+
+Метаданные общие для всех страниц снапшота, а их расшифровка (PBKDF2 +
+AES + JSON) дорогая, поэтому результат кешируется по ID снапшота и
+сбрасывается при сохранении снапшота (см. signals.py).
+
+Расшифрованные данные хранятся только в кеше процесса (см.
+query_cache.private_cache). Ключ включает версию тега снапшота из общего
+кеша, поэтому сброс при сохранении действует во всех процессах.
+"""
+from typing import Any, Dict, Optional
+
+from encryption.file_encryption import ArchiveFileEncryption
+from .query_cache import get_tag_versions, invalidate_tags, private_cache
+
+# Страховочный срок хранения (основная инвалидация - по сохранению снапшота)
+METADATA_CACHE_TIMEOUT = 60 * 60
+
+
+def metadata_tag(snapshot_id) -> str:
+    """Тег метаданных снапшота (версия сбрасывается при его сохранении)"""
+    return f"snapshot-metadata:{snapshot_id}"
+
+
+def metadata_cache_key(snapshot_id) -> str:
+    """Ключ кеша метаданных снапшота с текущей версией тега"""
+    tag = metadata_tag(snapshot_id)
+    return f"archive:snapshot-metadata:{snapshot_id}:{get_tag_versions([tag])[tag]}"
+
+
+def decrypt_metadata(encrypted_metadata: str) -> Dict[str, Any]:
+    """Расшифровка метаданных (пустое значение - пустой словарь)"""
+    if not encrypted_metadata:
+        return {}
+    return ArchiveFileEncryption().decrypt_archive_metadata(encrypted_metadata)
+
+
+def get_cached_metadata(snapshot_id) -> Optional[Dict[str, Any]]:
+    """Метаданные из кеша или None"""
+    store = private_cache()
+    if store is None:
+        return None
+    return store.get(metadata_cache_key(snapshot_id))
+
+
+def cache_metadata(snapshot_id, metadata: Dict[str, Any]) -> None:
+    """Сохранение расшифрованных метаданных в кеш процесса"""
+    store = private_cache()
+    if store is not None:
+        store.set(metadata_cache_key(snapshot_id), metadata, METADATA_CACHE_TIMEOUT)
+
+
+def invalidate_metadata(snapshot_id) -> None:
+    """Сброс кеша метаданных снапшота во всех процессах"""
+    invalidate_tags(metadata_tag(snapshot_id))
+
+
+def get_snapshot_metadata(snapshot) -> Dict[str, Any]:
+    """
+    Расшифрованные метаданные снапшота с кешированием
+
+    Если поле _encrypted_metadata было отложено (defer), оно загружается
+    только при промахе кеша.
+
+    Args:
+        snapshot: Снапшот архива
+
+    Returns:
+        Dict[str, Any]: Метаданные
+    """
+    metadata = get_cached_metadata(snapshot.pk)
+    if metadata is not None:
+        return metadata
+
+    if '_encrypted_metadata' in snapshot.get_deferred_fields():
+        snapshot.refresh_from_db(fields=['_encrypted_metadata'])
+    metadata = decrypt_metadata(snapshot._encrypted_metadata)
+    cache_metadata(snapshot.pk, metadata)
+    return metadata
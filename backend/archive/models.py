@@ -3,11 +3,38 @@
 """
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 from encryption.aes_cipher import AESCipher
+from encryption.file_encryption import ArchiveFileEncryption
+from .metadata import get_snapshot_metadata
+import hashlib
 import uuid
 
 
+def compute_url_hash(url: str) -> int:
+    """
+    Фиксированный 64-битный хеш URL для индексированного поиска по равенству
+
+    Индекс по 8-байтовому числу в десятки раз компактнее индекса по
+    URL длиной до 2048 символов. Возможные коллизии отсекаются
+    дополнительным сравнением самого URL (см. UrlHashQuerySet.by_url).
+    """
+    digest = hashlib.sha256(url.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+class UrlHashQuerySet(models.QuerySet):
+    """
+    QuerySet с поиском по хешу URL
+    """
+    
+    def by_url(self, url: str):
+        """Фильтр по URL через индекс url_hash"""
+        return self.filter(url_hash=compute_url_hash(url), url=url)
+
+
 class Website(models.Model):
     """
     Модель для отслеживаемых веб-сайтов
@@ -22,6 +49,11 @@ class Website(models.Model):
     is_active = models.BooleanField(default=True, verbose_name="Активен")
     crawl_depth = models.IntegerField(default=3, verbose_name="Глубина сканирования")
     
+    # Расписание повторного сканирования (crawler/scheduler.py)
+    change_rate = models.FloatField(null=True, blank=True, verbose_name="Частота изменений (в сутки)")
+    recrawl_interval = models.PositiveIntegerField(null=True, blank=True, verbose_name="Интервал сканирования (с)")
+    next_crawl_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Следующее сканирование")
+    
     class Meta:
         verbose_name = "Веб-сайт"
         verbose_name_plural = "Веб-сайты"
@@ -37,7 +69,7 @@ class ArchiveSnapshot(models.Model):
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     website = models.ForeignKey(Website, on_delete=models.CASCADE, related_name='snapshots')
-    snapshot_date = models.DateTimeField(default=timezone.now, verbose_name="Дата снапшота")
+    snapshot_date = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Дата снапшота")
     status = models.CharField(
         max_length=20,
         choices=[
@@ -52,6 +84,16 @@ class ArchiveSnapshot(models.Model):
     pages_count = models.IntegerField(default=0, verbose_name="Количество страниц")
     assets_count = models.IntegerField(default=0, verbose_name="Количество ресурсов")
     total_size = models.BigIntegerField(default=0, verbose_name="Общий размер (байты)")
+    task_id = models.CharField(max_length=255, blank=True, verbose_name="ID задачи сканирования")
+    
+    # Очередь допуска сканирований (crawler/fair_share.py)
+    priority = models.PositiveSmallIntegerField(default=0, verbose_name="Приоритет сканирования")
+    crawl_options = models.JSONField(default=dict, blank=True, verbose_name="Параметры сканирования")
+    dispatched_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено в очередь")
+    
+    # Восстановление прерванных сканирований (crawler/recovery.py)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Последний признак жизни")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток сканирования")
     
     # Зашифрованные метаданные
     _encrypted_metadata = models.TextField(blank=True, verbose_name="Метаданные")
@@ -60,6 +102,15 @@ class ArchiveSnapshot(models.Model):
         verbose_name = "Снапшот архива"
         verbose_name_plural = "Снапшоты архивов"
         ordering = ['-snapshot_date']
+        indexes = [
+            models.Index(fields=['website', '-snapshot_date'], name='snapshot_website_date_idx'),
+            # Ожидающие допуска сканирования в порядке выдачи диспетчером
+            models.Index(
+                fields=['priority', 'snapshot_date'],
+                condition=models.Q(status='pending', dispatched_at__isnull=True),
+                name='snapshot_crawl_waiting_idx'
+            ),
+        ]
         
     def __str__(self):
         return f"{self.website.domain} - {self.snapshot_date.strftime('%Y-%m-%d %H:%M')}"
@@ -67,21 +118,17 @@ class ArchiveSnapshot(models.Model):
     @property
     def metadata(self):
         """
-        Получить расшифрованные метаданные
+        Получить расшифрованные метаданные (кешируются по ID снапшота)
         """
-        if self._encrypted_metadata:
-            cipher = AESCipher()
-            return cipher.decrypt(self._encrypted_metadata)
-        return {}
+        return get_snapshot_metadata(self)
     
     @metadata.setter
     def metadata(self, value):
         """
-        Установить зашифрованные метаданные
+        Установить зашифрованные метаданные (компактный JSON)
         """
         if value:
-            cipher = AESCipher()
-            self._encrypted_metadata = cipher.encrypt(str(value))
+            self._encrypted_metadata = ArchiveFileEncryption().encrypt_archive_metadata(value)
 
 
 class ArchivedPage(models.Model):
@@ -91,10 +138,11 @@ class ArchivedPage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     snapshot = models.ForeignKey(ArchiveSnapshot, on_delete=models.CASCADE, related_name='pages')
     url = models.URLField(max_length=2048, verbose_name="URL страницы")
+    url_hash = models.BigIntegerField(null=True, editable=False, verbose_name="Хеш URL")
     title = models.CharField(max_length=500, blank=True, verbose_name="Заголовок")
     status_code = models.IntegerField(default=200, verbose_name="HTTP статус")
     content_type = models.CharField(max_length=100, default='text/html', verbose_name="MIME тип")
-    archived_at = models.DateTimeField(default=timezone.now, verbose_name="Дата архивирования")
+    archived_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Дата архивирования")
     
     # Зашифрованный контент
     _encrypted_content = models.TextField(verbose_name="Зашифрованный контент")
@@ -105,15 +153,34 @@ class ArchivedPage(models.Model):
     
     # Скриншот
     screenshot_path = models.CharField(max_length=500, blank=True, verbose_name="Путь к скриншоту")
+    thumbnail_path = models.CharField(max_length=500, blank=True, verbose_name="Путь к миниатюре")
+    
+    # Уровень загрузки (http, browser, stealth - crawler/fetcher.py)
+    fetch_tier = models.CharField(max_length=10, blank=True, verbose_name="Уровень загрузки")
+    
+    # Поисковый индекс (лексемы заголовка, URL и текста страницы)
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name="Поисковый индекс")
+    
+    objects = UrlHashQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Архивированная страница"
         verbose_name_plural = "Архивированные страницы"
-        unique_together = ['snapshot', 'url']
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot', 'url_hash'], name='archivedpage_snapshot_url_hash_uniq'),
+        ]
+        indexes = [
+            GinIndex(fields=['search_vector'], name='archivedpage_search_gin'),
+        ]
         
     def __str__(self):
         return f"{self.title} - {self.url}"
     
+    def save(self, *args, **kwargs):
+        """Сохранение с вычислением хеша URL"""
+        self.url_hash = compute_url_hash(self.url)
+        super().save(*args, **kwargs)
+    
     @property
     def content(self):
         """
@@ -124,6 +191,12 @@ class ArchivedPage(models.Model):
             return cipher.decrypt(self._encrypted_content)
         return ""
     
+    def iter_content(self):
+        """
+        Потоковая расшифровка контента фрагментами UTF-8 байт
+        """
+        return AESCipher().decrypt_stream(self._encrypted_content)
+    
     @content.setter
     def content(self, value):
         """
@@ -141,6 +214,7 @@ class ArchivedAsset(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     snapshot = models.ForeignKey(ArchiveSnapshot, on_delete=models.CASCADE, related_name='assets')
     url = models.URLField(max_length=2048, verbose_name="URL ресурса")
+    url_hash = models.BigIntegerField(null=True, editable=False, verbose_name="Хеш URL")
     asset_type = models.CharField(
         max_length=20,
         choices=[
@@ -158,10 +232,53 @@ class ArchivedAsset(models.Model):
     content_type = models.CharField(max_length=100, blank=True, verbose_name="MIME тип")
     archived_at = models.DateTimeField(default=timezone.now, verbose_name="Дата архивирования")
     
+    objects = UrlHashQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Архивированный ресурс"
         verbose_name_plural = "Архивированные ресурсы"
-        unique_together = ['snapshot', 'url']
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot', 'url_hash'], name='archivedasset_snapshot_url_hash_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['snapshot', 'asset_type'], name='asset_snapshot_type_idx'),
+            # Поиск ресурса по URL во всех снапшотах (replay, ближайший захват)
+            models.Index(fields=['url_hash'], name='asset_url_hash_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.asset_type} - {self.url}"
+    
+    def save(self, *args, **kwargs):
+        """Сохранение с вычислением хеша URL"""
+        self.url_hash = compute_url_hash(self.url)
+        super().save(*args, **kwargs)
+
+
+class UrlCapture(models.Model):
+    """
+    Запись CDX-индекса: один захват URL в одном снапшоте
+    """
+    id = models.BigAutoField(primary_key=True)
+    url_key = models.CharField(max_length=1024, verbose_name="Канонический ключ URL (SURT)")
+    host_key = models.CharField(max_length=255, verbose_name="Ключ хоста (SURT)")
+    url = models.URLField(max_length=2048, verbose_name="Исходный URL")
+    timestamp = models.DateTimeField(verbose_name="Время захвата")
+    snapshot = models.ForeignKey(ArchiveSnapshot, on_delete=models.CASCADE, related_name='captures')
+    page = models.OneToOneField(ArchivedPage, on_delete=models.CASCADE, related_name='capture')
+    status_code = models.IntegerField(default=200, verbose_name="HTTP статус")
+    content_hash = models.CharField(max_length=64, blank=True, verbose_name="Хеш контента")
+    
+    class Meta:
+        verbose_name = "Захват URL"
+        verbose_name_plural = "Индекс захватов URL"
+        indexes = [
+            models.Index(fields=['url_key', 'timestamp'], name='urlcapture_key_ts_idx'),
+            models.Index(fields=['host_key', 'timestamp'], name='urlcapture_host_ts_idx'),
+            # Индекс для поиска по префиксу (LIKE 'prefix%') независимо от локали БД
+            models.Index(fields=['url_key'], name='urlcapture_key_prefix_idx',
+                         opclasses=['varchar_pattern_ops']),
+        ]
         
     def __str__(self):
-        return f"{self.asset_type} - {self.url}" 
\ No newline at end of file
+        return f"{self.url_key} @ {self.timestamp:%Y%m%d%H%M%S}"
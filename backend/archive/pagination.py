@@ -0,0 +1,86 @@
+"""
+Курсорная (keyset) пагинация для API веб-архива
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class ArchiveCursorPagination(CursorPagination):
+    """
+    Базовая курсорная пагинация архива
+
+    В отличие от PageNumberPagination не выполняет COUNT(*) и OFFSET:
+    следующая страница выбирается условием по индексированной колонке,
+    поэтому время ответа не зависит от глубины листания.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-id'
+
+
+class SnapshotCursorPagination(ArchiveCursorPagination):
+    """
+    Пагинация снапшотов по дате (индекс snapshot_date)
+    """
+    ordering = ('-snapshot_date', '-id')
+
+
+class PageCursorPagination(ArchiveCursorPagination):
+    """
+    Пагинация архивированных страниц по дате архивирования (индекс archived_at)
+    """
+    ordering = ('-archived_at', '-id')
+
+
+class SnapshotPageCursorPagination(ArchiveCursorPagination):
+    """
+    Пагинация страниц внутри одного снапшота по URL
+
+    Выборка ограничена индексом по snapshot, сортируется не более
+    CRAWLER_MAX_PAGES строк одного снапшота.
+    """
+    ordering = ('url',)
+
+
+class SnapshotAssetCursorPagination(ArchiveCursorPagination):
+    """
+    Пагинация ресурсов внутри одного снапшота по URL
+
+    Выборка ограничена индексом (snapshot, asset_type).
+    """
+    ordering = ('url',)
+
+
+class SearchCursorPagination(ArchiveCursorPagination):
+    """
+    Пагинация результатов полнотекстового поиска по релевантности
+    """
+    ordering = ('-rank', '-id')
+
+
+class CaptureCursorPagination(ArchiveCursorPagination):
+    """
+    Пагинация таймкарты по времени захвата
+    """
+    ordering = ('timestamp', 'id')
+    max_page_size = 1000
+
+
+class CursorPaginatedActionMixin:
+    """
+    Миксин для пагинации кастомных @action во ViewSet
+    """
+
+    def paginated_response(self, queryset, serializer_class, pagination_class=None):
+        """
+        Пагинирует queryset и возвращает ответ со ссылками next/previous
+
+        Args:
+            queryset: Исходный queryset
+            serializer_class: Сериализатор элементов
+            pagination_class: Класс пагинации (по умолчанию pagination_class ViewSet)
+        """
+        paginator = (pagination_class or self.pagination_class)()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
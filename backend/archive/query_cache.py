@@ -0,0 +1,163 @@
+"""
+Кеш результатов запросов для списков архива (read-through)
+
+Ответы списков сайтов и снапшотов, последнего снапшота и поиска по
+снапшотам кешируются по ключу (эндпоинт, параметры запроса, версии тегов).
+Тег - это область данных ('websites', 'snapshots', 'website:<id>'); его
+версия хранится в общем кеше (Redis) и увеличивается сигналами post_save
+и post_delete (см. signals.py), поэтому при изменении данных ключи всех
+зависимых записей меняются сразу во всех процессах.
+
+Значения дополнительно хранятся в кеше процесса (алиас 'local'): ключ
+включает версии тегов, поэтому локальная копия не может устареть.
+"""
+import hashlib
+import time
+from typing import Callable, Dict, Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from rest_framework.response import Response
+
+from webarchive.db_router import use_primary
+
+QUERY_CACHE_TIMEOUT = getattr(settings, 'ARCHIVE_QUERY_CACHE_TIMEOUT', 15 * 60)
+
+# Версии тегов живут дольше записей, чтобы не терять инвалидацию
+TAG_VERSION_TIMEOUT = None
+
+WEBSITES_TAG = 'websites'
+SNAPSHOTS_TAG = 'snapshots'
+
+
+def website_tag(website_id) -> str:
+    """Тег данных одного сайта (его снапшоты, последний снапшот)"""
+    return f"website:{website_id}"
+
+
+def local_cache():
+    """Кеш процесса первого уровня или None, если он не настроен"""
+    if 'local' in settings.CACHES:
+        return caches['local']
+    return None
+
+
+def private_cache():
+    """
+    Кеш для расшифрованных данных или None, если кешировать их негде
+
+    Общий кеш (Redis) хранит значения в открытом виде вне зашифрованного
+    архива, поэтому расшифрованный контент кладется только в кеш процесса.
+    Без алиаса 'local' используется 'default', если он сам локальный.
+    """
+    local = local_cache()
+    if local is not None:
+        return local
+    if settings.CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+        return cache
+    return None
+
+
+def tag_version_key(tag: str) -> str:
+    return f"archive:query-tag:{tag}"
+
+
+def new_version() -> int:
+    """
+    Начальная версия тега - текущее время в миллисекундах
+
+    Если ключ версии вытеснен из кеша, новая версия все равно больше
+    любой выданной ранее, и старые записи не всплывают.
+    """
+    return int(time.time() * 1000)
+
+
+def get_tag_versions(tags: Iterable[str]) -> Dict[str, int]:
+    """Текущие версии тегов (одним запросом к кешу)"""
+    keys = {tag: tag_version_key(tag) for tag in tags}
+    stored = cache.get_many(list(keys.values()))
+
+    versions = {}
+    for tag, key in keys.items():
+        version = stored.get(key)
+        if version is None:
+            version = new_version()
+            if not cache.add(key, version, TAG_VERSION_TIMEOUT):
+                version = cache.get(key, version)
+        versions[tag] = version
+    return versions
+
+
+def invalidate_tags(*tags: str) -> None:
+    """
+    Инвалидация всех записей, зависящих от тегов
+
+    Args:
+        tags: Теги измененных данных
+    """
+    for tag in tags:
+        key = tag_version_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), TAG_VERSION_TIMEOUT)
+
+
+def query_cache_key(scope: str, request, tags: List[str]) -> str:
+    """
+    Ключ записи: эндпоинт, отсортированные параметры запроса и версии тегов
+
+    Хост входит в ключ, так как ссылки пагинации абсолютные.
+
+    Args:
+        scope: Имя эндпоинта
+        request: DRF запрос
+        tags: Теги данных, от которых зависит ответ
+    """
+    params = sorted(
+        (name, value)
+        for name in request.query_params
+        for value in request.query_params.getlist(name)
+    )
+    versions = get_tag_versions(tags)
+    raw = repr((scope, request.get_host(), params, [(tag, versions[tag]) for tag in sorted(tags)]))
+    return f"archive:query:{scope}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+def cached_response(scope: str, request, tags: List[str], build: Callable[[], Response]) -> Response:
+    """
+    Ответ из кеша или построенный заново и сохраненный в кеш
+
+    Кешируются только успешные ответы (200). При промахе ответ строится
+    по основной БД: запись живет до следующей инвалидации, и ответ,
+    прочитанный с отстающей реплики, отдавался бы после того, как реплика
+    догонит основной сервер.
+
+    Args:
+        scope: Имя эндпоинта
+        request: DRF запрос
+        tags: Теги данных, от которых зависит ответ
+        build: Функция, строящая ответ при промахе кеша
+
+    Returns:
+        Response: Ответ API
+    """
+    key = query_cache_key(scope, request, tags)
+    local = local_cache()
+
+    data = local.get(key) if local is not None else None
+    if data is None:
+        data = cache.get(key)
+        if data is not None and local is not None:
+            local.set(key, data, QUERY_CACHE_TIMEOUT)
+    if data is not None:
+        return Response(data)
+
+    with use_primary():
+        response = build()
+    if response.status_code == 200:
+        data = response.data
+        cache.set(key, data, QUERY_CACHE_TIMEOUT)
+        if local is not None:
+            local.set(key, data, QUERY_CACHE_TIMEOUT)
+    return response
@@ -0,0 +1,256 @@
+"""
+Движок воспроизведения (replay) архивированных страниц в стиле Wayback Machine
+
+Ссылки и ресурсы в архивированном HTML/CSS переписываются так, чтобы
+указывать на копии из того же снапшота:
+    /api/v1/archive/replay/<snapshot_id>/<исходный URL>
+Если URL нет в снапшоте, берется ближайший по времени захват.
+"""
+import re
+from typing import Iterable, Iterator, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from django.db.models import F
+from django.urls import reverse
+
+from .cdx import canonicalize_url
+from .models import ArchiveSnapshot, ArchivedAsset, ArchivedPage, UrlCapture
+from .query_cache import private_cache
+from .streaming import iter_text
+
+# Ссылки, которые не переписываются
+SKIP_SCHEMES = ('data:', 'javascript:', 'mailto:', 'tel:', 'about:', 'blob:', '#')
+
+# Атрибуты со ссылками
+ATTR_PATTERN = re.compile(
+    r'(?P<prefix>\s(?:href|src|action|poster|background|data-src)\s*=\s*)'
+    r'(?P<quote>["\']?)(?P<url>[^"\'\s>]+)(?P=quote)',
+    re.IGNORECASE
+)
+SRCSET_PATTERN = re.compile(
+    r'(?P<prefix>\ssrcset\s*=\s*)(?P<quote>["\'])(?P<value>[^"\']*)(?P=quote)',
+    re.IGNORECASE
+)
+CSS_URL_PATTERN = re.compile(r'url\(\s*(?P<quote>["\']?)(?P<url>[^"\')\s]+)(?P=quote)\s*\)', re.IGNORECASE)
+CSS_IMPORT_PATTERN = re.compile(r'@import\s+(?P<quote>["\'])(?P<url>[^"\']+)(?P=quote)', re.IGNORECASE)
+BASE_HREF_PATTERN = re.compile(r'<base[^>]+href\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+# Архивированные страницы изолируются от origin API (cookies, localStorage)
+REPLAY_CSP = 'sandbox allow-scripts allow-forms allow-popups'
+
+# Размер фрагмента при потоковой перезаписи
+REWRITE_CHUNK_SIZE = 64 * 1024
+
+# Переписанные страницы больше этого размера не кешируются
+MAX_CACHED_REPLAY_SIZE = 2 * 1024 * 1024
+
+# Срок хранения переписанной страницы (контент завершенного снапшота не меняется)
+REPLAY_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def restore_replay_url(url: str, query_string: str = '') -> str:
+    """
+    Восстановление исходного URL из пути replay
+
+    Прокси и серверы могут склеивать '//' в пути, а query string исходного
+    URL приходит как query string запроса.
+    """
+    url = re.sub(r'^(https?):/+', r'\1://', url, flags=re.IGNORECASE)
+    if '://' not in url:
+        url = f"http://{url}"
+    if query_string:
+        url = f"{url}?{query_string}"
+    return url
+
+
+def replay_url(snapshot_id, url: str) -> str:
+    """URL воспроизведения ресурса в снапшоте"""
+    prefix = reverse('replay', kwargs={'snapshot_id': snapshot_id, 'url': 'x'})[:-1]
+    return f"{prefix}{url}"
+
+
+class UrlRewriter:
+    """
+    Переписывание ссылок HTML и CSS на адреса воспроизведения
+    """
+
+    def __init__(self, snapshot_id, base_url: str):
+        """
+        Args:
+            snapshot_id: ID снапшота, в который ведут ссылки
+            base_url: URL документа, относительно которого разрешаются ссылки
+        """
+        self.snapshot_id = snapshot_id
+        self.base_url = base_url
+        self.prefix = replay_url(snapshot_id, '')
+
+    def rewrite_url(self, url: str) -> str:
+        """Перезапись одной ссылки"""
+        url = url.strip()
+        if not url or url.lower().startswith(SKIP_SCHEMES) or url.startswith(self.prefix):
+            return url
+
+        absolute = urljoin(self.base_url, url)
+        if urlsplit(absolute).scheme not in ('http', 'https'):
+            return url
+        return f"{self.prefix}{absolute}"
+
+    def _rewrite_attr(self, match) -> str:
+        quote = match.group('quote') or '"'
+        return f"{match.group('prefix')}{quote}{self.rewrite_url(match.group('url'))}{quote}"
+
+    def _rewrite_srcset(self, match) -> str:
+        candidates = []
+        for candidate in match.group('value').split(','):
+            parts = candidate.strip().split(None, 1)
+            if parts:
+                parts[0] = self.rewrite_url(parts[0])
+                candidates.append(' '.join(parts))
+        quote = match.group('quote')
+        return f"{match.group('prefix')}{quote}{', '.join(candidates)}{quote}"
+
+    def _rewrite_css_url(self, match) -> str:
+        quote = match.group('quote')
+        return f"url({quote}{self.rewrite_url(match.group('url'))}{quote})"
+
+    def _rewrite_css_import(self, match) -> str:
+        quote = match.group('quote')
+        return f"@import {quote}{self.rewrite_url(match.group('url'))}{quote}"
+
+    def rewrite_css(self, css: str) -> str:
+        """Перезапись url() и @import в CSS"""
+        css = CSS_IMPORT_PATTERN.sub(self._rewrite_css_import, css)
+        return CSS_URL_PATTERN.sub(self._rewrite_css_url, css)
+
+    def rewrite_html(self, html: str) -> str:
+        """Перезапись фрагмента HTML (атрибуты, srcset, встроенный CSS)"""
+        html = SRCSET_PATTERN.sub(self._rewrite_srcset, html)
+        html = ATTR_PATTERN.sub(self._rewrite_attr, html)
+        return self.rewrite_css(html)
+
+    def iter_rewrite_html(self, chunks: Iterable[str], chunk_size: int = REWRITE_CHUNK_SIZE) -> Iterator[str]:
+        """
+        Потоковая перезапись HTML
+
+        Входящие фрагменты накапливаются до chunk_size и режутся по
+        границе тега ('>'), поэтому атрибуты не разрываются между фрагментами.
+        """
+        buffer = ''
+        first = True
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) < chunk_size:
+                continue
+            cut = buffer.rfind('>') + 1
+            if not cut:
+                continue
+            if first:
+                self._apply_base_href(buffer[:cut])
+                first = False
+            yield self.rewrite_html(buffer[:cut])
+            buffer = buffer[cut:]
+
+        if buffer:
+            if first:
+                self._apply_base_href(buffer)
+            yield self.rewrite_html(buffer)
+
+    def _apply_base_href(self, html: str) -> None:
+        """Учет <base href> при разрешении относительных ссылок"""
+        base_match = BASE_HREF_PATTERN.search(html)
+        if base_match:
+            self.base_url = urljoin(self.base_url, base_match.group(1))
+
+
+def replay_cache_key(page: ArchivedPage, snapshot_id) -> str:
+    """Ключ кеша переписанной страницы: (страница, снапшот, версия контента)"""
+    return f"archive:replay:{page.pk}:{snapshot_id}:{page.content_hash}"
+
+
+def iter_replay_html(page: ArchivedPage, snapshot_id, cacheable: bool) -> Iterator[str]:
+    """
+    Потоковая отдача переписанной страницы с заполнением кеша
+
+    Расшифрованный HTML кешируется только в памяти процесса (см.
+    query_cache.private_cache), а не в общем Redis.
+
+    Args:
+        page: Архивированная страница
+        snapshot_id: Снапшот, в который ведут ссылки
+        cacheable: Можно ли кешировать результат (снапшот завершен)
+    """
+    rewriter = UrlRewriter(snapshot_id, page.url)
+    store = private_cache() if cacheable else None
+    collected = [] if store is not None else None
+    size = 0
+
+    for chunk in rewriter.iter_rewrite_html(iter_text(page.iter_content())):
+        if collected is not None:
+            size += len(chunk)
+            if size <= MAX_CACHED_REPLAY_SIZE:
+                collected.append(chunk)
+            else:
+                collected = None
+        yield chunk
+
+    if collected is not None:
+        store.set(replay_cache_key(page, snapshot_id), ''.join(collected), REPLAY_CACHE_TIMEOUT)
+
+
+def find_page(snapshot: ArchiveSnapshot, url: str) -> Optional[ArchivedPage]:
+    """
+    Страница с данным URL в снапшоте (контент загружается при обращении)
+
+    Если точного совпадения нет, страница ищется по каноническому ключу
+    CDX (без учета схемы, www, регистра, завершающего слеша и порядка
+    параметров) - так же, как ищется ближайший снапшот.
+    """
+    pages = snapshot.pages.defer('_encrypted_content', 'search_vector')
+    page = pages.by_url(url).first()
+    if page is None:
+        url_key, _ = canonicalize_url(url)
+        page = pages.filter(capture__url_key=url_key).first()
+    return page
+
+
+def find_asset(snapshot: ArchiveSnapshot, url: str) -> Optional[ArchivedAsset]:
+    """Скачанный ресурс с данным URL в снапшоте"""
+    return snapshot.assets.by_url(url).exclude(file_path='').first()
+
+
+def find_nearest_capture(snapshot: ArchiveSnapshot, url: str) -> Optional[Tuple[str, str]]:
+    """
+    Ближайший по времени снапшот, в котором есть URL
+
+    Страницы ищутся по CDX-индексу, ресурсы - по индексу url_hash.
+    Из захватов до и после даты снапшота выбирается ближайший.
+
+    Returns:
+        (ID снапшота, URL в том виде, в котором он захвачен) или None
+    """
+    moment = snapshot.snapshot_date
+    candidates = []
+
+    url_key, _ = canonicalize_url(url)
+    captures = UrlCapture.objects.filter(url_key=url_key).exclude(snapshot_id=snapshot.pk)
+    before = captures.filter(timestamp__lte=moment).order_by('-timestamp').values('snapshot_id', 'timestamp', 'url').first()
+    after = captures.filter(timestamp__gt=moment).order_by('timestamp').values('snapshot_id', 'timestamp', 'url').first()
+    candidates.extend(item for item in (before, after) if item)
+
+    if not candidates:
+        assets = (ArchivedAsset.objects.by_url(url)
+                  .exclude(file_path='').exclude(snapshot_id=snapshot.pk))
+        before = (assets.filter(snapshot__snapshot_date__lte=moment)
+                  .order_by('-snapshot__snapshot_date')
+                  .values('snapshot_id', 'url', timestamp=F('snapshot__snapshot_date')).first())
+        after = (assets.filter(snapshot__snapshot_date__gt=moment)
+                 .order_by('snapshot__snapshot_date')
+                 .values('snapshot_id', 'url', timestamp=F('snapshot__snapshot_date')).first())
+        candidates.extend(item for item in (before, after) if item)
+
+    if not candidates:
+        return None
+
+    nearest = min(candidates, key=lambda item: abs(item['timestamp'] - moment))
+    return nearest['snapshot_id'], nearest['url']
+
@@ -0,0 +1,189 @@
+"""
+Полнотекстовый поиск по архивированным страницам
+
+Индекс строится при архивации: из HTML извлекается видимый текст и
+сохраняется в ArchivedPage.search_vector (tsvector + GIN индекс).
+
+Контент страниц зашифрован, но индекс - нет: tsvector хранит в открытом
+виде нормализованные (стеммированные) слова заголовка, URL и текста с их
+позициями, по которым текст страницы восстанавливается почти дословно.
+Насколько текст попадает в индекс, задает ARCHIVE_SEARCH_BODY_INDEX:
+
+    'positions' - лексемы текста с позициями: поиск фраз и ранжирование
+                  по близости слов (по умолчанию);
+    'lexemes'   - только набор лексем текста без позиций (strip): поиск
+                  по словам работает, фразы и порядок слов не хранятся;
+    'none'      - текст не индексируется, поиск только по заголовку и URL.
+
+После смены режима существующие страницы переиндексируются командой
+rebuild_search_index --all.
+"""
+import re
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, SearchVector,
+    SearchVectorCombinable, SearchVectorField
+)
+from django.db.models import Func, Value
+from django.utils.html import escape
+
+from .models import ArchivedPage
+
+# Ограничение tsvector в PostgreSQL - 1 МБ, берем текст с запасом
+MAX_INDEXED_TEXT_LENGTH = 500_000
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+BODY_INDEX_POSITIONS = 'positions'
+BODY_INDEX_LEXEMES = 'lexemes'
+BODY_INDEX_NONE = 'none'
+
+
+class StrippedSearchVector(SearchVectorCombinable, Func):
+    """tsvector без позиций и весов (strip)"""
+    function = 'strip'
+    output_field = SearchVectorField()
+
+
+def get_search_config() -> str:
+    """Конфигурация текстового поиска PostgreSQL"""
+    return getattr(settings, 'ARCHIVE_SEARCH_CONFIG', 'russian')
+
+
+def get_body_index_mode() -> str:
+    """Режим индексации текста страницы (см. ARCHIVE_SEARCH_BODY_INDEX)"""
+    return getattr(settings, 'ARCHIVE_SEARCH_BODY_INDEX', BODY_INDEX_POSITIONS)
+
+
+def extract_page_text(html_content: str) -> str:
+    """
+    Извлечение видимого текста из HTML
+
+    Args:
+        html_content: HTML контент страницы
+
+    Returns:
+        str: Текст без разметки, скриптов и стилей
+    """
+    if not html_content:
+        return ""
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for tag in soup(['script', 'style', 'noscript', 'template', 'svg']):
+        tag.decompose()
+
+    text = WHITESPACE_PATTERN.sub(' ', soup.get_text(' ')).strip()
+    return text[:MAX_INDEXED_TEXT_LENGTH]
+
+
+def build_search_vector(title: str, url: str, text: str):
+    """
+    Построение взвешенного tsvector: заголовок (A), URL (B), текст (C)
+
+    Текст добавляется в зависимости от ARCHIVE_SEARCH_BODY_INDEX; без
+    позиций его лексемы не имеют и веса.
+    """
+    config = get_search_config()
+    vector = (
+        SearchVector(Value(title or ''), weight='A', config=config)
+        + SearchVector(Value(url or ''), weight='B', config=config)
+    )
+    mode = get_body_index_mode()
+    if mode == BODY_INDEX_POSITIONS:
+        vector = vector + SearchVector(Value(text or ''), weight='C', config=config)
+    elif mode == BODY_INDEX_LEXEMES:
+        vector = vector + StrippedSearchVector(SearchVector(Value(text or ''), config=config))
+    return vector
+
+
+def index_page(page: ArchivedPage, html_content: str) -> None:
+    """
+    Обновление поискового индекса страницы
+
+    Args:
+        page: Сохраненная архивированная страница
+        html_content: Расшифрованный HTML контент страницы
+    """
+    text = extract_page_text(html_content) if get_body_index_mode() != BODY_INDEX_NONE else ''
+    vector = build_search_vector(page.title, page.url, text)
+    ArchivedPage.objects.filter(pk=page.pk).update(search_vector=vector)
+
+
+def build_search_query(query: str) -> SearchQuery:
+    """Поисковый запрос в синтаксисе websearch ("фраза", -исключение, or)"""
+    return SearchQuery(query, search_type='websearch', config=get_search_config())
+
+
+def search_pages(query: str, domain: str = '', date_from=None, date_to=None):
+    """
+    Поиск страниц по заголовку, URL и тексту
+
+    Args:
+        query: Поисковый запрос (синтаксис websearch: "фраза", -исключение, or)
+        domain: Фильтр по домену сайта
+        date_from: Начало периода архивирования
+        date_to: Конец периода архивирования
+
+    Returns:
+        QuerySet страниц с аннотациями rank и headline
+    """
+    config = get_search_config()
+    search_query = build_search_query(query)
+
+    queryset = ArchivedPage.objects.filter(search_vector=search_query)
+
+    if domain:
+        queryset = queryset.filter(snapshot__website__domain=domain)
+    if date_from:
+        queryset = queryset.filter(archived_at__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(archived_at__lt=date_to)
+
+    return queryset.defer('_encrypted_content', 'search_vector').annotate(
+        rank=SearchRank('search_vector', search_query),
+        headline=SearchHeadline(
+            'title',
+            search_query,
+            config=config,
+            start_sel='<mark>',
+            stop_sel='</mark>',
+            highlight_all=True,
+        ),
+    )
+
+
+def build_snippet(text: str, query: str, radius: int = 80) -> str:
+    """
+    Фрагмент текста вокруг первого вхождения слова запроса с подсветкой
+
+    Args:
+        text: Текст страницы
+        query: Поисковый запрос
+        radius: Количество символов контекста с каждой стороны
+
+    Returns:
+        str: Фрагмент с тегами <mark>
+    """
+    terms = [term for term in re.findall(r'\w+', query.lower()) if term != 'or']
+    if not text or not terms:
+        return ""
+
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms]
+    positions = [pos for pos in positions if pos >= 0]
+    if not positions:
+        return escape(text[:radius * 2])
+
+    start = max(0, min(positions) - radius)
+    end = min(len(text), min(positions) + radius)
+    fragment = escape(text[start:end])
+
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    fragment = pattern.sub(lambda match: f'<mark>{match.group(0)}</mark>', fragment)
+
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    return f'{prefix}{fragment}{suffix}'
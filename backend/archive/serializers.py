@@ -2,7 +2,33 @@
 Сериализаторы для API веб-архива
 """
 from rest_framework import serializers
-from .models import Website, ArchiveSnapshot, ArchivedPage, ArchivedAsset
+from .models import Website, ArchiveSnapshot, ArchivedPage, ArchivedAsset, UrlCapture
+
+
+class SparseFieldsetsMixin:
+    """
+    Поддержка выборочных полей через параметр запроса ?fields=id,status,...
+
+    Неизвестные имена полей игнорируются; без параметра возвращаются все поля.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        request = self.context.get('request')
+        if request is None:
+            return
+        
+        fields_param = request.query_params.get('fields')
+        if not fields_param:
+            return
+        
+        requested = {name.strip() for name in fields_param.split(',') if name.strip()}
+        if not requested & set(self.fields):
+            return
+        
+        for name in set(self.fields) - requested:
+            self.fields.pop(name)
 
 
 class WebsiteSerializer(serializers.ModelSerializer):
@@ -17,9 +43,10 @@ class WebsiteSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'url', 'domain', 'title', 'description',
             'created_at', 'is_active', 'crawl_depth',
+            'change_rate', 'recrawl_interval', 'next_crawl_at',
             'snapshots_count', 'latest_snapshot'
         ]
-        read_only_fields = ['id', 'created_at', 'domain']
+        read_only_fields = ['id', 'created_at', 'domain', 'change_rate', 'recrawl_interval', 'next_crawl_at']
     
     def get_snapshots_count(self, obj):
         """Количество снапшотов"""
@@ -51,7 +78,7 @@ class WebsiteSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ArchivedPageSerializer(serializers.ModelSerializer):
+class ArchivedPageSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Сериализатор для архивированных страниц
     """
@@ -61,16 +88,35 @@ class ArchivedPageSerializer(serializers.ModelSerializer):
         model = ArchivedPage
         fields = [
             'id', 'url', 'title', 'archived_at',
-            'content_size', 'content_size_kb', 'screenshot_path'
+            'content_size', 'content_size_kb', 'screenshot_path', 'thumbnail_path', 'fetch_tier'
         ]
-        read_only_fields = ['id', 'archived_at']
+        read_only_fields = ['id', 'archived_at', 'fetch_tier']
     
     def get_content_size_kb(self, obj):
         """Размер в КБ"""
         return round(obj.content_size / 1024, 2)
 
 
-class ArchivedAssetSerializer(serializers.ModelSerializer):
+class ArchivedPageSearchSerializer(ArchivedPageSerializer):
+    """
+    Сериализатор результата полнотекстового поиска
+    """
+    snapshot_id = serializers.UUIDField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True)
+    snippet = serializers.SerializerMethodField()
+    
+    class Meta(ArchivedPageSerializer.Meta):
+        fields = ArchivedPageSerializer.Meta.fields + [
+            'snapshot_id', 'rank', 'headline', 'snippet'
+        ]
+    
+    def get_snippet(self, obj):
+        """Фрагмент текста страницы с подсветкой (только при ?snippets=true)"""
+        return self.context.get('snippets', {}).get(obj.pk)
+
+
+class ArchivedAssetSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Сериализатор для архивированных ресурсов
     """
@@ -89,21 +135,23 @@ class ArchivedAssetSerializer(serializers.ModelSerializer):
         return round(obj.file_size / 1024, 2)
 
 
-class ArchiveSnapshotSerializer(serializers.ModelSerializer):
+class ArchiveSnapshotSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Сериализатор для снапшотов архивов
+
+    Возвращает только сводку снапшота; страницы и ресурсы отдаются
+    отдельными пагинированными эндпоинтами snapshots/{id}/pages/ и
+    snapshots/{id}/assets/.
     """
     website_info = serializers.SerializerMethodField()
     total_size_mb = serializers.SerializerMethodField()
-    pages = ArchivedPageSerializer(many=True, read_only=True)
-    assets = ArchivedAssetSerializer(many=True, read_only=True)
     
     class Meta:
         model = ArchiveSnapshot
         fields = [
             'id', 'snapshot_date', 'status', 'pages_count',
             'assets_count', 'total_size', 'total_size_mb',
-            'website_info', 'pages', 'assets'
+            'website_info'
         ]
         read_only_fields = ['id', 'snapshot_date']
     
@@ -121,7 +169,7 @@ class ArchiveSnapshotSerializer(serializers.ModelSerializer):
         return round(obj.total_size / 1024 / 1024, 2)
 
 
-class ArchiveSnapshotListSerializer(serializers.ModelSerializer):
+class ArchiveSnapshotListSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Упрощенный сериализатор для списка снапшотов
     """
@@ -141,6 +189,51 @@ class ArchiveSnapshotListSerializer(serializers.ModelSerializer):
         return round(obj.total_size / 1024 / 1024, 2)
 
 
+class UrlCaptureSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """
+    Сериализатор записи индекса захватов (строка таймкарты)
+    """
+    page_id = serializers.UUIDField(read_only=True)
+    snapshot_id = serializers.UUIDField(read_only=True)
+    
+    class Meta:
+        model = UrlCapture
+        fields = [
+            'url_key', 'url', 'timestamp', 'snapshot_id',
+            'page_id', 'status_code', 'content_hash'
+        ]
+        read_only_fields = fields
+
+
+class BatchContentSerializer(serializers.Serializer):
+    """
+    Запрос пакетной выгрузки контента страниц
+    """
+    MAX_ITEMS = 1000
+    
+    ids = serializers.ListField(
+        child=serializers.UUIDField(), required=False, max_length=MAX_ITEMS
+    )
+    snapshot_id = serializers.UUIDField(required=False)
+    urls = serializers.ListField(
+        child=serializers.CharField(max_length=2048), required=False, max_length=MAX_ITEMS
+    )
+    
+    def validate(self, attrs):
+        """Нужны либо ids, либо snapshot_id (с необязательным списком urls)"""
+        if attrs.get('ids') and attrs.get('snapshot_id'):
+            raise serializers.ValidationError("Укажите либо ids, либо snapshot_id")
+        if not attrs.get('ids') and not attrs.get('snapshot_id'):
+            raise serializers.ValidationError("Укажите ids или snapshot_id")
+        if attrs.get('urls') and not attrs.get('snapshot_id'):
+            raise serializers.ValidationError("Параметр urls используется только вместе с snapshot_id")
+        return attrs
+
+
+# Приоритеты запуска сканирования (см. crawler.queues.CRAWL_PRIORITIES)
+CRAWL_PRIORITY_CHOICES = ['high', 'normal', 'low']
+
+
 class CreateSnapshotSerializer(serializers.Serializer):
     """
     Сериализатор для создания нового снапшота
@@ -148,6 +241,9 @@ class CreateSnapshotSerializer(serializers.Serializer):
     website_id = serializers.UUIDField()
     crawl_depth = serializers.IntegerField(min_value=1, max_value=10, default=3)
     follow_external_links = serializers.BooleanField(default=False)
+    distributed = serializers.BooleanField(default=False)
+    workers = serializers.IntegerField(min_value=1, max_value=64, required=False)
+    priority = serializers.ChoiceField(choices=CRAWL_PRIORITY_CHOICES, default='high')
     
     def validate_website_id(self, value):
         """Проверка существования сайта"""
@@ -155,4 +251,41 @@ class CreateSnapshotSerializer(serializers.Serializer):
             website = Website.objects.get(id=value, created_by=self.context['request'].user)
             return value
         except Website.DoesNotExist:
-            raise serializers.ValidationError("Сайт не найден или у вас нет к нему доступа") 
\ No newline at end of file
+            raise serializers.ValidationError("Сайт не найден или у вас нет к нему доступа") 
+
+
+class BulkCrawlItemSerializer(serializers.Serializer):
+    """
+    Сайт в пакетном запуске сканирования (поля переопределяют общие)
+    """
+    website_id = serializers.UUIDField()
+    priority = serializers.ChoiceField(choices=CRAWL_PRIORITY_CHOICES, required=False)
+    crawl_depth = serializers.IntegerField(min_value=1, max_value=10, required=False)
+
+
+class BulkCrawlSerializer(serializers.Serializer):
+    """
+    Пакетный запуск сканирования многих сайтов
+    """
+    MAX_ITEMS = 10000
+    
+    websites = serializers.ListField(
+        child=BulkCrawlItemSerializer(), required=False, max_length=MAX_ITEMS
+    )
+    website_ids = serializers.ListField(
+        child=serializers.UUIDField(), required=False, max_length=MAX_ITEMS
+    )
+    priority = serializers.ChoiceField(choices=CRAWL_PRIORITY_CHOICES, default='normal')
+    crawl_depth = serializers.IntegerField(min_value=1, max_value=10, required=False)
+    follow_external_links = serializers.BooleanField(default=False)
+    
+    def validate(self, attrs):
+        """Нужен хотя бы один сайт, всего не больше MAX_ITEMS"""
+        items = [{'website_id': website_id} for website_id in attrs.get('website_ids', [])]
+        items += attrs.get('websites', [])
+        if not items:
+            raise serializers.ValidationError("Укажите websites или website_ids")
+        if len(items) > self.MAX_ITEMS:
+            raise serializers.ValidationError(f"Не больше {self.MAX_ITEMS} сайтов за запрос")
+        attrs['items'] = items
+        return attrs
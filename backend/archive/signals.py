@@ -0,0 +1,31 @@
+"""
+Обработчики сигналов моделей архива
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .metadata import invalidate_metadata
+from .models import ArchiveSnapshot, Website
+from .query_cache import SNAPSHOTS_TAG, WEBSITES_TAG, invalidate_tags, website_tag
+
+
+@receiver([post_save, post_delete], sender=ArchiveSnapshot)
+def invalidate_snapshot_metadata(sender, instance, **kwargs):
+    """Сброс кеша расшифрованных метаданных при изменении снапшота"""
+    invalidate_metadata(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ArchiveSnapshot)
+def invalidate_snapshot_queries(sender, instance, **kwargs):
+    """Сброс закешированных списков снапшотов и последнего снапшота сайта"""
+    invalidate_tags(SNAPSHOTS_TAG, website_tag(instance.website_id))
+
+
+@receiver([post_save, post_delete], sender=Website)
+def invalidate_website_queries(sender, instance, **kwargs):
+    """
+    Сброс закешированных списков сайтов
+
+    Данные сайта (домен, название) входят и в ответы со снапшотами.
+    """
+    invalidate_tags(WEBSITES_TAG, website_tag(instance.pk))
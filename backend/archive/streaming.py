@@ -0,0 +1,50 @@
+"""
+Потоковая отдача расшифрованного контента
+"""
+import codecs
+import json
+from typing import Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def iter_text(byte_chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Декодирование потока UTF-8 фрагментов в строки
+
+    Многобайтовые символы на границе фрагментов собираются корректно.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_json_with_content(payload: dict, content_chunks, field: str = 'content') -> Iterator[str]:
+    """
+    Потоковый JSON-объект, в котором одно строковое поле отдается фрагментами
+
+    Args:
+        payload: Остальные поля ответа
+        content_chunks: Итератор байтовых фрагментов контента или None
+        field: Имя поля с контентом
+
+    Yields:
+        str: Фрагменты JSON документа
+    """
+    head = json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False)
+    separator = ', ' if payload else ''
+
+    if content_chunks is None:
+        yield f'{head[:-1]}{separator}"{field}": null}}'
+        return
+
+    yield f'{head[:-1]}{separator}"{field}": "'
+    for text in iter_text(content_chunks):
+        # json.dumps экранирует фрагмент; внешние кавычки отбрасываем
+        yield json.dumps(text, ensure_ascii=False)[1:-1]
+    yield '"}'
@@ -0,0 +1,178 @@
+"""
+Тесты кешей архива (query_cache.py, replay.py, metadata.py) и индекса захватов (cdx.py)
+"""
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .cdx import lookup_captures, record_capture
+from .metadata import get_cached_metadata, metadata_cache_key
+from .models import ArchivedPage, ArchiveSnapshot, Website
+from .replay import iter_replay_html, replay_cache_key
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'archive-tests'},
+    'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'archive-tests-local'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class WebsiteListCacheTests(TestCase):
+    """
+    Список сайтов сбрасывается при изменении снапшотов
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = User.objects.create(username='owner')
+        self.website = Website.objects.create(url='https://example.com/', domain='example.com', created_by=user)
+
+    def get_website(self):
+        response = self.client.get('/api/v1/archive/websites/')
+        self.assertEqual(response.status_code, 200)
+        return next(item for item in response.json()['results'] if item['id'] == str(self.website.pk))
+
+    def test_new_snapshot_refreshes_list(self):
+        self.assertEqual(self.get_website()['snapshots_count'], 0)
+
+        snapshot = ArchiveSnapshot.objects.create(website=self.website, status='processing')
+
+        website = self.get_website()
+        self.assertEqual(website['snapshots_count'], 1)
+        self.assertEqual(website['latest_snapshot']['status'], 'processing')
+
+        snapshot.status = 'completed'
+        snapshot.pages_count = 3
+        snapshot.save()
+
+        website = self.get_website()
+        self.assertEqual(website['latest_snapshot']['status'], 'completed')
+        self.assertEqual(website['latest_snapshot']['pages_count'], 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReplayCacheTests(TestCase):
+    """
+    Расшифрованная страница кешируется только в памяти процесса
+    """
+
+    def setUp(self):
+        cache.clear()
+        caches['local'].clear()
+        user = User.objects.create(username='owner')
+        website = Website.objects.create(url='https://example.com/', domain='example.com', created_by=user)
+        self.snapshot = ArchiveSnapshot.objects.create(website=website, status='completed')
+        self.page = ArchivedPage(snapshot=self.snapshot, url='https://example.com/', content_hash='v1')
+        self.page.content = '<a href="/about">secret</a>'
+        self.page.save()
+
+    def test_rewritten_html_stays_out_of_shared_cache(self):
+        html = ''.join(iter_replay_html(self.page, self.snapshot.pk, cacheable=True))
+
+        key = replay_cache_key(self.page, self.snapshot.pk)
+        self.assertIn('secret', html)
+        self.assertEqual(caches['local'].get(key), html)
+        self.assertIsNone(cache.get(key))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_no_process_cache_disables_caching(self):
+        html = ''.join(iter_replay_html(self.page, self.snapshot.pk, cacheable=True))
+
+        self.assertIn('secret', html)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MetadataCacheTests(TestCase):
+    """
+    Расшифрованные метаданные кешируются в памяти процесса и сбрасываются версией тега
+    """
+
+    def setUp(self):
+        cache.clear()
+        caches['local'].clear()
+        user = User.objects.create(username='owner')
+        website = Website.objects.create(url='https://example.com/', domain='example.com', created_by=user)
+        self.snapshot = ArchiveSnapshot(website=website, status='completed')
+        self.snapshot.metadata = {'title': 'secret'}
+        self.snapshot.save()
+
+    def test_metadata_stays_out_of_shared_cache(self):
+        self.assertEqual(self.snapshot.metadata, {'title': 'secret'})
+
+        key = metadata_cache_key(self.snapshot.pk)
+        self.assertEqual(caches['local'].get(key), {'title': 'secret'})
+        self.assertIsNone(cache.get(key))
+
+    def test_save_bumps_version_instead_of_deleting(self):
+        self.assertEqual(self.snapshot.metadata, {'title': 'secret'})
+        old_key = metadata_cache_key(self.snapshot.pk)
+
+        self.snapshot.metadata = {'title': 'updated'}
+        self.snapshot.save()
+
+        # Копия в кеше другого процесса осталась бы, но ключ уже другой
+        self.assertNotEqual(metadata_cache_key(self.snapshot.pk), old_key)
+        self.assertIsNone(get_cached_metadata(self.snapshot.pk))
+        self.assertEqual(ArchiveSnapshot.objects.get(pk=self.snapshot.pk).metadata, {'title': 'updated'})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CaptureLookupTests(TestCase):
+    """
+    Поиск захватов нормализует URL так же, как запись в индекс
+    """
+
+    def setUp(self):
+        user = User.objects.create(username='owner')
+        website = Website.objects.create(url='https://example.com/', domain='example.com', created_by=user)
+        self.snapshot = ArchiveSnapshot.objects.create(website=website, status='completed')
+
+    def capture(self, url):
+        page = ArchivedPage.objects.create(snapshot=self.snapshot, url=url, content_hash=url)
+        return record_capture(page).url
+
+    def lookup(self, url, match_type):
+        return set(lookup_captures(url, match_type).values_list('url', flat=True))
+
+    def test_prefix_matches_default_ports(self):
+        https = self.capture('https://example.com:443/blog/post')
+        http = self.capture('http://www.example.com:80/blog/other')
+
+        self.assertEqual(self.lookup('example.com/blog', 'prefix'), {https, http})
+        self.assertEqual(self.lookup('example.com:443/blog', 'prefix'), {https, http})
+        self.assertEqual(self.lookup('https://example.com:443/blog', 'prefix'), {https, http})
+
+    def test_prefix_keeps_non_default_port(self):
+        self.capture('https://example.com/blog/post')
+        custom = self.capture('http://example.com:8080/blog/post')
+
+        self.assertEqual(self.lookup('example.com:8080/blog', 'prefix'), {custom})
+
+    def test_prefix_normalizes_query(self):
+        search = self.capture('https://example.com/search?b=2&a=1')
+        self.capture('https://example.com/search?a=2')
+
+        self.assertEqual(self.lookup('example.com/search?b=2&a=1', 'prefix'), {search})
+        self.assertEqual(self.lookup('example.com/search?a=1', 'prefix'), {search})
+
+    def test_prefix_with_trailing_slash_matches_the_page_itself(self):
+        index = self.capture('https://example.com/blog/')
+        post = self.capture('https://example.com/blog/post')
+        self.capture('https://example.com/blogroll')
+
+        self.assertEqual(self.lookup('example.com/blog/', 'prefix'), {index, post})
+
+    def test_host_match_respects_ports(self):
+        default = self.capture('https://example.com:443/')
+        custom = self.capture('http://example.com:8080/')
+
+        self.assertEqual(self.lookup('example.com', 'host'), {default})
+        self.assertEqual(self.lookup('example.com:443', 'host'), {default})
+        self.assertEqual(self.lookup('example.com:8080', 'host'), {custom})
+
+    def test_exact_match_ignores_default_port_and_query_order(self):
+        page = self.capture('https://example.com/page?b=2&a=1')
+
+        self.assertEqual(self.lookup('example.com:443/page?a=1&b=2', 'exact'), {page})
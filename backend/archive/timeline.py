@@ -0,0 +1,49 @@
+"""
+Агрегированная временная шкала снапшотов для календарного просмотра
+"""
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncDay, TruncMonth, TruncYear
+
+GRANULARITIES = {
+    'year': (TruncYear, '%Y'),
+    'month': (TruncMonth, '%Y-%m'),
+    'day': (TruncDay, '%Y-%m-%d'),
+}
+
+
+def build_timeline(queryset, granularity: str = 'month') -> dict:
+    """
+    Количество снапшотов по годам/месяцам/дням
+
+    Группировка выполняется в БД (GROUP BY date_trunc(snapshot_date)),
+    клиенту возвращаются только счетчики.
+
+    Args:
+        queryset: QuerySet снапшотов (уже отфильтрованный по сайту/периоду)
+        granularity: year, month или day
+
+    Returns:
+        dict: Итоги и список периодов со счетчиками
+    """
+    trunc, date_format = GRANULARITIES[granularity]
+
+    queryset = queryset.order_by()
+    buckets = (
+        queryset
+        .annotate(period=trunc('snapshot_date'))
+        .values('period')
+        .annotate(count=Count('id'))
+        .order_by('period')
+    )
+    summary = queryset.aggregate(total=Count('id'), first=Min('snapshot_date'), last=Max('snapshot_date'))
+
+    return {
+        'granularity': granularity,
+        'total': summary['total'],
+        'first': summary['first'],
+        'last': summary['last'],
+        'buckets': [
+            {'period': bucket['period'].strftime(date_format), 'count': bucket['count']}
+            for bucket in buckets
+        ],
+    }
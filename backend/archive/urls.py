@@ -3,13 +3,20 @@ URL маршруты для API архива
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, async_views
 
 router = DefaultRouter()
 router.register(r'websites', views.WebsiteViewSet, basename='website')
 router.register(r'snapshots', views.ArchiveSnapshotViewSet, basename='snapshot')
 router.register(r'pages', views.ArchivedPageViewSet, basename='page')
+router.register(r'timemap', views.TimemapViewSet, basename='timemap')
 
 urlpatterns = [
+    # Асинхронные эндпоинты контента (расшифровка вне event loop)
+    path('snapshots/<uuid:pk>/page_content/', async_views.page_content, name='snapshot-page-content'),
+    path('pages/batch/', async_views.page_batch, name='page-batch'),
+    path('pages/<uuid:pk>/content/', async_views.page_content_json, name='page-content'),
+    path('pages/<uuid:pk>/raw/', async_views.page_raw, name='page-raw'),
+    path('replay/<uuid:snapshot_id>/<path:url>', async_views.replay, name='replay'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
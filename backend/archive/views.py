@@ -1,27 +1,122 @@
 """
 API views для веб-архива
 """
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.shortcuts import get_object_or_404, render
 from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
-from .models import Website, ArchiveSnapshot, ArchivedPage
+from django.utils.dateparse import parse_date
+from django.db.models import Exists, OuterRef, Q
+from .models import Website, ArchiveSnapshot, ArchivedPage, UrlCapture
 from .serializers import (
     WebsiteSerializer, ArchiveSnapshotSerializer,
-    ArchiveSnapshotListSerializer, ArchivedPageSerializer
+    ArchiveSnapshotListSerializer, ArchivedPageSerializer,
+    ArchivedAssetSerializer, ArchivedPageSearchSerializer,
+    UrlCaptureSerializer
 )
-from encryption.file_encryption import ArchiveFileEncryption
+from .pagination import (
+    CursorPaginatedActionMixin, SnapshotCursorPagination,
+    PageCursorPagination, SnapshotPageCursorPagination,
+    SnapshotAssetCursorPagination, SearchCursorPagination,
+    CaptureCursorPagination
+)
+from .search import build_search_query, search_pages, extract_page_text, build_snippet
+from .cdx import lookup_captures
+from .timeline import GRANULARITIES, build_timeline
+from .http_cache import (
+    snapshot_etag,
+    not_modified_response, apply_cache_headers
+)
+from .query_cache import SNAPSHOTS_TAG, WEBSITES_TAG, cached_response, website_tag
 import logging
 import json
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 logger = logging.getLogger(__name__)
 
 
-class WebsiteViewSet(viewsets.ModelViewSet):
+def filter_by_snapshot_date(queryset, year=None, month=None, day=None):
+    """
+    Фильтрация снапшотов по календарной дате
+
+    Вместо snapshot_date__year/__month/__day (EXTRACT по каждой строке)
+    строит диапазон [начало, конец), который использует индекс snapshot_date.
+    """
+    if not year:
+        return queryset
+
+    try:
+        year = int(year)
+        month = int(month) if month else None
+        day = int(day) if day and month else None
+        start = datetime(year, month or 1, day or 1, tzinfo=dt_timezone.utc)
+    except (TypeError, ValueError):
+        return queryset.none()
+
+    try:
+        if day:
+            end = start + timedelta(days=1)
+        elif month:
+            end = start.replace(year=year + 1, month=1) if month == 12 else start.replace(month=month + 1)
+        else:
+            end = start.replace(year=year + 1)
+    except (OverflowError, ValueError):
+        # Период в конце 9999 года: за его пределами дат нет
+        return queryset.filter(snapshot_date__gte=start)
+
+    return queryset.filter(snapshot_date__gte=start, snapshot_date__lt=end)
+
+
+def parse_date_param(value: str):
+    """
+    Дата из параметра запроса в формате ГГГГ-ММ-ДД
+
+    Returns:
+        date или None, если параметр не передан
+
+    Raises:
+        ValueError: Неверный формат или несуществующая дата (2024-13-45)
+    """
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def timeline_response(request, queryset):
+    """
+    Ответ с агрегированной временной шкалой снапшотов
+
+    Параметры запроса: granularity (year|month|day), year/month/day для
+    сужения периода, status (по умолчанию completed, all - все статусы).
+    """
+    granularity = request.query_params.get('granularity', 'month')
+    if granularity not in GRANULARITIES:
+        return Response(
+            {'error': f"Параметр granularity должен быть одним из: {', '.join(GRANULARITIES)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    snapshot_status = request.query_params.get('status', 'completed')
+    if snapshot_status != 'all':
+        queryset = queryset.filter(status=snapshot_status)
+    
+    queryset = filter_by_snapshot_date(
+        queryset,
+        request.query_params.get('year'),
+        request.query_params.get('month'),
+        request.query_params.get('day')
+    )
+    return Response(build_timeline(queryset, granularity))
+
+
+class WebsiteViewSet(CursorPaginatedActionMixin, viewsets.ModelViewSet):
     """
     ViewSet для управления веб-сайтами
     """
@@ -32,13 +127,24 @@ class WebsiteViewSet(viewsets.ModelViewSet):
         """Получаем все сайты для демонстрации"""
         return Website.objects.all().order_by('-created_at')
     
+    def list(self, request, *args, **kwargs):
+        """
+        Список сайтов (кешируется до изменения сайтов или снапшотов)
+        
+        В карточке сайта есть число снапшотов и последний снапшот, поэтому
+        список зависит и от тега снапшотов.
+        """
+        return cached_response(
+            'websites', request, [WEBSITES_TAG, SNAPSHOTS_TAG],
+            lambda: super(WebsiteViewSet, self).list(request, *args, **kwargs)
+        )
+    
     @action(detail=True, methods=['get'])
     def snapshots(self, request, pk=None):
         """Получить все снепшоты сайта"""
         website = self.get_object()
-        snapshots = website.snapshots.all().order_by('-created_at')
-        serializer = ArchiveSnapshotSerializer(snapshots, many=True)
-        return Response(serializer.data)
+        snapshots = website.snapshots.select_related('website')
+        return self.paginated_response(snapshots, ArchiveSnapshotSerializer, SnapshotCursorPagination)
     
     @action(detail=True, methods=['get'])
     def snapshots_by_date(self, request, pk=None):
@@ -48,18 +154,18 @@ class WebsiteViewSet(viewsets.ModelViewSet):
         month = request.query_params.get('month')
         day = request.query_params.get('day')
         
-        snapshots = website.snapshots.all()
+        snapshots = filter_by_snapshot_date(website.snapshots.select_related('website'), year, month, day)
+        return self.paginated_response(snapshots, ArchiveSnapshotSerializer, SnapshotCursorPagination)
+    
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """
+        Календарь снапшотов сайта: количество захватов по периодам
         
-        if year:
-            snapshots = snapshots.filter(created_at__year=year)
-        if month:
-            snapshots = snapshots.filter(created_at__month=month)
-        if day:
-            snapshots = snapshots.filter(created_at__day=day)
-            
-        snapshots = snapshots.order_by('-created_at')
-        serializer = ArchiveSnapshotSerializer(snapshots, many=True)
-        return Response(serializer.data)
+        GET /api/v1/archive/websites/{id}/timeline/?granularity=month&year=2024
+        """
+        website = self.get_object()
+        return timeline_response(request, ArchiveSnapshot.objects.filter(website=website))
     
     @action(detail=True, methods=['get'])
     def latest_snapshot(self, request, pk=None):
@@ -68,8 +174,23 @@ class WebsiteViewSet(viewsets.ModelViewSet):
         
         GET /api/v1/archive/websites/{id}/latest_snapshot/
         """
+        # Тег строится по каноническому UUID: сигналы сбрасывают website:<uuid>,
+        # а в URL тот же сайт может прийти в другом регистре или без дефисов
+        try:
+            website_id = uuid.UUID(pk)
+        except ValueError:
+            return Response(
+                {'error': 'Сайт не найден'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return cached_response(
+            'latest_snapshot', request, [website_tag(website_id)],
+            self._latest_snapshot_response
+        )
+    
+    def _latest_snapshot_response(self):
         website = self.get_object()
-        latest = website.snapshots.first()
+        latest = website.snapshots.select_related('website').first()
         
         if not latest:
             return Response(
@@ -77,19 +198,20 @@ class WebsiteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        serializer = ArchiveSnapshotSerializer(latest)
+        serializer = ArchiveSnapshotSerializer(latest, context=self.get_serializer_context())
         return Response(serializer.data)
 
 
-class ArchiveSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
+class ArchiveSnapshotViewSet(CursorPaginatedActionMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для просмотра снапшотов архивов
     """
     permission_classes = [AllowAny]
+    pagination_class = SnapshotCursorPagination
     
     def get_queryset(self):
         """Получаем все снапшоты для демонстрации"""
-        return ArchiveSnapshot.objects.all().order_by('-created_at')
+        return ArchiveSnapshot.objects.select_related('website').order_by('-snapshot_date', '-id')
     
     def get_serializer_class(self):
         """Выбираем сериализатор в зависимости от действия"""
@@ -97,46 +219,52 @@ class ArchiveSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
             return ArchiveSnapshotListSerializer
         return ArchiveSnapshotSerializer
     
+    def list(self, request, *args, **kwargs):
+        """Список снапшотов (кешируется до изменения снапшотов или сайтов)"""
+        return cached_response(
+            'snapshots', request, [SNAPSHOTS_TAG, WEBSITES_TAG],
+            lambda: super(ArchiveSnapshotViewSet, self).list(request, *args, **kwargs)
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Карточка снапшота с поддержкой If-None-Match
+        
+        Не immutable даже для завершенного снапшота: данные сайта в карточке
+        могут измениться, поэтому клиент перепроверяет ее по ETag.
+        """
+        snapshot = self.get_object()
+        etag = snapshot_etag(snapshot)
+        
+        not_modified = not_modified_response(request, etag, immutable=False)
+        if not_modified is not None:
+            return not_modified
+        
+        serializer = self.get_serializer(snapshot)
+        return apply_cache_headers(Response(serializer.data), etag, immutable=False)
+    
     @action(detail=True, methods=['get'])
     def pages(self, request, pk=None):
         """Получить все страницы снепшота"""
         snapshot = self.get_object()
-        pages = snapshot.pages.all().order_by('url')
-        serializer = ArchivedPageSerializer(pages, many=True)
-        return Response(serializer.data)
+        pages = snapshot.pages.defer('_encrypted_content', 'search_vector')
+        return self.paginated_response(pages, ArchivedPageSerializer, SnapshotPageCursorPagination)
     
     @action(detail=True, methods=['get'])
-    def page_content(self, request, pk=None):
+    def assets(self, request, pk=None):
         """
-        Получение контента конкретной страницы
+        Получить ресурсы снепшота
         
-        GET /api/v1/archive/snapshots/{id}/page_content/?url=<page_url>
+        GET /api/v1/archive/snapshots/{id}/assets/?asset_type=css&fields=url,file_size
         """
         snapshot = self.get_object()
-        page_url = request.query_params.get('url')
+        assets = snapshot.assets.all()
         
-        if not page_url:
-            return Response(
-                {'error': 'Параметр url обязателен'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        asset_type = request.query_params.get('asset_type')
+        if asset_type:
+            assets = assets.filter(asset_type=asset_type)
         
-        try:
-            page = snapshot.pages.get(url=page_url)
-            
-            # Получаем расшифрованный контент
-            content = page.content
-            
-            return HttpResponse(
-                content,
-                content_type='text/html; charset=utf-8'
-            )
-            
-        except ArchivedPage.DoesNotExist:
-            return Response(
-                {'error': 'Страница не найдена в архиве'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        return self.paginated_response(assets, ArchivedAssetSerializer, SnapshotAssetCursorPagination)
     
     @action(detail=False, methods=['get'])
     def by_date(self, request):
@@ -149,17 +277,27 @@ class ArchiveSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
         month = request.query_params.get('month')
         day = request.query_params.get('day')
         
-        queryset = self.get_queryset()
-        
-        if year:
-            queryset = queryset.filter(created_at__year=year)
-        if month:
-            queryset = queryset.filter(created_at__month=month)
-        if day:
-            queryset = queryset.filter(created_at__day=day)
+        queryset = filter_by_snapshot_date(self.get_queryset(), year, month, day)
+        return self.paginated_response(queryset, ArchiveSnapshotListSerializer)
+    
+    @action(detail=False, methods=['get'])
+    def timeline(self, request):
+        """
+        Календарь всех снапшотов: количество захватов по периодам
         
-        serializer = ArchiveSnapshotListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        GET /api/v1/archive/snapshots/timeline/?granularity=day&year=2024&month=1&website=<id>
+        """
+        queryset = ArchiveSnapshot.objects.all()
+        website_id = request.query_params.get('website')
+        if website_id:
+            try:
+                queryset = queryset.filter(website_id=uuid.UUID(website_id))
+            except ValueError:
+                return Response(
+                    {'error': 'Неверный идентификатор сайта'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        return timeline_response(request, queryset)
     
     @action(detail=False, methods=['get'])
     def search(self, request):
@@ -168,6 +306,12 @@ class ArchiveSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
         
         GET /api/v1/archive/snapshots/search/?q=search_term&domain=example.com
         """
+        return cached_response(
+            'snapshot_search', request, [SNAPSHOTS_TAG, WEBSITES_TAG],
+            lambda: self._search_response(request)
+        )
+    
+    def _search_response(self, request):
         query = request.query_params.get('q', '')
         domain = request.query_params.get('domain', '')
         
@@ -177,14 +321,18 @@ class ArchiveSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(website__domain__icontains=domain)
         
         if query:
+            # Снапшоты, в которых есть страницы, найденные по GIN индексу
+            matching_pages = ArchivedPage.objects.filter(
+                snapshot=OuterRef('pk'),
+                search_vector=build_search_query(query)
+            )
             queryset = queryset.filter(
-                website__title__icontains=query
-            ) | queryset.filter(
-                website__description__icontains=query
+                Q(Exists(matching_pages))
+                | Q(website__title__icontains=query)
+                | Q(website__description__icontains=query)
             )
         
-        serializer = ArchiveSnapshotListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(queryset, ArchiveSnapshotListSerializer)
 
 
 class ArchivedPageViewSet(viewsets.ReadOnlyModelViewSet):
@@ -193,42 +341,111 @@ class ArchivedPageViewSet(viewsets.ReadOnlyModelViewSet):
     """
     serializer_class = ArchivedPageSerializer
     permission_classes = [AllowAny]
+    pagination_class = PageCursorPagination
     
     def get_queryset(self):
         """Получаем все страницы архивов для демонстрации"""
-        return ArchivedPage.objects.all().order_by('-created_at')
+        # Для списков и карточек зашифрованный контент не нужен
+        return ArchivedPage.objects.defer('_encrypted_content', 'search_vector').order_by('-archived_at', '-id')
     
-    @action(detail=True, methods=['get'])
-    def content(self, request, pk=None):
-        """Получить расшифрованный контент страницы"""
-        page = self.get_object()
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Полнотекстовый поиск по заголовку, URL и тексту страниц
+        
+        GET /api/v1/archive/pages/search/?q=term&domain=example.com&date_from=2024-01-01&date_to=2024-12-31&snippets=true
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'Параметр q обязателен'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         try:
-            # Расшифровка контента
-            encryption = ArchiveFileEncryption()
-            
-            # Расшифровка HTML контента
-            html_content = None
-            if page._encrypted_content:
-                html_content = encryption.decrypt_html_content(page._encrypted_content)
-            
-            # Расшифровка метаданных
-            metadata = {}
-            if page.snapshot._encrypted_metadata:
-                metadata = encryption.decrypt_archive_metadata(page.snapshot._encrypted_metadata)
-            
-            return Response({
-                'url': page.url,
-                'title': page.title,
-                'content': html_content,
-                'metadata': metadata,
-                'status_code': page.status_code,
-                'content_type': page.content_type,
-                'created_at': page.archived_at
-            })
-            
-        except Exception as e:
+            date_from = parse_date_param(request.query_params.get('date_from', ''))
+            date_to = parse_date_param(request.query_params.get('date_to', ''))
+        except ValueError:
             return Response(
-                {'error': f'Ошибка расшифровки контента: {str(e)}'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            ) 
\ No newline at end of file
+                {'error': 'Параметры date_from и date_to должны быть датами в формате ГГГГ-ММ-ДД'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = search_pages(
+            query,
+            domain=request.query_params.get('domain', ''),
+            date_from=date_from,
+            date_to=date_to + timedelta(days=1) if date_to else None
+        )
+        
+        paginator = SearchCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        
+        context = self.get_serializer_context()
+        if request.query_params.get('snippets', '').lower() == 'true':
+            # Фрагменты текста требуют расшифровки - только для текущей страницы выдачи
+            contents = ArchivedPage.objects.filter(
+                pk__in=[item.pk for item in page]
+            ).only('id', '_encrypted_content')
+            context['snippets'] = {
+                item.pk: build_snippet(extract_page_text(item.content), query)
+                for item in contents
+            }
+        
+        serializer = ArchivedPageSearchSerializer(page, many=True, context=context)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class TimemapViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Таймкарта: все захваты URL во всех снапшотах
+    
+    GET /api/v1/archive/timemap/?url=example.com/page&match=exact|prefix|host&from=2024-01-01&to=2024-12-31
+    """
+    serializer_class = UrlCaptureSerializer
+    pagination_class = CaptureCursorPagination
+    permission_classes = [AllowAny]
+    
+    MATCH_TYPES = ('exact', 'prefix', 'host')
+    
+    def get_queryset(self):
+        """Диапазонное сканирование индекса захватов"""
+        url = self.request.query_params.get('url', '').strip()
+        match_type = self.request.query_params.get('match', 'exact')
+        if not url or match_type not in self.MATCH_TYPES:
+            return UrlCapture.objects.none()
+        
+        queryset = lookup_captures(url, match_type)
+        
+        # Формат дат проверен в list()
+        date_from = parse_date_param(self.request.query_params.get('from', ''))
+        date_to = parse_date_param(self.request.query_params.get('to', ''))
+        if date_from:
+            queryset = queryset.filter(timestamp__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(timestamp__lt=date_to + timedelta(days=1))
+        
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        """Список захватов; параметр url обязателен"""
+        if not request.query_params.get('url', '').strip():
+            return Response(
+                {'error': 'Параметр url обязателен'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if request.query_params.get('match', 'exact') not in self.MATCH_TYPES:
+            return Response(
+                {'error': f"Параметр match должен быть одним из: {', '.join(self.MATCH_TYPES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            parse_date_param(request.query_params.get('from', ''))
+            parse_date_param(request.query_params.get('to', ''))
+        except ValueError:
+            return Response(
+                {'error': 'Параметры from и to должны быть датами в формате ГГГГ-ММ-ДД'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().list(request, *args, **kwargs)
+
@@ -0,0 +1,28 @@
+"""
+Асинхронные (ASGI) views краулера
+"""
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .progress_stream import iter_progress_events
+
+
+@require_GET
+async def crawl_progress_stream(request, task_id):
+    """
+    Прогресс сканирования в реальном времени (Server-Sent Events)
+
+    GET /api/v1/crawler/crawl-progress/<task_id>/
+
+    События: progress - текущие счетчики (страницы, очередь, байты, ошибки,
+    pages/sec, ETA), done - итоговый результат, после которого поток закрывается.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Требуется авторизация'}, status=401)
+
+    response = StreamingHttpResponse(iter_progress_events(task_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Отключаем буферизацию ответа в nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,261 @@
+"""
+Пул headless браузеров процесса воркера для JS-страниц и скриншотов
+
+Запуск браузера стоит секунды, поэтому каждый процесс воркера держит один
+долгоживущий Chromium и ограниченное число контекстов (CRAWLER_BROWSER_CONTEXTS),
+которые переиспользуются между страницами: рендер страницы - это только
+новая вкладка в готовом контексте. Число контекстов ограничивает и
+параллельные рендеры процесса.
+
+Контекст пересоздается после CRAWLER_BROWSER_CONTEXT_MAX_PAGES страниц
+(куки, кеш и утечки страниц), браузер перезапускается после
+CRAWLER_BROWSER_MAX_PAGES страниц или при росте памяти его процессов выше
+CRAWLER_BROWSER_MAX_MEMORY_MB.
+
+Playwright работает в отдельном потоке со своим event loop, поэтому пул
+можно вызывать из любого потока, в том числе из корутин краулера.
+"""
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+try:
+    from playwright.async_api import Error as PlaywrightError
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+    from playwright.async_api import async_playwright
+except ImportError:  # без Playwright рендеринг недоступен
+    async_playwright = None
+    PlaywrightError = PlaywrightTimeoutError = Exception
+
+try:
+    import psutil
+except ImportError:  # без psutil браузер перезапускается только по числу страниц
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+VIEWPORT = {'width': 1280, 'height': 800}
+
+# Проверка памяти браузера - раз в столько страниц
+MEMORY_CHECK_INTERVAL = 10
+
+
+@dataclass
+class RenderResult:
+    """
+    Страница после выполнения скриптов в браузере
+    """
+    url: str
+    status_code: int
+    html: str
+    headers: Dict[str, str]
+    screenshot: Optional[bytes] = None
+
+
+class _PooledContext:
+    def __init__(self, context):
+        self.context = context
+        self.pages = 0
+
+
+class BrowserPool:
+    """
+    Ограниченный набор переиспользуемых контекстов одного браузера на процесс
+    """
+
+    def __init__(self):
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lifecycle: Optional[asyncio.Lock] = None
+        self._playwright = None
+        self._browser = None
+        self._idle: List[_PooledContext] = []
+        self._active = 0
+        self._browser_pages = 0
+        self._recycle_browser = False
+
+    def available(self) -> bool:
+        return async_playwright is not None
+
+    def render(self, url: str, timeout: float = 30, screenshot: bool = False) -> RenderResult:
+        """
+        Загрузка страницы в браузере
+
+        Args:
+            url: URL страницы
+            timeout: Таймаут загрузки (секунды)
+            screenshot: Снять скриншот видимой области
+
+        Returns:
+            RenderResult: HTML после выполнения скриптов, статус и скриншот
+        """
+        return self._run(self._render(url, timeout, screenshot), timeout)
+
+    def close(self) -> None:
+        """Закрытие браузера и потока пула (при остановке процесса воркера)"""
+        if self._loop is None or self._pid != os.getpid():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(30)
+        except Exception as e:
+            logger.warning(f"Ошибка закрытия пула браузеров: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+    def _run(self, coro, timeout: float):
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            # Запас на ожидание свободного контекста и запуск браузера
+            return future.result(timeout * 2 + 30)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            # После fork поток и браузер родителя в процессе недоступны
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._playwright = self._browser = None
+                self._idle = []
+                self._active = self._browser_pages = 0
+                self._recycle_browser = False
+                self._loop = asyncio.new_event_loop()
+                self._slots = asyncio.Semaphore(settings.CRAWLER_BROWSER_CONTEXTS)
+                self._lifecycle = asyncio.Lock()
+                threading.Thread(target=self._loop.run_forever, name='browser-pool', daemon=True).start()
+            return self._loop
+
+    async def _render(self, url: str, timeout: float, screenshot: bool) -> RenderResult:
+        pooled = await self._acquire()
+        healthy = False
+        try:
+            page = await pooled.context.new_page()
+            try:
+                response = await page.goto(url, wait_until='domcontentloaded', timeout=timeout * 1000)
+                try:
+                    await page.wait_for_load_state('networkidle', timeout=settings.CRAWLER_BROWSER_IDLE_WAIT * 1000)
+                except PlaywrightTimeoutError:
+                    pass  # аналитика и websocket не дают сети затихнуть
+                result = RenderResult(
+                    url=page.url,
+                    status_code=response.status if response else 200,
+                    html=await page.content(),
+                    headers={key.lower(): value for key, value in (response.headers if response else {}).items()},
+                    screenshot=await page.screenshot(
+                        type='jpeg',
+                        quality=settings.CRAWLER_SCREENSHOT_QUALITY,
+                        full_page=settings.CRAWLER_SCREENSHOT_FULL_PAGE
+                    ) if screenshot else None
+                )
+                healthy = True
+                return result
+            finally:
+                await page.close()
+        except PlaywrightTimeoutError:
+            healthy = True  # медленный сайт, а не сломанный контекст
+            raise
+        finally:
+            pooled.pages += 1
+            await self._release(pooled, healthy)
+
+    async def _acquire(self) -> _PooledContext:
+        await self._slots.acquire()
+        try:
+            async with self._lifecycle:
+                if self._recycle_browser and self._active == 0:
+                    logger.info(f"Перезапуск браузера после {self._browser_pages} страниц")
+                    await self._shutdown()
+                if self._browser is None or not self._browser.is_connected():
+                    await self._launch()
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    pooled = _PooledContext(await self._browser.new_context(
+                        viewport=VIEWPORT,
+                        user_agent=settings.CRAWLER_USER_AGENT or None,
+                        ignore_https_errors=True
+                    ))
+                self._active += 1
+                return pooled
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release(self, pooled: _PooledContext, healthy: bool) -> None:
+        try:
+            async with self._lifecycle:
+                self._active -= 1
+                self._browser_pages += 1
+                if (
+                    healthy
+                    and not self._recycle_browser
+                    and pooled.pages < settings.CRAWLER_BROWSER_CONTEXT_MAX_PAGES
+                    and self._browser is not None and self._browser.is_connected()
+                ):
+                    self._idle.append(pooled)
+                else:
+                    await self._close_quietly(pooled.context)
+                if self._browser_pages >= settings.CRAWLER_BROWSER_MAX_PAGES or (
+                    self._browser_pages % MEMORY_CHECK_INTERVAL == 0
+                    and self._memory_mb() > settings.CRAWLER_BROWSER_MAX_MEMORY_MB
+                ):
+                    self._recycle_browser = True
+        finally:
+            self._slots.release()
+
+    async def _launch(self) -> None:
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(
+            headless=True,
+            executable_path=settings.CRAWLER_BROWSER_EXECUTABLE or None,
+            args=['--disable-dev-shm-usage']
+        )
+        self._idle = []
+        self._browser_pages = 0
+        self._recycle_browser = False
+
+    async def _shutdown(self) -> None:
+        for pooled in self._idle:
+            await self._close_quietly(pooled.context)
+        self._idle = []
+        if self._browser is not None:
+            await self._close_quietly(self._browser)
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _close_quietly(self, target) -> None:
+        try:
+            await target.close()
+        except PlaywrightError:
+            pass
+
+    def _memory_mb(self) -> float:
+        """Память (RSS) драйвера Playwright и процессов браузера, МБ"""
+        if psutil is None:
+            return 0.0
+        try:
+            children = psutil.Process().children(recursive=True)
+        except psutil.Error:
+            return 0.0
+        rss = 0
+        for child in children:
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return rss / (1024 * 1024)
+
+
+browser_pool = BrowserPool()
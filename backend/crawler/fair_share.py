@@ -0,0 +1,218 @@
+"""
+Справедливое распределение сканирований между пользователями
+
+Поставленные сканирования ждут допуска в снапшотах со статусом pending
+без dispatched_at, а не в очереди Celery. Диспетчер отправляет их в Celery
+по deficit round robin между владельцами сайтов: за один обход пользователь
+получает кредит, равный своему весу (CRAWLER_USER_WEIGHTS), и тратит по
+единице на сканирование. Внутри пользователя порядок - по приоритету, затем
+по времени постановки.
+
+Число отправленных и не завершенных сканирований ограничено на пользователя
+(CRAWLER_USER_MAX_ACTIVE) и в целом (CRAWLER_DISPATCH_MAX_IN_FLIGHT), поэтому
+очередь Celery остается короткой, а ожидание пользователя зависит от числа
+активных пользователей, а не от объема чужих заявок. Лимиты считаются в
+слотах воркеров crawl: распределенное сканирование занимает по слоту на
+каждого своего воркера, и число воркеров при допуске ограничивается
+свободными слотами.
+
+Диспетчер запускается после постановки сканирований, по завершении каждого
+сканирования и периодически (dispatch_crawls_task); параллельные запуски
+сериализуются advisory-блокировкой PostgreSQL.
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from archive.models import ArchiveSnapshot
+from archive.query_cache import SNAPSHOTS_TAG, invalidate_tags, website_tag
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки диспетчера
+DISPATCH_LOCK_ID = 0x63726177  # 'craw'
+
+# Состояние deficit round robin между запусками диспетчера
+DRR_STATE_KEY = 'crawler:fair-share:drr'
+
+# Сканирование отправлено в Celery и еще не завершено
+IN_FLIGHT = Q(status='processing') | Q(status='pending', dispatched_at__isnull=False)
+WAITING = Q(status='pending', dispatched_at__isnull=True)
+
+
+def user_weight(username: str) -> float:
+    """Вес пользователя в распределении (по умолчанию 1; 0 - сканирования не допускаются)"""
+    return float(settings.CRAWLER_USER_WEIGHTS.get(username, 1))
+
+
+def slot_cost(crawl_options: Dict) -> int:
+    """Слотов воркеров crawl, занимаемых сканированием (распределенным - по числу воркеров)"""
+    options = crawl_options or {}
+    if not options.get('distributed'):
+        return 1
+    return max(1, int(options.get('workers') or settings.CRAWLER_DISTRIBUTED_WORKERS))
+
+
+def in_flight_by_user() -> Dict[int, int]:
+    """Слоты, занятые отправленными и не завершенными сканированиями, по владельцам сайтов"""
+    in_flight = defaultdict(int)
+    rows = ArchiveSnapshot.objects.filter(IN_FLIGHT).values_list('website__created_by', 'crawl_options')
+    for user, crawl_options in rows:
+        in_flight[user] += slot_cost(crawl_options)
+    return dict(in_flight)
+
+
+def waiting_users() -> Dict[int, str]:
+    """Пользователи с ожидающими допуска сканированиями: id -> username"""
+    rows = (
+        ArchiveSnapshot.objects
+        .filter(WAITING)
+        .values_list('website__created_by', 'website__created_by__username')
+        .distinct()
+    )
+    return dict(rows)
+
+
+def select_crawls() -> List[ArchiveSnapshot]:
+    """
+    Выбор сканирований для отправки по deficit round robin
+
+    Вызывается под блокировкой диспетчера. Состояние обхода (порядок
+    пользователей, остаток кредита и пользователь, чей кредит уже выдан)
+    сохраняется между запусками, поэтому при одном свободном слоте очередь
+    не начинается каждый раз с одного и того же пользователя.
+    """
+    in_flight = in_flight_by_user()
+    slots = settings.CRAWLER_DISPATCH_MAX_IN_FLIGHT - sum(in_flight.values())
+    if slots <= 0:
+        return []
+
+    users = waiting_users()
+    user_cap = settings.CRAWLER_USER_MAX_ACTIVE
+    state = cache.get(DRR_STATE_KEY) or {'order': [], 'deficit': {}, 'current': None}
+    order = [user for user in state['order'] if user in users]
+    order += sorted(user for user in users if user not in order)
+    deficit = {user: state['deficit'].get(str(user), 0.0) for user in order}
+    current = state['current'] if state['current'] in order else None
+
+    queues = {}
+    selected = []
+    while slots > 0 and order:
+        user = order[0]
+        if user not in queues:
+            queues[user] = list(
+                ArchiveSnapshot.objects
+                .filter(WAITING, website__created_by=user)
+                .select_related('website')
+                .order_by('priority', 'snapshot_date')[:max(0, min(slots, user_cap - in_flight.get(user, 0)))]
+            )
+        if not queues[user] or in_flight.get(user, 0) >= user_cap or user_weight(users[user]) <= 0:
+            # Пользователь выбывает из обхода до появления новых заявок или слотов
+            order.pop(0)
+            deficit.pop(user, None)
+            current = None
+            continue
+
+        if current != user:
+            deficit[user] += user_weight(users[user])
+            current = user
+        if deficit[user] < 1:
+            order.append(order.pop(0))
+            current = None
+            continue
+
+        snapshot = queues[user].pop(0)
+        cost = slot_cost(snapshot.crawl_options)
+        if cost > 1:
+            # Воркеров распределенного сканирования не больше свободных слотов
+            cost = min(cost, slots, user_cap - in_flight.get(user, 0))
+            snapshot.crawl_options = {**snapshot.crawl_options, 'workers': cost}
+        selected.append(snapshot)
+        # Кредит тратится по занятым слотам; долг переходит на следующие обходы
+        deficit[user] -= cost
+        in_flight[user] = in_flight.get(user, 0) + cost
+        slots -= cost
+        if deficit[user] < 1:
+            order.append(order.pop(0))
+            current = None
+
+    cache.set(DRR_STATE_KEY, {
+        'order': order,
+        'deficit': {str(user): value for user, value in deficit.items()},
+        'current': current,
+    }, None)
+    return selected
+
+
+def dispatch_crawls() -> int:
+    """
+    Отправка в Celery ожидающих сканирований, для которых есть слоты
+
+    Returns:
+        int: Количество отправленных сканирований
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [DISPATCH_LOCK_ID])
+        selected = select_crawls()
+        if selected:
+            ArchiveSnapshot.objects.filter(pk__in=[snapshot.pk for snapshot in selected]).update(
+                dispatched_at=timezone.now()
+            )
+            for snapshot in selected:
+                if (snapshot.crawl_options or {}).get('distributed'):
+                    # Число воркеров, ограниченное при допуске
+                    ArchiveSnapshot.objects.filter(pk=snapshot.pk).update(crawl_options=snapshot.crawl_options)
+            transaction.on_commit(lambda: send_crawls(selected))
+
+    if selected:
+        per_user = defaultdict(int)
+        for snapshot in selected:
+            per_user[snapshot.website.created_by_id] += 1
+        logger.info(f"Отправлено сканирований: {len(selected)}, пользователей: {len(per_user)}")
+    return len(selected)
+
+
+def try_dispatch_crawls() -> None:
+    """Запуск диспетчера, ошибка которого не должна срывать вызывающий код"""
+    try:
+        dispatch_crawls()
+    except Exception as e:
+        # Заявки дождутся периодического dispatch_crawls_task
+        logger.error(f"Ошибка диспетчера сканирований: {str(e)}")
+
+
+def send_crawls(snapshots: List[ArchiveSnapshot]) -> None:
+    """Отправка задач сканирования в брокер с параметрами, сохраненными при постановке"""
+    from .tasks import crawl_website_task, start_distributed_crawl_task
+
+    for snapshot in snapshots:
+        website = snapshot.website
+        crawl_options = snapshot.crawl_options or {}
+        crawl_depth = crawl_options.get('crawl_depth') or website.crawl_depth
+        follow_external = crawl_options.get('follow_external', False)
+        options = {'task_id': snapshot.task_id, 'priority': snapshot.priority}
+        if crawl_options.get('queue'):
+            options['queue'] = crawl_options['queue']
+        try:
+            if crawl_options.get('distributed'):
+                start_distributed_crawl_task.apply_async(
+                    (str(website.pk), crawl_depth, follow_external, crawl_options.get('workers'), str(snapshot.pk)),
+                    **options
+                )
+            else:
+                crawl_website_task.apply_async(
+                    (str(website.pk), crawl_depth, follow_external, str(snapshot.pk)),
+                    **options
+                )
+        except Exception as e:
+            logger.error(f"Ошибка отправки сканирования {website.url}: {str(e)}")
+            if ArchiveSnapshot.objects.filter(pk=snapshot.pk, status='pending').update(status='failed'):
+                # update() не вызывает post_save: кеш списков снапшотов сбрасывается явно
+                invalidate_tags(SNAPSHOTS_TAG, website_tag(snapshot.website_id))
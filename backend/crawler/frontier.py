@@ -0,0 +1,235 @@
+"""
+Распределенная очередь URL (frontier) одного сканирования в Redis
+
+Очередь разбита на шарды по хешу URL. Воркеры забирают URL сначала из
+своего шарда, затем из остальных, поэтому нагрузка выравнивается сама.
+Множество посещенных URL, счетчик незавершенных URL и лимит страниц
+общие для всех воркеров. Когда счетчик незавершенных URL доходит до нуля,
+ровно один воркер получает право завершить снапшот.
+
+Извлеченный URL до завершения обработки лежит в списке processing. При
+возобновлении прерванного сканирования эти URL возвращаются в очередь, а
+завершение URL, который уже вернули, не уменьшает счетчик повторно.
+
+Все ключи сканирования содержат хеш-тег {crawl:<snapshot_id>}, поэтому
+в Redis Cluster они попадают в один слот и Lua скрипты атомарны.
+"""
+import json
+import time
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+from archive.models import compute_url_hash
+from .redis_client import get_redis
+
+# Добавление URL: отметка посещения, счетчик незавершенных и шард - атомарно
+PUSH_SCRIPT = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 1 then
+    redis.call('INCR', KEYS[2])
+    redis.call('RPUSH', KEYS[3], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Извлечение URL из первого непустого шарда в список processing
+# (KEYS[1] - processing, далее шарды в порядке обхода)
+POP_SCRIPT = """
+for i = 2, #KEYS do
+    local item = redis.call('LPOP', KEYS[i])
+    if item then
+        redis.call('RPUSH', KEYS[1], item)
+        return item
+    end
+end
+return false
+"""
+
+# Завершение URL: счетчик уменьшается, только если URL еще числится в обработке
+COMPLETE_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 1 then
+    return redis.call('DECR', KEYS[2])
+end
+return false
+"""
+
+# Возврат URL из обработки в очередь и пересчет незавершенных
+# (KEYS[1] - счетчик, KEYS[2] - processing, далее шарды)
+REQUEUE_SCRIPT = """
+local item = redis.call('LPOP', KEYS[2])
+while item do
+    redis.call('RPUSH', KEYS[3], item)
+    item = redis.call('LPOP', KEYS[2])
+end
+local queued = 0
+for i = 3, #KEYS do
+    queued = queued + redis.call('LLEN', KEYS[i])
+end
+redis.call('SET', KEYS[1], queued)
+return queued
+"""
+
+# Ожидание между попытками, когда очередь пуста, но другие воркеры еще работают
+IDLE_POLL_INTERVAL = 0.5
+
+
+class RedisFrontier:
+    """
+    Шардированная очередь URL сканирования снапшота
+    """
+
+    def __init__(self, snapshot_id, shards: Optional[int] = None):
+        """
+        Args:
+            snapshot_id: ID снапшота, который заполняет сканирование
+            shards: Количество шардов очереди
+        """
+        self.snapshot_id = str(snapshot_id)
+        self.redis = get_redis()
+        self.prefix = f"{{crawl:{self.snapshot_id}}}"
+        stored_shards = self.redis.hget(self.key('meta'), 'shards')
+        self.shards = int(stored_shards or shards or settings.CRAWLER_FRONTIER_SHARDS)
+        self._push = self.redis.register_script(PUSH_SCRIPT)
+        self._pop = self.redis.register_script(POP_SCRIPT)
+        self._complete = self.redis.register_script(COMPLETE_SCRIPT)
+        self._requeue = self.redis.register_script(REQUEUE_SCRIPT)
+
+    def key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def shard_key(self, shard: int) -> str:
+        return self.key(f"frontier:{shard}")
+
+    def shard_for(self, url_hash: int) -> int:
+        return url_hash % self.shards
+
+    def initialize(self, start_url: str, **meta) -> None:
+        """
+        Создание очереди со стартовым URL и параметрами сканирования
+
+        Args:
+            start_url: Начальный URL
+            meta: Параметры сканирования (max_depth, max_pages, ...)
+        """
+        self.redis.delete(*self.all_keys(), self.key('finalized'))
+        self.redis.hset(self.key('meta'), mapping={
+            'start_url': start_url,
+            'shards': self.shards,
+            'started_at': time.time(),
+            **{name: json.dumps(value) for name, value in meta.items()},
+        })
+        self.push(start_url, 0)
+
+    def exists(self) -> bool:
+        """Очередь сканирования уже создана (возобновление после сбоя)"""
+        return bool(self.redis.exists(self.key('meta')))
+
+    def requeue_processing(self) -> int:
+        """
+        Возврат в очередь URL, которые обрабатывали прерванные воркеры
+
+        Счетчик незавершенных URL приравнивается к длине очереди. Если
+        прежний воркер на самом деле жив, его complete() для возвращенного
+        URL счетчик уже не уменьшит.
+
+        Returns:
+            int: Количество URL в очереди
+        """
+        shard_keys = [self.shard_key(shard) for shard in range(self.shards)]
+        return int(self._requeue(keys=[self.key('pending'), self.key('processing'), *shard_keys]))
+
+    def mark_workers_queued(self, workers: int) -> None:
+        """Воркеры отправлены в брокер и ждут свободного слота"""
+        self.redis.hset(self.key('workers'), mapping={'queued': workers, 'queued_at': time.time()})
+
+    def worker_started(self) -> None:
+        self.redis.hincrby(self.key('workers'), 'queued', -1)
+
+    def waiting_workers(self) -> Tuple[int, float]:
+        """
+        Воркеры, которые отправлены, но еще не начали работу
+
+        Returns:
+            (количество, время отправки)
+        """
+        raw = self.redis.hmget(self.key('workers'), 'queued', 'queued_at')
+        return max(0, int(raw[0] or 0)), float(raw[1] or 0)
+
+    def meta(self) -> dict:
+        """Параметры сканирования"""
+        raw = {key.decode(): value.decode() for key, value in self.redis.hgetall(self.key('meta')).items()}
+        meta = {'start_url': raw.pop('start_url', ''), 'shards': int(raw.pop('shards', self.shards)),
+                'started_at': float(raw.pop('started_at', 0))}
+        meta.update({name: json.loads(value) for name, value in raw.items()})
+        return meta
+
+    def push(self, url: str, depth: int) -> bool:
+        """
+        Добавление URL, если его еще не было в этом сканировании
+
+        Returns:
+            bool: URL добавлен в очередь
+        """
+        url_hash = compute_url_hash(url)
+        added = self._push(
+            keys=[self.key('seen'), self.key('pending'), self.shard_key(self.shard_for(url_hash))],
+            args=[url_hash, json.dumps([url, depth])]
+        )
+        return bool(added)
+
+    def pop(self, worker_index: int) -> Optional[Tuple[str, int]]:
+        """
+        Следующий URL: сначала из шарда воркера, затем из остальных
+
+        Returns:
+            (url, depth) или None, если очередь пуста
+        """
+        start = worker_index % self.shards
+        keys = [self.shard_key((start + offset) % self.shards) for offset in range(self.shards)]
+        item = self._pop(keys=[self.key('processing'), *keys])
+        if not item:
+            return None
+        url, depth = json.loads(item)
+        return url, depth
+
+    def reserve_page(self, max_pages: int) -> bool:
+        """Резервирование места под страницу в пределах лимита сканирования"""
+        return self.redis.incr(self.key('pages')) <= max_pages
+
+    def complete(self, url: str, depth: int) -> bool:
+        """
+        Отметка о завершении обработки URL, полученного из pop()
+
+        Returns:
+            bool: Очередь опустела и вызывающий воркер должен завершить снапшот
+        """
+        remaining = self._complete(
+            keys=[self.key('processing'), self.key('pending')],
+            args=[json.dumps([url, depth])]
+        )
+        return remaining is not None and int(remaining) <= 0 and self.claim_finalization()
+
+    def pending(self) -> int:
+        """Количество URL в очереди и в обработке"""
+        return int(self.redis.get(self.key('pending')) or 0)
+
+    def claim_finalization(self) -> bool:
+        """Право завершить снапшот получает ровно один вызывающий"""
+        return bool(self.redis.set(self.key('finalized'), 1, nx=True))
+
+    def all_keys(self):
+        return [self.key(name) for name in ('meta', 'seen', 'pending', 'pages', 'processing', 'workers')] + [
+            self.shard_key(shard) for shard in range(self.shards)
+        ]
+
+    def cleanup(self) -> None:
+        """
+        Удаление ключей сканирования
+
+        Отметка о завершении живет еще сутки, чтобы запоздавший воркер
+        не завершил снапшот повторно.
+        """
+        self.redis.delete(*self.all_keys())
+        self.redis.expire(self.key('finalized'), 24 * 60 * 60)
+
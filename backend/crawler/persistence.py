@@ -0,0 +1,145 @@
+"""
+Сохранение загруженных страниц и найденных ресурсов в архив
+
+Сохранение идемпотентно: файл страницы имеет постоянное имя в пределах
+снапшота, а запись в БД, поисковый индекс, CDX и ресурсы страницы
+фиксируются одной транзакцией. Повтор после сбоя перезаписывает тот же
+файл и либо пропускает уже сохраненную страницу, либо обновляет ее.
+"""
+import logging
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from archive.cdx import record_capture
+from archive.models import ArchiveSnapshot, ArchivedAsset, ArchivedPage, compute_url_hash
+from archive.search import index_page
+from encryption.file_encryption import ArchiveFileEncryption
+
+logger = logging.getLogger(__name__)
+
+
+class SavedPages(Mapping):
+    """
+    Страницы снапшота, сохраненные предыдущими попытками: {url: html}
+
+    При создании загружается только список URL. Контент расшифровывается
+    при обращении, по одной странице: расшифровка всего снапшота заранее
+    заняла бы минуты CPU до первой отметки heartbeat и держала бы весь
+    архив в памяти.
+    """
+
+    def __init__(self, snapshot: ArchiveSnapshot):
+        self.snapshot = snapshot
+        self.urls = set(snapshot.pages.values_list('url', flat=True))
+
+    def __getitem__(self, url: str) -> str:
+        if url not in self.urls:
+            raise KeyError(url)
+        page = self.snapshot.pages.by_url(url).only('id', '_encrypted_content').first()
+        if page is None:
+            raise KeyError(url)
+        return page.content
+
+    def __contains__(self, url) -> bool:
+        return url in self.urls
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.urls)
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+# Группы ресурсов краулера -> asset_type модели
+ASSET_TYPES = {
+    'css': 'css',
+    'js': 'js',
+    'images': 'image',
+    'fonts': 'font',
+    'other': 'other',
+}
+
+
+def persist_page(snapshot: ArchiveSnapshot, page_data: Dict, encryption: ArchiveFileEncryption,
+                 archive_dir: str) -> Optional[ArchivedPage]:
+    """
+    Сохранение (upsert) страницы, загруженной WebArchiveCrawler.fetch_page
+
+    Страница шифруется в файл архива и в БД, индексируется для поиска и
+    добавляется в CDX-индекс. Ресурсы страницы регистрируются в снапшоте.
+
+    Args:
+        snapshot: Снапшот, в который сохраняется страница
+        page_data: Результат fetch_page
+        encryption: Шифровальщик архива
+        archive_dir: Директория архива снапшота
+
+    Returns:
+        ArchivedPage или None, если такая же страница уже сохранена в снапшоте
+    """
+    url = page_data['url']
+    existing = ArchivedPage.objects.filter(snapshot=snapshot).by_url(url).first()
+    if existing is not None and existing.content_hash == page_data['content_hash']:
+        return None
+
+    html_content = page_data['html_content']
+    # Имя файла по дате снапшота: повторная попытка пишет в тот же файл
+    timestamp = snapshot.snapshot_date.strftime('%Y%m%d%H%M%S')
+    encryption.save_encrypted_page(archive_dir, url, html_content, timestamp)
+
+    archived_page = existing or ArchivedPage(snapshot=snapshot, url=url)
+    if page_data.get('screenshot'):
+        try:
+            archived_page.screenshot_path, archived_page.thumbnail_path = encryption.save_screenshot(
+                archive_dir, url, page_data['screenshot'], timestamp
+            )
+        except Exception as e:
+            # Скриншот необязателен: страница сохраняется и без него
+            logger.warning(f"Ошибка сохранения скриншота {url}: {str(e)}")
+    archived_page.title = page_data['title'][:500]
+    archived_page.status_code = page_data.get('status_code', 200)
+    archived_page.fetch_tier = page_data.get('fetch_tier', '')
+    archived_page.content_size = page_data['size']
+    archived_page.content_hash = page_data['content_hash']
+    archived_page.archived_at = timezone.now()
+    archived_page.content = html_content
+    try:
+        with transaction.atomic():
+            archived_page.save()
+            index_page(archived_page, html_content)
+            record_capture(archived_page)
+            persist_assets(snapshot, page_data.get('assets', {}))
+    except IntegrityError:
+        # Параллельный воркер сохранил ту же страницу раньше
+        logger.info(f"Страница {url} уже сохранена в снапшоте {snapshot.pk}")
+        return None
+    return archived_page
+
+
+def persist_assets(snapshot: ArchiveSnapshot, assets: Dict) -> int:
+    """
+    Регистрация ресурсов страницы (скачиваются отдельно, download_asset_task)
+
+    Ресурсы, уже известные снапшоту, пропускаются по уникальному ключу
+    (snapshot, url_hash), поэтому параллельные воркеры не создают дублей.
+
+    Returns:
+        int: Количество переданных на вставку ресурсов
+    """
+    records = [
+        ArchivedAsset(
+            snapshot=snapshot,
+            url=url,
+            url_hash=compute_url_hash(url),
+            asset_type=ASSET_TYPES.get(group, 'other'),
+            file_path='',  # Будет заполнено при скачивании ресурса
+            file_size=0
+        )
+        for group, urls in assets.items()
+        for url in urls
+    ]
+    if records:
+        ArchivedAsset.objects.bulk_create(records, ignore_conflicts=True)
+    return len(records)
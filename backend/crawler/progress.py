@@ -0,0 +1,121 @@
+"""
+Публикация прогресса сканирования в состояние Celery-задачи
+
+Прогресс записывается через update_state (состояние PROGRESS) не чаще
+раза в CRAWLER_PROGRESS_INTERVAL секунд. Redis result backend при каждой
+записи публикует состояние в канал задачи, откуда его читает SSE эндпоинт.
+"""
+import time
+from typing import Any, Dict, Optional
+
+from celery.result import AsyncResult
+from django.conf import settings
+
+PROGRESS_STATE = 'PROGRESS'
+
+
+class CrawlProgress:
+    """
+    Счетчики прогресса сканирования с ограничением частоты публикации
+    """
+
+    def __init__(self, task=None, max_pages: int = 0, interval: Optional[float] = None, heartbeat=None):
+        """
+        Args:
+            task: Связанная (bind=True) Celery-задача или None (без публикации)
+            max_pages: Ограничение количества страниц (для оценки ETA)
+            interval: Минимальный интервал между публикациями (секунды)
+            heartbeat: Признак жизни снапшота (SnapshotHeartbeat), отмечается при каждом обновлении
+        """
+        self.task = task
+        self.heartbeat = heartbeat
+        self.max_pages = max_pages
+        self.interval = interval if interval is not None else getattr(settings, 'CRAWLER_PROGRESS_INTERVAL', 1.0)
+        self.started_at = time.monotonic()
+        self._published_at = float('-inf')
+
+        # Снапшот завершен или передан другой задаче: сканирование прекращается
+        self.stopped = False
+
+        self.phase = 'crawl'
+        self.pages_fetched = 0
+        self.pages_saved = 0
+        self.pages_total = 0
+        self.queue_size = 0
+        self.bytes_fetched = 0
+        self.errors = 0
+
+    def update(self, force: bool = False, **counters) -> None:
+        """
+        Обновление счетчиков и публикация, если прошел интервал
+
+        Args:
+            force: Опубликовать независимо от интервала (смена фазы)
+            counters: Новые значения счетчиков (phase, pages_fetched, queue_size, ...)
+        """
+        for name, value in counters.items():
+            setattr(self, name, value)
+        if self.heartbeat is not None and not self.heartbeat.beat():
+            self.stopped = True
+
+        now = time.monotonic()
+        if not force and now - self._published_at < self.interval:
+            return
+        self._published_at = now
+        if self.task is not None and self.task.request.id:
+            self.task.update_state(state=PROGRESS_STATE, meta=self.as_dict())
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Структурированный прогресс: счетчики, скорость и оценка оставшегося времени"""
+        elapsed = time.monotonic() - self.started_at
+        # В первые секунды скорость не оцениваем по слишком короткому интервалу
+        rate_window = max(elapsed, 1.0)
+
+        if self.phase == 'crawl':
+            done = self.pages_fetched
+            remaining = self.queue_size
+            if self.max_pages:
+                remaining = min(remaining, max(0, self.max_pages - self.pages_fetched))
+        else:
+            done = self.pages_saved
+            remaining = max(0, self.pages_total - self.pages_saved)
+
+        pages_per_sec = self.pages_fetched / rate_window
+        rate = done / rate_window
+        return {
+            'phase': self.phase,
+            'pages_fetched': self.pages_fetched,
+            'pages_saved': self.pages_saved,
+            'pages_total': self.pages_total,
+            'queue_size': self.queue_size,
+            'bytes': self.bytes_fetched,
+            'errors': self.errors,
+            'pages_per_sec': round(pages_per_sec, 2),
+            'elapsed': round(elapsed, 1),
+            'eta': round(remaining / rate, 1) if rate > 0 else None,
+        }
+
+
+def task_status(task_id: str) -> Dict[str, Any]:
+    """
+    Состояние задачи сканирования для API
+
+    Returns:
+        Dict[str, Any]: task_id, status, ready и result/error/progress
+    """
+    task_result = AsyncResult(task_id)
+    data = {
+        'task_id': task_id,
+        'status': task_result.status,
+        'ready': task_result.ready()
+    }
+
+    if task_result.ready():
+        if task_result.successful():
+            data['result'] = task_result.result
+        else:
+            data['error'] = str(task_result.info)
+    elif task_result.info:
+        # Задача еще выполняется
+        data['progress'] = task_result.info
+    return data
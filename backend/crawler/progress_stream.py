@@ -0,0 +1,193 @@
+"""
+Трансляция прогресса сканирования клиентам (Server-Sent Events)
+
+Redis result backend публикует каждое изменение состояния задачи в канал
+celery-task-meta-<task_id>. Процесс держит одно pub/sub подключение к
+Redis и раздает сообщения всем SSE клиентам, которые следят за задачей,
+поэтому тысячи открытых страниц не опрашивают Redis. Для других result
+backend используется редкий опрос состояния.
+"""
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Dict, Optional, Set
+
+from asgiref.sync import sync_to_async
+from celery.backends.redis import RedisBackend
+from django.conf import settings
+
+from webarchive.celery import app
+from .progress import PROGRESS_STATE, task_status
+
+logger = logging.getLogger(__name__)
+
+# Комментарий-пинг, чтобы прокси не закрывали простаивающее соединение
+HEARTBEAT_INTERVAL = 15
+
+# Сигнал подписчикам: соединение с Redis потеряно, нужен опрос
+CONNECTION_LOST = object()
+
+
+class TaskEventHub:
+    """
+    Одно pub/sub подключение к Redis на процесс с раздачей по подписчикам
+    """
+
+    def __init__(self, redis_url: str):
+        """
+        Args:
+            redis_url: URL Redis result backend
+        """
+        self.redis_url = redis_url
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._channels: Dict[bytes, str] = {}
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._loop = None
+
+    async def subscribe(self, task_id: str) -> asyncio.Queue:
+        """Очередь, в которую попадают состояния задачи"""
+        await self._ensure_connected()
+        queue = asyncio.Queue()
+        channel = app.backend.get_key_for_task(task_id)
+        if task_id not in self._subscribers:
+            self._subscribers[task_id] = set()
+            await self._pubsub.subscribe(channel)
+            self._channels[channel] = task_id
+        self._subscribers[task_id].add(queue)
+        return queue
+
+    async def unsubscribe(self, task_id: str, queue: asyncio.Queue) -> None:
+        """Отписка клиента; канал закрывается после ухода последнего"""
+        subscribers = self._subscribers.get(task_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[task_id]
+            channel = app.backend.get_key_for_task(task_id)
+            self._channels.pop(channel, None)
+            if self._pubsub is not None:
+                try:
+                    await self._pubsub.unsubscribe(channel)
+                except Exception as e:
+                    logger.warning(f"Ошибка отписки от канала задачи {task_id}: {e}")
+
+    async def _ensure_connected(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._pubsub is not None and self._loop is loop:
+            return
+
+        import redis.asyncio as aioredis
+
+        self._loop = loop
+        self._subscribers.clear()
+        self._channels.clear()
+        client = aioredis.from_url(self.redis_url)
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._reader = loop.create_task(self._read_loop(self._pubsub))
+
+    async def _read_loop(self, pubsub) -> None:
+        """Чтение сообщений канала и раздача подписчикам"""
+        try:
+            while True:
+                if not self._channels:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await pubsub.get_message(timeout=HEARTBEAT_INTERVAL)
+                if message is None or message.get('type') != 'message':
+                    continue
+                task_id = self._channels.get(message['channel'])
+                if task_id is None:
+                    continue
+                try:
+                    meta = app.backend.decode_result(message['data'])
+                except Exception as e:
+                    logger.warning(f"Некорректное состояние задачи {task_id}: {e}")
+                    continue
+                for queue in self._subscribers.get(task_id, ()):
+                    queue.put_nowait(meta)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Потеряно соединение с Redis для трансляции прогресса: {e}")
+            for subscribers in self._subscribers.values():
+                for queue in subscribers:
+                    queue.put_nowait(CONNECTION_LOST)
+            self._subscribers.clear()
+            self._channels.clear()
+            self._pubsub = None
+
+
+def create_hub() -> Optional[TaskEventHub]:
+    """Хаб pub/sub, если result backend - Redis"""
+    if isinstance(app.backend, RedisBackend):
+        return TaskEventHub(settings.CELERY_RESULT_BACKEND)
+    return None
+
+
+event_hub = create_hub()
+
+
+def format_event(event: str, data: Dict) -> str:
+    """Сообщение в формате text/event-stream"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def status_event(status: Dict) -> str:
+    """Событие progress для выполняющейся задачи, done - для завершенной"""
+    return format_event('done' if status['ready'] else 'progress', status)
+
+
+async def iter_progress_events(task_id: str) -> AsyncIterator[str]:
+    """
+    Поток событий прогресса задачи до ее завершения
+
+    Первым отправляется текущее состояние, затем каждое опубликованное
+    изменение. Подписка оформляется до чтения состояния, чтобы не
+    пропустить изменения между ними.
+    """
+    queue = None
+    if event_hub is not None:
+        try:
+            queue = await event_hub.subscribe(task_id)
+        except Exception as e:
+            logger.warning(f"Pub/sub недоступен, прогресс задачи {task_id} опрашивается: {e}")
+
+    idle = 0
+    try:
+        status = await sync_to_async(task_status)(task_id)
+        yield status_event(status)
+
+        while not status['ready']:
+            if queue is not None:
+                try:
+                    meta = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                if meta is CONNECTION_LOST:
+                    queue = None
+                    continue
+                if meta['status'] == PROGRESS_STATE:
+                    status = {'task_id': task_id, 'status': PROGRESS_STATE, 'ready': False,
+                              'progress': meta['result']}
+                else:
+                    # Итоговое состояние (результат или ошибка) читаем целиком
+                    status = await sync_to_async(task_status)(task_id)
+                yield status_event(status)
+            else:
+                interval = getattr(settings, 'CRAWLER_PROGRESS_INTERVAL', 1.0)
+                await asyncio.sleep(interval)
+                idle += interval
+                previous = status
+                status = await sync_to_async(task_status)(task_id)
+                if status != previous:
+                    idle = 0
+                    yield status_event(status)
+                elif idle >= HEARTBEAT_INTERVAL:
+                    idle = 0
+                    yield ': ping\n\n'
+    finally:
+        if queue is not None:
+            await event_hub.unsubscribe(task_id, queue)
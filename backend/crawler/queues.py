@@ -0,0 +1,52 @@
+"""
+Очереди и приоритеты Celery-задач
+
+Каждый вид работы идет в свою очередь, которую обслуживает отдельный
+профиль воркеров (см. docker-compose.yml), поэтому тысячи задач ресурсов
+или долгая очистка не задерживают сканирования, запущенные пользователем.
+
+Приоритеты действуют внутри очереди. Для Redis брокера меньшее значение
+означает более высокий приоритет (0 - наивысший).
+"""
+from typing import Optional
+
+CRAWL_QUEUE = 'crawl'
+RECRAWL_QUEUE = 'recrawl'
+ASSETS_QUEUE = 'assets'
+MAINTENANCE_QUEUE = 'maintenance'
+SCHEDULER_QUEUE = 'scheduler'
+
+PRIORITY_USER_CRAWL = 0
+PRIORITY_SCHEDULED_CRAWL = 3
+PRIORITY_ASSETS = 6
+PRIORITY_MAINTENANCE = 9
+
+# Приоритеты, выбираемые при запуске сканирования через API; все выше плановых
+CRAWL_PRIORITIES = {
+    'high': PRIORITY_USER_CRAWL,
+    'normal': PRIORITY_USER_CRAWL + 1,
+    'low': PRIORITY_USER_CRAWL + 2,
+}
+
+TASK_ROUTES = {
+    'crawler.tasks.crawl_website_task': {'queue': CRAWL_QUEUE, 'priority': PRIORITY_USER_CRAWL},
+    'crawler.tasks.start_distributed_crawl_task': {'queue': CRAWL_QUEUE, 'priority': PRIORITY_USER_CRAWL},
+    'crawler.tasks.crawl_frontier_worker_task': {'queue': CRAWL_QUEUE, 'priority': PRIORITY_USER_CRAWL},
+    'crawler.tasks.finalize_distributed_crawl_task': {'queue': CRAWL_QUEUE, 'priority': PRIORITY_USER_CRAWL},
+    'crawler.tasks.download_asset_task': {'queue': ASSETS_QUEUE, 'priority': PRIORITY_ASSETS},
+    'crawler.tasks.cleanup_old_snapshots_task': {'queue': MAINTENANCE_QUEUE, 'priority': PRIORITY_MAINTENANCE},
+    # Планировщик, диспетчер и восстановление короткие и не должны ждать за
+    # очисткой, поэтому у них своя очередь и свой воркер
+    'crawler.tasks.schedule_recrawls_task': {'queue': SCHEDULER_QUEUE, 'priority': PRIORITY_USER_CRAWL},
+    'crawler.tasks.dispatch_crawls_task': {'queue': SCHEDULER_QUEUE, 'priority': PRIORITY_USER_CRAWL},
+    'crawler.tasks.reap_stalled_crawls_task': {'queue': SCHEDULER_QUEUE, 'priority': PRIORITY_USER_CRAWL},
+}
+
+
+def route_task(name, args, kwargs, options, task=None, **kw) -> Optional[dict]:
+    """
+    Роутер Celery (CELERY_TASK_ROUTES): очередь и приоритет по имени задачи
+
+    Явно переданные queue/priority в apply_async имеют преимущество.
+    """
+    return TASK_ROUTES.get(name)
@@ -0,0 +1,165 @@
+"""
+Общий для кластера ограничитель частоты запросов к домену (token bucket в Redis)
+
+Каждый регистрируемый домен (example.co.uk для www.example.co.uk) имеет
+одно ведро токенов в Redis, из которого берут все процессы: краулеры
+страниц, распределенные воркеры и download_asset_task. Пополнение и
+выдача токенов выполняются одним Lua скриптом по часам Redis.
+
+Чтобы не ходить в Redis за каждым токеном, процесс берет их пачкой и
+расходует локально, пока пачка не устарела.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+try:
+    import tldextract
+except ImportError:  # без tldextract доменом считаются два последних уровня хоста
+    tldextract = None
+
+logger = logging.getLogger(__name__)
+
+# Выдача до ARGV[3] токенов. Возвращает {выдано, ожидание до следующего токена в мс}
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+
+local granted = math.min(requested, math.floor(tokens))
+local wait = 0
+if granted < 1 then
+    granted = 0
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+tokens = tokens - granted
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return {granted, wait}
+"""
+
+_extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None) if tldextract else None
+
+
+def registrable_domain(url_or_host: str) -> str:
+    """
+    Регистрируемый домен хоста: www.shop.example.co.uk -> example.co.uk
+
+    Для IP-адресов и localhost возвращается сам хост.
+    """
+    host = urlsplit(url_or_host).hostname if '://' in url_or_host else url_or_host.split(':')[0]
+    host = (host or '').lower().strip('.')
+    if _extract is not None:
+        result = _extract(host)
+        domain = getattr(result, 'top_domain_under_public_suffix', None) or result.registered_domain
+        return domain or host
+    labels = host.split('.')
+    return '.'.join(labels[-2:]) if len(labels) > 2 else host
+
+
+class DomainRateLimiter:
+    """
+    Token bucket на регистрируемый домен, общий для всех воркеров кластера
+    """
+
+    def __init__(self):
+        self._local: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._script = None
+
+    def limits(self, domain: str) -> Tuple[float, float]:
+        """
+        Скорость (запросов в секунду) и емкость ведра для домена
+
+        Переопределения для отдельных доменов - CRAWLER_DOMAIN_RATE_OVERRIDES.
+        """
+        rate, burst = settings.CRAWLER_DOMAIN_RATE, settings.CRAWLER_DOMAIN_BURST
+        override = settings.CRAWLER_DOMAIN_RATE_OVERRIDES.get(domain)
+        if override:
+            rate = override.get('rate', rate)
+            burst = override.get('burst', burst)
+        return rate, max(burst, 1)
+
+    def batch_size(self, rate: float, burst: float) -> int:
+        """Размер пачки: не больше емкости ведра и не больше токенов за полсекунды"""
+        return max(1, min(settings.CRAWLER_RATE_LIMIT_BATCH, int(burst), int(rate / 2)))
+
+    def acquire(self, url: str) -> None:
+        """
+        Ожидание токена для запроса к домену URL
+
+        Args:
+            url: URL запроса
+        """
+        domain = registrable_domain(url)
+        if not domain:
+            return
+        rate, burst = self.limits(domain)
+        if rate <= 0:
+            return
+
+        while True:
+            if self._take_local(domain):
+                return
+            try:
+                granted, wait_ms = self._request(domain, rate, burst)
+            except Exception as e:
+                # Redis недоступен: ограничиваем хотя бы этот процесс
+                logger.warning(f"Ограничитель частоты недоступен ({e}), локальная пауза для {domain}")
+                time.sleep(1 / rate)
+                return
+            if granted:
+                self._store_local(domain, granted - 1, rate)
+                return
+            time.sleep(wait_ms / 1000)
+
+    def _request(self, domain: str, rate: float, burst: float) -> Tuple[int, int]:
+        if self._script is None:
+            self._script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+        granted, wait_ms = self._script(
+            keys=[f"crawl:rate:{domain}"],
+            args=[rate, burst, self.batch_size(rate, burst)]
+        )
+        return int(granted), int(wait_ms)
+
+    def _take_local(self, domain: str) -> bool:
+        with self._lock:
+            tokens, expires_at = self._local.get(domain, (0, 0.0))
+            if tokens <= 0 or time.monotonic() > expires_at:
+                self._local.pop(domain, None)
+                return False
+            self._local[domain] = (tokens - 1, expires_at)
+            return True
+
+    def _store_local(self, domain: str, tokens: int, rate: float) -> None:
+        """
+        Сохранение остатка пачки
+
+        Остаток действителен столько, сколько ведро копило бы эти токены,
+        поэтому неизрасходованная пачка не превращается в всплеск позже.
+        """
+        if tokens <= 0:
+            return
+        with self._lock:
+            self._local[domain] = (tokens, time.monotonic() + tokens / rate)
+
+
+domain_rate_limiter = DomainRateLimiter()
@@ -0,0 +1,256 @@
+"""
+Восстановление прерванных сканирований
+
+Выполняющееся сканирование периодически отмечает heartbeat_at снапшота.
+Снапшот без признаков жизни дольше CRAWLER_STALL_TIMEOUT (или отправленный
+в Celery, но не начатый дольше CRAWLER_DISPATCH_TIMEOUT) считается
+прерванным: reap_stalled_snapshots возобновляет его с тем же ID, пока не
+исчерпаны CRAWLER_MAX_ATTEMPTS попыток, затем завершает с ошибкой и
+удаляет частичные данные.
+
+Возобновление стоит только незавершенной работы: сохранение страниц
+идемпотентно (crawler.persistence), уже сохраненные страницы не
+загружаются повторно. Завершение снапшота (успешное или с ошибкой)
+выполняется ровно один раз - под блокировкой строки и только из
+незавершенного статуса, поэтому опоздавший воркер и reaper не завершат
+снапшот дважды.
+"""
+import logging
+import os
+import shutil
+import time
+from datetime import timedelta
+from typing import Dict, List
+
+from celery.utils import uuid
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from archive.models import ArchiveSnapshot
+from archive.query_cache import SNAPSHOTS_TAG, invalidate_tags, website_tag
+from .submission import ACTIVE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotHeartbeat:
+    """
+    Отметка о том, что сканирование снапшота продолжается (не чаще интервала)
+    """
+
+    def __init__(self, snapshot_id, interval=None, task_id: str = None):
+        """
+        Args:
+            snapshot_id: ID снапшота
+            interval: Минимальный интервал между отметками (секунды)
+            task_id: ID задачи-владельца; если задан, отметка ставится, только
+                     пока снапшот принадлежит этой задаче
+        """
+        self.snapshot_id = snapshot_id
+        self.task_id = task_id
+        self.interval = interval if interval is not None else settings.CRAWLER_HEARTBEAT_INTERVAL
+        self._beat_at = float('-inf')
+
+    def beat(self, force: bool = False) -> bool:
+        """
+        Returns:
+            bool: False, если снапшот уже не в статусе processing или передан
+            другой задаче и работу нужно прекратить (проверяется при каждой отметке)
+        """
+        now = time.monotonic()
+        if not force and now - self._beat_at < self.interval:
+            return True
+        self._beat_at = now
+        return bool(owned_snapshot(self.snapshot_id, self.task_id).filter(status='processing').update(
+            heartbeat_at=timezone.now()
+        ))
+
+
+def owned_snapshot(snapshot_id, task_id: str = None):
+    """
+    Снапшот, если он принадлежит задаче task_id (без task_id - без проверки владельца)
+
+    После возобновления reaper'ом снапшот получает новый task_id, и прежняя
+    задача больше не может ни отмечаться, ни завершать его.
+    """
+    queryset = ArchiveSnapshot.objects.filter(pk=snapshot_id)
+    if task_id:
+        queryset = queryset.filter(task_id=task_id)
+    return queryset
+
+
+def start_attempt(snapshot_id, task_id: str = None) -> bool:
+    """
+    Перевод снапшота в processing в начале (очередной) попытки
+
+    Снапшот сканирует только задача, ID которой записан в снапшоте:
+    после возобновления reaper'ом задача получает новый ID, и опоздавшее
+    прежнее сообщение не запустит второе сканирование того же снапшота.
+    Повторы Celery (retry) сохраняют ID задачи.
+
+    Args:
+        snapshot_id: ID снапшота
+        task_id: ID выполняющейся задачи Celery
+
+    Returns:
+        bool: False, если снапшот уже завершен или принадлежит другой задаче
+    """
+    with transaction.atomic():
+        snapshot = ArchiveSnapshot.objects.select_for_update().filter(
+            pk=snapshot_id, status__in=ACTIVE_STATUSES
+        ).first()
+        if snapshot is None:
+            return False
+        if task_id and snapshot.task_id and snapshot.task_id != task_id:
+            logger.warning(f"Снапшот {snapshot_id} передан задаче {snapshot.task_id}, задача {task_id} пропущена")
+            return False
+        snapshot.status = 'processing'
+        snapshot.heartbeat_at = timezone.now()
+        snapshot.attempts += 1
+        snapshot.save(update_fields=['status', 'heartbeat_at', 'attempts'])
+    return True
+
+
+def finalize_snapshot(snapshot_id, metadata: Dict = None, task_id: str = None) -> bool:
+    """
+    Завершение снапшота: счетчики, метаданные и статус completed
+
+    Args:
+        snapshot_id: ID снапшота
+        metadata: Метаданные сканирования
+        task_id: ID задачи, которая завершает снапшот; снапшот, переданный
+                 другой задаче, не завершается
+
+    Returns:
+        bool: True ровно для одного вызова; остальные получают False
+    """
+    with transaction.atomic():
+        snapshot = owned_snapshot(snapshot_id, task_id).select_for_update().filter(
+            status='processing'
+        ).first()
+        if snapshot is None:
+            return False
+        snapshot.pages_count = snapshot.pages.count()
+        snapshot.assets_count = snapshot.assets.count()
+        if metadata:
+            snapshot.metadata = metadata
+        snapshot.status = 'completed'
+        snapshot.save()
+    return True
+
+
+def fail_snapshot(snapshot_id, reason: str = '', task_id: str = None) -> bool:
+    """
+    Завершение снапшота с ошибкой и удаление частичных данных
+
+    Удаляются сохраненные страницы, ресурсы и директория архива снапшота,
+    чтобы прерванное сканирование не оставляло осиротевших файлов.
+
+    Args:
+        snapshot_id: ID снапшота
+        reason: Причина (для лога)
+        task_id: ID задачи, которая завершает снапшот (reaper передает None)
+
+    Returns:
+        bool: True ровно для одного вызова; остальные получают False
+    """
+    with transaction.atomic():
+        snapshot = owned_snapshot(snapshot_id, task_id).select_for_update().filter(
+            status__in=ACTIVE_STATUSES
+        ).first()
+        if snapshot is None:
+            return False
+        snapshot.pages.all().delete()
+        snapshot.assets.all().delete()
+        snapshot.pages_count = 0
+        snapshot.assets_count = 0
+        snapshot.status = 'failed'
+        snapshot.save()
+
+    archive_dir = os.path.join(settings.ARCHIVE_ROOT, str(snapshot_id))
+    shutil.rmtree(archive_dir, ignore_errors=True)
+    logger.warning(f"Снапшот {snapshot_id} завершен с ошибкой: {reason}")
+    return True
+
+
+def stalled_snapshots(now=None) -> List[ArchiveSnapshot]:
+    """Снапшоты, сканирование которых прервалось"""
+    now = now or timezone.now()
+    stall_cutoff = now - timedelta(seconds=settings.CRAWLER_STALL_TIMEOUT)
+    dispatch_cutoff = now - timedelta(seconds=settings.CRAWLER_DISPATCH_TIMEOUT)
+    candidates = (
+        ArchiveSnapshot.objects
+        .filter(
+            Q(status='processing', heartbeat_at__lt=stall_cutoff)
+            | Q(status='processing', heartbeat_at__isnull=True, snapshot_date__lt=stall_cutoff)
+            | Q(status='pending', dispatched_at__lt=dispatch_cutoff)
+        )
+        .select_related('website')
+    )
+    return [
+        snapshot for snapshot in candidates
+        if snapshot.status != 'processing' or not workers_waiting(snapshot, dispatch_cutoff)
+    ]
+
+
+def workers_waiting(snapshot: ArchiveSnapshot, dispatch_cutoff) -> bool:
+    """
+    Воркеры распределенного сканирования отправлены и ждут слота
+
+    Такой снапшот без heartbeat не прерван: воркеры стоят в очереди Celery
+    за другими сканированиями. Если ожидание дольше CRAWLER_DISPATCH_TIMEOUT,
+    сообщения считаются потерянными.
+    """
+    from .frontier import RedisFrontier
+
+    if not (snapshot.crawl_options or {}).get('distributed'):
+        return False
+    try:
+        queued, queued_at = RedisFrontier(snapshot.pk).waiting_workers()
+    except Exception as e:
+        # Без Redis состояние воркеров неизвестно - не трогаем снапшот
+        logger.warning(f"Состояние воркеров снапшота {snapshot.pk} недоступно: {e}")
+        return True
+    return queued > 0 and queued_at > dispatch_cutoff.timestamp()
+
+
+def resume_snapshot(snapshot: ArchiveSnapshot) -> bool:
+    """
+    Повторная отправка прерванного сканирования с тем же снапшотом
+
+    Слот диспетчера остается за снапшотом, поэтому задача отправляется
+    напрямую, минуя очередь допуска.
+    """
+    from .fair_share import send_crawls
+
+    with transaction.atomic():
+        updated = ArchiveSnapshot.objects.filter(
+            pk=snapshot.pk, status=snapshot.status, attempts=snapshot.attempts
+        ).update(status='pending', dispatched_at=timezone.now(), heartbeat_at=None, task_id=uuid())
+        if not updated:
+            return False
+        snapshot.refresh_from_db()
+        # update() не вызывает post_save: кеш списков снапшотов сбрасывается явно
+        transaction.on_commit(lambda: invalidate_tags(SNAPSHOTS_TAG, website_tag(snapshot.website_id)))
+        transaction.on_commit(lambda: send_crawls([snapshot]))
+    return True
+
+
+def reap_stalled_snapshots(now=None) -> Dict[str, int]:
+    """
+    Возобновление или завершение с ошибкой прерванных сканирований
+
+    Returns:
+        Dict[str, int]: Количество возобновленных и завершенных с ошибкой снапшотов
+    """
+    resumed = failed = 0
+    for snapshot in stalled_snapshots(now):
+        if snapshot.attempts >= settings.CRAWLER_MAX_ATTEMPTS:
+            if fail_snapshot(snapshot.pk, f"сканирование прервано {snapshot.attempts} раз"):
+                failed += 1
+        elif resume_snapshot(snapshot):
+            logger.warning(f"Сканирование снапшота {snapshot.pk} прервано, попытка {snapshot.attempts + 1}")
+            resumed += 1
+    return {'resumed': resumed, 'failed': failed}
@@ -0,0 +1,13 @@
+"""
+Подключение к Redis для координации краулеров
+"""
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=1)
+def get_redis() -> redis.Redis:
+    """Общий для процесса клиент Redis (пул соединений внутри)"""
+    return redis.Redis.from_url(settings.CRAWLER_REDIS_URL)
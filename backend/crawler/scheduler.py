@@ -0,0 +1,234 @@
+"""
+Адаптивное расписание повторного сканирования сайтов
+
+После каждого завершенного снапшота страницы сравниваются с предыдущим
+снапшотом сайта по content_hash. Доля изменившихся страниц за прошедшее
+время дает оценку частоты изменений (изменения считаются пуассоновским
+потоком), которая сглаживается между снапшотами. Интервал выбирается так,
+чтобы к следующему сканированию изменилась примерно доля страниц
+CRAWLER_RECRAWL_CHANGE_TARGET, и ограничивается MIN/MAX интервалом.
+
+Планировщик (schedule_recrawls_task, celery beat) запускает просроченные
+сайты в порядке просрочки в пределах общего бюджета сканирований.
+"""
+import logging
+import math
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from archive.models import ArchiveSnapshot, Website
+from archive.query_cache import WEBSITES_TAG, invalidate_tags, website_tag
+from .fair_share import IN_FLIGHT, WAITING
+from .queues import PRIORITY_SCHEDULED_CRAWL, RECRAWL_QUEUE
+from .submission import ACTIVE_STATUSES, CrawlRequest, submit_crawls
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def snapshot_hashes(snapshot: ArchiveSnapshot) -> Dict[str, str]:
+    """URL -> content_hash страниц снапшота"""
+    return dict(snapshot.pages.values_list('url', 'content_hash'))
+
+
+def count_changes(previous: Dict[str, str], current: Dict[str, str]) -> Tuple[int, int]:
+    """
+    Количество изменившихся страниц между двумя снапшотами
+
+    Появившиеся и исчезнувшие страницы тоже считаются изменениями.
+
+    Returns:
+        Tuple[int, int]: (изменилось, всего страниц в объединении)
+    """
+    urls = previous.keys() | current.keys()
+    changed = sum(1 for url in urls if previous.get(url) != current.get(url))
+    return changed, len(urls)
+
+
+def estimate_change_rate(changed: int, total: int, elapsed: float) -> float:
+    """
+    Оценка частоты изменений страницы (изменений в сутки)
+
+    Оценка для пуассоновского потока изменений, наблюдаемого только как
+    "изменилась / не изменилась" за интервал: -ln((n - X + 0.5) / (n + 0.5)) / I.
+    Поправка 0.5 оставляет оценку конечной, когда изменились все страницы.
+
+    Args:
+        changed: Количество изменившихся страниц (X)
+        total: Количество сравненных страниц (n)
+        elapsed: Время между снапшотами (секунды, I)
+    """
+    if total <= 0 or elapsed <= 0:
+        return 0.0
+    rate_per_second = -math.log((total - changed + 0.5) / (total + 0.5)) / elapsed
+    return rate_per_second * SECONDS_PER_DAY
+
+
+def interval_for_rate(change_rate: Optional[float]) -> int:
+    """
+    Интервал сканирования (секунды) для частоты изменений в сутки
+
+    К моменту сканирования страница изменится с вероятностью
+    CRAWLER_RECRAWL_CHANGE_TARGET: 1 - exp(-rate * T) = target.
+    """
+    if change_rate is None:
+        return settings.CRAWLER_RECRAWL_DEFAULT_INTERVAL
+    if change_rate <= 0:
+        return settings.CRAWLER_RECRAWL_MAX_INTERVAL
+    target = min(max(settings.CRAWLER_RECRAWL_CHANGE_TARGET, 0.01), 0.99)
+    interval = -math.log(1 - target) / change_rate * SECONDS_PER_DAY
+    return int(min(max(interval, settings.CRAWLER_RECRAWL_MIN_INTERVAL), settings.CRAWLER_RECRAWL_MAX_INTERVAL))
+
+
+def record_snapshot_changes(snapshot: ArchiveSnapshot) -> int:
+    """
+    Обновление частоты изменений и расписания сайта по завершенному снапшоту
+
+    Вызывается для любых завершенных снапшотов, ручных и плановых.
+
+    Args:
+        snapshot: Завершенный снапшот
+
+    Returns:
+        int: Новый интервал сканирования (секунды)
+    """
+    website = snapshot.website
+    previous = (
+        ArchiveSnapshot.objects
+        .filter(website=website, status='completed', snapshot_date__lt=snapshot.snapshot_date)
+        .order_by('-snapshot_date')
+        .first()
+    )
+
+    change_rate = website.change_rate
+    if previous is not None:
+        changed, total = count_changes(snapshot_hashes(previous), snapshot_hashes(snapshot))
+        elapsed = (snapshot.snapshot_date - previous.snapshot_date).total_seconds()
+        if total and elapsed > 0:
+            observed = estimate_change_rate(changed, total, elapsed)
+            alpha = settings.CRAWLER_RECRAWL_SMOOTHING
+            change_rate = observed if change_rate is None else alpha * observed + (1 - alpha) * change_rate
+            logger.info(
+                f"{website.url}: изменилось {changed} из {total} страниц за {elapsed / 3600:.1f} ч, "
+                f"частота изменений {change_rate:.3f} в сутки"
+            )
+
+    interval = interval_for_rate(change_rate)
+    Website.objects.filter(pk=website.pk).update(
+        change_rate=change_rate,
+        recrawl_interval=interval,
+        next_crawl_at=snapshot.snapshot_date + timedelta(seconds=interval)
+    )
+    # update() не вызывает post_save: кеш списков сайтов сбрасывается явно
+    invalidate_tags(WEBSITES_TAG, website_tag(website.pk))
+    return interval
+
+
+def crawl_budget(now=None) -> int:
+    """
+    Сколько сканирований можно запустить сейчас
+
+    Ограничения: CRAWLER_RECRAWL_MAX_ACTIVE одновременно идущих
+    сканирований и CRAWLER_RECRAWL_BUDGET_PER_HOUR начатых за час.
+    Ручные сканирования расходуют тот же бюджет. Учитываются допущенные
+    в Celery сканирования (fair_share.IN_FLIGHT) и плановые, которые еще
+    ждут допуска: диспетчер бюджет не проверяет, поэтому он соблюдается
+    при создании снапшотов. Ручные заявки, ожидающие допуска, воркеры не
+    занимают, и массовая ручная отправка не останавливает повторные
+    сканирования.
+    """
+    now = now or timezone.now()
+    scheduled_waiting = ArchiveSnapshot.objects.filter(WAITING, crawl_options__queue=RECRAWL_QUEUE).count()
+    active = ArchiveSnapshot.objects.filter(IN_FLIGHT).count() + scheduled_waiting
+    started = (
+        ArchiveSnapshot.objects.filter(dispatched_at__gte=now - timedelta(hours=1)).count()
+        + scheduled_waiting
+    )
+    return max(0, min(
+        settings.CRAWLER_RECRAWL_MAX_ACTIVE - active,
+        settings.CRAWLER_RECRAWL_BUDGET_PER_HOUR - started
+    ))
+
+
+def due_websites(limit: int, now=None) -> List[Website]:
+    """
+    Активные сайты, которым пора на сканирование, самые просроченные первыми
+
+    Сайты с уже идущим сканированием пропускаются.
+    """
+    if limit <= 0:
+        return []
+    now = now or timezone.now()
+    return list(
+        Website.objects
+        .filter(is_active=True, next_crawl_at__lte=now)
+        .exclude(snapshots__status__in=ACTIVE_STATUSES)
+        .order_by('next_crawl_at')
+        .distinct()[:limit]
+    )
+
+
+def initialize_schedules(now=None) -> int:
+    """
+    Расписание для сайтов, которые еще не планировались
+
+    Первое плановое сканирование - через интервал по умолчанию после
+    последнего снапшота (или сразу, если снапшотов нет).
+    """
+    now = now or timezone.now()
+    initialized = []
+    for website in Website.objects.filter(is_active=True, next_crawl_at__isnull=True):
+        latest = website.snapshots.filter(status='completed').order_by('-snapshot_date').first()
+        interval = interval_for_rate(website.change_rate)
+        next_crawl_at = latest.snapshot_date + timedelta(seconds=interval) if latest else now
+        if Website.objects.filter(pk=website.pk, next_crawl_at__isnull=True).update(
+            recrawl_interval=interval,
+            next_crawl_at=next_crawl_at
+        ):
+            initialized.append(website.pk)
+    if initialized:
+        invalidate_tags(WEBSITES_TAG, *(website_tag(pk) for pk in initialized))
+    return len(initialized)
+
+
+def schedule_recrawls(now=None) -> List[str]:
+    """
+    Запуск сканирований просроченных сайтов в пределах бюджета
+
+    Сканирования ставятся в очередь recrawl с приоритетом плановых и сразу
+    создают снапшот в статусе pending, поэтому учитываются в бюджете и не
+    дублируются до начала выполнения.
+
+    Args:
+        now: Текущее время
+
+    Returns:
+        List[str]: ID сайтов, отправленных на сканирование
+    """
+    now = now or timezone.now()
+    initialize_schedules(now)
+
+    requests = []
+    rescheduled = []
+    for website in due_websites(crawl_budget(now), now):
+        # Сдвигаем срок до постановки в очередь, чтобы параллельный запуск
+        # планировщика не отправил сайт повторно; по завершении снапшота
+        # record_snapshot_changes установит срок по новой оценке
+        interval = website.recrawl_interval or interval_for_rate(website.change_rate)
+        updated = Website.objects.filter(pk=website.pk, next_crawl_at=website.next_crawl_at).update(
+            next_crawl_at=now + timedelta(seconds=interval)
+        )
+        if updated:
+            rescheduled.append(website_tag(website.pk))
+            requests.append(CrawlRequest(website, queue=RECRAWL_QUEUE, priority=PRIORITY_SCHEDULED_CRAWL))
+    if rescheduled:
+        invalidate_tags(WEBSITES_TAG, *rescheduled)
+
+    scheduled = [submission.website_id for submission in submit_crawls(requests) if not submission.coalesced]
+    if scheduled:
+        logger.info(f"Запланировано повторное сканирование {len(scheduled)} сайтов")
+    return scheduled
@@ -1,32 +1,21 @@
 """
-Современный веб-краулер с использованием Scrapling
-Поддерживает обход блокировок и извлечение контента для архивации
+Современный веб-краулер для архивации
+Страницы загружаются многоуровнево (crawler.fetcher): обычный HTTP, а для
+хостов с блокировками и JS-оболочками - headless браузер через Scrapling
 """
 import asyncio
 import logging
-from typing import List, Dict, Optional, Set, Tuple
+from collections import Counter
+from typing import Callable, List, Dict, Mapping, Optional, Set, Tuple
 from urllib.parse import urljoin, urlparse, parse_qs
 from pathlib import Path
 import hashlib
 import mimetypes
 import re
 
-try:
-    from scrapling import Adaptor
-except ImportError:
-    # Fallback для тестирования
-    class Adaptor:
-        def __init__(self, *args, **kwargs):
-            pass
-        def get(self, url, **kwargs):
-            return MockResponse()
+from asgiref.sync import sync_to_async
 
-class MockResponse:
-    def __init__(self):
-        self.text = "<html><body>Mock content</body></html>"
-        self.content = b"Mock content"
-        self.status_code = 200
-        self.headers = {}
+from .fetcher import TieredFetcher, tiered_fetcher
 
 logger = logging.getLogger(__name__)
 
@@ -42,7 +31,10 @@ class WebArchiveCrawler:
                  delay: float = 1.0,
                  timeout: int = 30,
                  proxy_list: Optional[List[str]] = None,
-                 user_agent: Optional[str] = None):
+                 user_agent: Optional[str] = None,
+                 progress=None,
+                 rate_limiter=None,
+                 fetcher: Optional[TieredFetcher] = None):
         """
         Инициализация краулера
         
@@ -53,24 +45,23 @@ class WebArchiveCrawler:
             timeout: Таймаут запроса (секунды)
             proxy_list: Список прокси серверов
             user_agent: Пользовательский User-Agent
+            progress: Счетчики прогресса (CrawlProgress) для публикации состояния
+            rate_limiter: Общий ограничитель частоты запросов к домену (DomainRateLimiter);
+                          если задан, заменяет локальную задержку delay
+            fetcher: Многоуровневый загрузчик страниц (по умолчанию общий для процесса)
         """
         self.max_depth = max_depth
         self.max_pages = max_pages
         self.delay = delay
         self.timeout = timeout
         self.proxy_list = proxy_list or []
+        self.progress = progress
+        self.rate_limiter = rate_limiter
         
-        # Настройка Scrapling адаптера
-        adaptor_config = {
-            'auto_match': True,  # Автоматическое определение блокировок
-            'stealth': True,     # Режим скрытности
-            'debug': False
-        }
-        
-        if user_agent:
-            adaptor_config['headers'] = {'User-Agent': user_agent}
-            
-        self.adaptor = Adaptor(**adaptor_config)
+        # Загрузчик: HTTP по умолчанию, браузер только для хостов, которым он нужен
+        if fetcher is None and (user_agent or self.proxy_list):
+            fetcher = TieredFetcher(user_agent=user_agent, proxy=self.proxy_list[0] if self.proxy_list else None)
+        self.fetcher = fetcher or tiered_fetcher
         
         # Состояние краулера
         self.visited_urls: Set[str] = set()
@@ -182,43 +173,16 @@ class WebArchiveCrawler:
         try:
             logger.info(f"Crawling: {url}")
             
-            # Выполняем запрос через Scrapling
-            response = self.adaptor.get(url, timeout=self.timeout)
+            # Токен ограничителя берется перед каждой попыткой, включая эскалацию
+            response = self.fetcher.fetch(url, timeout=self.timeout, rate_limiter=self.rate_limiter)
             
             if response.status_code != 200:
-                logger.warning(f"HTTP {response.status_code} for {url}")
+                logger.warning(f"HTTP {response.status_code} for {url} ({response.tier})")
                 return None
             
-            # Извлекаем контент и метаданные
-            html_content = response.text
-            content_hash = hashlib.sha256(html_content.encode()).hexdigest()
-            
-            # Извлекаем заголовок страницы
-            title_match = re.search(r'<title[^>]*>([^<]+)</title>', html_content, re.IGNORECASE)
-            title = title_match.group(1).strip() if title_match else ""
-            
-            # Извлекаем мета описание
-            meta_desc_match = re.search(r'<meta[^>]+name=["\']description["\'][^>]+content=["\']([^"\']+)["\'][^>]*>', 
-                                       html_content, re.IGNORECASE)
-            description = meta_desc_match.group(1).strip() if meta_desc_match else ""
-            
-            # Извлекаем ссылки и ресурсы
-            links = self.extract_links(html_content, url)
-            assets = self.extract_assets(html_content, url)
-            
-            page_data = {
-                'url': url,
-                'title': title,
-                'description': description,
-                'html_content': html_content,
-                'content_hash': content_hash,
-                'links': links,
-                'assets': assets,
-                'status_code': response.status_code,
-                'headers': dict(response.headers),
-                'size': len(html_content.encode('utf-8'))
-            }
-            
+            page_data = self.parse_page(url, response.text, response.status_code, response.headers)
+            page_data['fetch_tier'] = response.tier
+            page_data['screenshot'] = response.screenshot
             return page_data
             
         except Exception as e:
@@ -231,12 +195,52 @@ class WebArchiveCrawler:
             logger.error(f"Error crawling {url}: {e}")
             return None
     
-    async def crawl_website(self, start_url: str) -> Dict:
+    def parse_page(self, url: str, html_content: str, status_code: int = 200,
+                   headers: Optional[Dict] = None) -> Dict:
+        """Извлечение метаданных, ссылок и ресурсов из HTML страницы"""
+        content_hash = hashlib.sha256(html_content.encode()).hexdigest()
+        
+        # Извлекаем заголовок страницы
+        title_match = re.search(r'<title[^>]*>([^<]+)</title>', html_content, re.IGNORECASE)
+        title = title_match.group(1).strip() if title_match else ""
+        
+        # Извлекаем мета описание
+        meta_desc_match = re.search(r'<meta[^>]+name=["\']description["\'][^>]+content=["\']([^"\']+)["\'][^>]*>', 
+                                   html_content, re.IGNORECASE)
+        description = meta_desc_match.group(1).strip() if meta_desc_match else ""
+        
+        # Извлекаем ссылки и ресурсы
+        links = self.extract_links(html_content, url)
+        assets = self.extract_assets(html_content, url)
+        
+        page_data = {
+            'url': url,
+            'title': title,
+            'description': description,
+            'html_content': html_content,
+            'content_hash': content_hash,
+            'links': links,
+            'assets': assets,
+            'status_code': status_code,
+            'headers': headers or {},
+            'size': len(html_content.encode('utf-8'))
+        }
+        
+        return page_data
+    
+    async def crawl_website(self, start_url: str, follow_external: bool = False,
+                            on_page: Optional[Callable[[Dict], None]] = None,
+                            archived: Optional[Mapping[str, str]] = None) -> Dict:
         """
         Асинхронное сканирование сайта
         
         Args:
             start_url: Начальный URL для сканирования
+            follow_external: Следовать ли за ссылками на другие домены
+            on_page: Вызывается для каждой загруженной страницы (сохранение по ходу сканирования)
+            archived: Уже сохраненные страницы {url: html} при возобновлении (любой
+                      Mapping, например crawler.persistence.SavedPages); они не
+                      загружаются повторно, но их ссылки обходятся как обычно
             
         Returns:
             Словарь с результатами сканирования
@@ -251,8 +255,13 @@ class WebArchiveCrawler:
         # Очередь URL для обработки
         url_queue = [(start_url, 0)]  # (url, depth)
         base_domain = urlparse(start_url).netloc
+        bytes_fetched = 0
+        archived = archived or {}
         
         while url_queue and len(self.crawled_pages) < self.max_pages:
+            if self.progress is not None and self.progress.stopped:
+                logger.warning(f"Crawl of {start_url} stopped")
+                break
             current_url, depth = url_queue.pop(0)
             
             # Проверяем ограничения
@@ -261,8 +270,23 @@ class WebArchiveCrawler:
             
             self.visited_urls.add(current_url)
             
-            # Загружаем страницу
-            page_data = self.fetch_page(current_url)
+            # Загружаем страницу (сохраненную ранее - только разбираем)
+            if current_url in archived:
+                # Контент может читаться и расшифровываться из БД - вне event loop
+                html_content = await sync_to_async(archived.__getitem__)(current_url)
+                page_data = self.parse_page(current_url, html_content)
+                # Страница уже в архиве: для обхода и статистики HTML не нужен
+                page_data.pop('html_content')
+            else:
+                # Синхронная загрузка (HTTP, Playwright) - вне event loop
+                page_data = await asyncio.to_thread(self.fetch_page, current_url)
+                if page_data:
+                    bytes_fetched += page_data['size']
+                    if on_page is not None:
+                        # Сохранение работает с БД - вне event loop
+                        await sync_to_async(on_page)(page_data)
+                    # Скриншот уже сохранен, не держим его в памяти до конца сканирования
+                    page_data.pop('screenshot', None)
             if page_data:
                 self.crawled_pages.append(page_data)
                 
@@ -270,11 +294,19 @@ class WebArchiveCrawler:
                 if depth < self.max_depth:
                     for link in page_data['links']:
                         if (link not in self.visited_urls and 
-                            self.is_same_domain(link, base_domain)):
+                            (follow_external or self.is_same_domain(link, base_domain))):
                             url_queue.append((link, depth + 1))
             
-            # Задержка между запросами
-            if self.delay > 0:
+            if self.progress is not None:
+                await sync_to_async(self.progress.update)(
+                    pages_fetched=len(self.crawled_pages),
+                    queue_size=len(url_queue),
+                    bytes_fetched=bytes_fetched,
+                    errors=len(self.errors)
+                )
+            
+            # Задержка между запросами (при общем ограничителе не нужна)
+            if self.delay > 0 and self.rate_limiter is None and current_url not in archived:
                 await asyncio.sleep(self.delay)
         
         # Формируем результат
@@ -292,7 +324,10 @@ class WebArchiveCrawler:
                     sum(len(assets) for assets in page['assets'].values()) 
                     for page in self.crawled_pages
                 ),
-                'avg_page_size': sum(page['size'] for page in self.crawled_pages) // max(1, len(self.crawled_pages))
+                'avg_page_size': sum(page['size'] for page in self.crawled_pages) // max(1, len(self.crawled_pages)),
+                'fetch_tiers': dict(Counter(
+                    page['fetch_tier'] for page in self.crawled_pages if 'fetch_tier' in page
+                ))
             }
         }
         
@@ -307,7 +342,9 @@ class WebArchiveCrawler:
             Кортеж (content, content_type) или None при ошибке
         """
         try:
-            response = self.adaptor.get(asset_url, timeout=self.timeout)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(asset_url)
+            response = self.fetcher.download(asset_url, timeout=self.timeout)
             
             if response.status_code == 200:
                 content_type = response.headers.get('content-type', 
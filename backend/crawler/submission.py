@@ -0,0 +1,141 @@
+"""
+Постановка сканирований в очередь с объединением повторных запросов
+
+Все запуски сканирования (одиночный, пакетный, плановый) проходят через
+submit_crawls. Для сайта, у которого уже есть снапшот в статусе pending
+или processing, новое сканирование не создается: возвращается задача
+существующего. Проверка и создание снапшота выполняются под блокировкой
+строк сайтов, поэтому двойной клик не запускает два сканирования.
+
+Созданные снапшоты ждут допуска диспетчером (crawler.fair_share), который
+распределяет отправку в Celery между пользователями.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from celery.utils import uuid
+from django.db import transaction
+
+from archive.models import ArchiveSnapshot, Website
+from archive.query_cache import SNAPSHOTS_TAG, invalidate_tags, website_tag
+from .fair_share import try_dispatch_crawls
+from .queues import CRAWL_QUEUE, PRIORITY_USER_CRAWL
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('pending', 'processing')
+
+
+@dataclass
+class CrawlRequest:
+    """
+    Запрос на сканирование одного сайта
+    """
+    website: Website
+    crawl_depth: Optional[int] = None
+    follow_external: bool = False
+    distributed: bool = False
+    workers: Optional[int] = None
+    priority: int = PRIORITY_USER_CRAWL
+    queue: str = CRAWL_QUEUE
+
+
+@dataclass
+class CrawlSubmission:
+    """
+    Результат постановки: новый или уже идущий снапшот сайта
+    """
+    website_id: str
+    snapshot_id: str
+    task_id: str
+    coalesced: bool
+
+    def as_dict(self):
+        return {
+            'website_id': self.website_id,
+            'snapshot_id': self.snapshot_id,
+            'task_id': self.task_id,
+            'status': 'coalesced' if self.coalesced else 'queued',
+        }
+
+
+def submit_crawl(request: CrawlRequest) -> CrawlSubmission:
+    """Постановка одного сканирования (см. submit_crawls)"""
+    return submit_crawls([request])[0]
+
+
+def submit_crawls(requests: Iterable[CrawlRequest]) -> List[CrawlSubmission]:
+    """
+    Постановка сканирований сайтов в очередь
+
+    Снапшоты создаются сразу в статусе pending с заранее выданным ID
+    задачи и параметрами сканирования; после фиксации транзакции
+    диспетчер отправляет в брокер те, для которых есть слоты.
+
+    Args:
+        requests: Запросы на сканирование (повторы одного сайта объединяются)
+
+    Returns:
+        List[CrawlSubmission]: Результат для каждого запроса, в том же порядке
+    """
+    requests = list(requests)
+    website_ids = {request.website.pk for request in requests}
+
+    with transaction.atomic():
+        # Блокировка в порядке pk, чтобы параллельные пакеты не взаимоблокировались
+        list(Website.objects.select_for_update().filter(pk__in=website_ids).order_by('pk').values_list('pk'))
+
+        active = {}
+        for snapshot in (
+            ArchiveSnapshot.objects
+            .filter(website_id__in=website_ids, status__in=ACTIVE_STATUSES)
+            .order_by('snapshot_date')
+        ):
+            active.setdefault(snapshot.website_id, snapshot)
+
+        submissions = []
+        new_snapshots = []
+        for request in requests:
+            website_id = request.website.pk
+            snapshot = active.get(website_id)
+            if snapshot is not None:
+                submissions.append(CrawlSubmission(
+                    str(website_id), str(snapshot.pk), snapshot.task_id, coalesced=True
+                ))
+                continue
+
+            snapshot = ArchiveSnapshot(
+                website=request.website,
+                status='pending',
+                task_id=uuid(),
+                priority=request.priority,
+                crawl_options={
+                    'crawl_depth': request.crawl_depth,
+                    'follow_external': request.follow_external,
+                    'distributed': request.distributed,
+                    'workers': request.workers,
+                    'queue': request.queue,
+                }
+            )
+            active[website_id] = snapshot
+            new_snapshots.append(snapshot)
+            submissions.append(CrawlSubmission(
+                str(website_id), str(snapshot.pk), snapshot.task_id, coalesced=False
+            ))
+
+        ArchiveSnapshot.objects.bulk_create(new_snapshots)
+        if new_snapshots:
+            # bulk_create не вызывает post_save: кеш списков снапшотов (и списка
+            # сайтов, зависящего от тега снапшотов) сбрасывается явно
+            transaction.on_commit(lambda: invalidate_tags(
+                SNAPSHOTS_TAG, *{website_tag(snapshot.website_id) for snapshot in new_snapshots}
+            ))
+            transaction.on_commit(try_dispatch_crawls)
+
+    if new_snapshots:
+        logger.info(
+            f"Поставлено сканирований: {len(new_snapshots)}, объединено с идущими: {len(requests) - len(new_snapshots)}"
+        )
+    return submissions
+
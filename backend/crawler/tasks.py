@@ -3,148 +3,159 @@ Celery задачи для фонового краулинга
 """
 import asyncio
 import os
+import time
+from urllib.parse import urlparse
 from celery import shared_task
+from celery.signals import worker_process_shutdown
 from django.utils import timezone
 from django.conf import settings
-from archive.models import Website, ArchiveSnapshot, ArchivedPage, ArchivedAsset
+from archive.models import Website, ArchiveSnapshot, ArchivedAsset
 from encryption.file_encryption import ArchiveFileEncryption
+from .browser_pool import browser_pool
+from .fair_share import dispatch_crawls, try_dispatch_crawls
+from .fetcher import tiered_fetcher
+from .frontier import IDLE_POLL_INTERVAL, RedisFrontier
+from .persistence import SavedPages, persist_page
+from .progress import CrawlProgress
+from .rate_limit import domain_rate_limiter
+from .recovery import (
+    SnapshotHeartbeat, fail_snapshot, finalize_snapshot, reap_stalled_snapshots, start_attempt
+)
+from .scheduler import record_snapshot_changes, schedule_recrawls
 from .scrapling_crawler import WebArchiveCrawler
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@worker_process_shutdown.connect
+def close_browser_pool(**kwargs):
+    """Закрытие браузера пула вместе с процессом воркера"""
+    browser_pool.close()
+
+
 @shared_task(bind=True)
-def crawl_website_task(self, website_id: str, crawl_depth: int = 3, follow_external: bool = False):
+def crawl_website_task(self, website_id: str, crawl_depth: int = 3, follow_external: bool = False,
+                       snapshot_id: str = None):
     """
     Фоновая задача для сканирования веб-сайта
     
+    Страницы сохраняются по мере загрузки. При повторе (retry или
+    возобновление reaper'ом) с тем же snapshot_id уже сохраненные страницы
+    не загружаются заново, а только разбираются для обхода ссылок.
+    
     Args:
         website_id: ID веб-сайта
         crawl_depth: Глубина сканирования
         follow_external: Следовать ли за внешними ссылками
+        snapshot_id: Заранее созданный снапшот в статусе pending (иначе создается новый)
         
     Returns:
         dict: Результаты сканирования
     """
+    snapshot = None
     try:
         # Получаем веб-сайт
         website = Website.objects.get(id=website_id)
         
-        # Создаем снапшот
-        snapshot = ArchiveSnapshot.objects.create(
-            website=website,
-            status='processing'
-        )
+        # Создаем снапшот или продолжаем созданный при постановке в очередь
+        if snapshot_id:
+            if not start_attempt(snapshot_id, self.request.id):
+                return {'status': 'skipped', 'message': 'Снапшот не найден или уже завершен'}
+            snapshot = ArchiveSnapshot.objects.get(id=snapshot_id, website=website)
+        else:
+            snapshot = ArchiveSnapshot.objects.create(
+                website=website,
+                status='processing',
+                task_id=self.request.id or '',
+                heartbeat_at=timezone.now(),
+                attempts=1
+            )
         
-        logger.info(f"Начинаем сканирование {website.url}")
+        # Страницы, сохраненные предыдущими попытками (расшифровываются по мере обхода)
+        archived = SavedPages(snapshot)
+        if archived:
+            logger.info(f"Возобновляем сканирование {website.url}: уже сохранено {len(archived)} страниц")
+        else:
+            logger.info(f"Начинаем сканирование {website.url}")
+        
+        # Прогресс публикуется в состояние задачи (PROGRESS), признак жизни - в снапшот.
+        # Если reaper передал снапшот другой задаче или завершил его, отметка
+        # не проходит и сканирование останавливается
+        heartbeat = SnapshotHeartbeat(snapshot.id, task_id=self.request.id)
+        progress = CrawlProgress(self, max_pages=settings.CRAWLER_MAX_PAGES, heartbeat=heartbeat)
+        progress.update(force=True, pages_saved=len(archived))
+        
+        # Создаем зашифрованное хранилище
+        encryption = ArchiveFileEncryption()
+        archive_dir = encryption.create_secure_archive_directory(str(snapshot.id))
+        
+        def save_page(page_data):
+            # Не пишем страницы в снапшот, который уже не принадлежит задаче
+            if not heartbeat.beat(force=True):
+                progress.stopped = True
+                return
+            try:
+                if persist_page(snapshot, page_data, encryption, archive_dir):
+                    progress.pages_saved += 1
+            except Exception as e:
+                logger.error(f"Ошибка сохранения страницы {page_data['url']}: {str(e)}")
+                progress.errors += 1
         
         # Создаем краулер
         crawler = WebArchiveCrawler(
             max_depth=crawl_depth,
             max_pages=settings.CRAWLER_MAX_PAGES,
-            delay=settings.CRAWLER_DELAY
+            delay=settings.CRAWLER_DELAY,
+            progress=progress,
+            rate_limiter=domain_rate_limiter
         )
         
         # Запускаем сканирование в event loop
+        started_at = time.monotonic()
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         
         try:
             results = loop.run_until_complete(
-                crawler.crawl_website(website.url, follow_external)
+                crawler.crawl_website(website.url, follow_external, on_page=save_page, archived=archived)
             )
         finally:
             loop.close()
         
-        # Создаем зашифрованное хранилище
-        encryption = ArchiveFileEncryption()
-        archive_dir = encryption.create_secure_archive_directory(str(snapshot.id))
-        
-        # Сохраняем страницы
-        pages_saved = 0
-        for page_data in results['pages']:
-            try:
-                # Сохраняем зашифрованную страницу
-                file_path = encryption.save_encrypted_page(
-                    archive_dir,
-                    page_data['url'],
-                    page_data['content'],
-                    str(page_data['timestamp'])
-                )
-                
-                # Создаем запись в БД
-                archived_page = ArchivedPage.objects.create(
-                    snapshot=snapshot,
-                    url=page_data['url'],
-                    title=page_data['title'][:500],  # Ограничиваем длину
-                    content_size=page_data['content_size'],
-                    content_hash=page_data['content_hash']
-                )
-                
-                # Устанавливаем зашифрованный контент через property
-                archived_page.content = page_data['content']
-                archived_page.save()
-                
-                pages_saved += 1
-                
-            except Exception as e:
-                logger.error(f"Ошибка сохранения страницы {page_data['url']}: {str(e)}")
-        
-        # Сохраняем ресурсы
-        assets_saved = 0
-        for asset_data in results['assets']:
-            try:
-                # Определяем тип ресурса
-                asset_type = asset_data['type']
-                if asset_type == 'image':
-                    asset_type_db = 'image'
-                elif asset_type == 'css':
-                    asset_type_db = 'css'
-                elif asset_type == 'js':
-                    asset_type_db = 'js'
-                else:
-                    asset_type_db = 'other'
-                
-                # Создаем запись о ресурсе
-                ArchivedAsset.objects.create(
-                    snapshot=snapshot,
-                    url=asset_data['url'],
-                    asset_type=asset_type_db,
-                    file_path='',  # Будет заполнено при скачивании ресурса
-                    file_size=0
-                )
-                
-                assets_saved += 1
-                
-            except Exception as e:
-                logger.error(f"Ошибка сохранения ресурса {asset_data['url']}: {str(e)}")
+        if progress.stopped:
+            logger.warning(f"Снапшот {snapshot.id} завершен или передан другой задаче, сканирование остановлено")
+            return {'status': 'skipped', 'snapshot_id': str(snapshot.id), 'message': 'Снапшот передан другой задаче'}
         
-        # Сохраняем метаданные
+        # Сохраняем метаданные и завершаем снапшот (ровно один раз)
         metadata = {
-            'crawl_settings': results['settings'],
-            'crawl_time': results['crawl_time'],
-            'start_url': results['start_url'],
-            'base_domain': results['base_domain']
+            'crawl_settings': {
+                'max_depth': crawl_depth,
+                'max_pages': settings.CRAWLER_MAX_PAGES,
+                'follow_external': follow_external,
+            },
+            'crawl_time': round(time.monotonic() - started_at, 1),
+            'start_url': website.url,
+            'base_domain': urlparse(website.url).netloc,
+            'crawl_stats': results['crawl_stats'],
+            'errors_count': results['errors_count'],
+            'resumed_pages': len(archived)
         }
+        if not finalize_snapshot(snapshot.id, metadata, task_id=self.request.id):
+            return {'status': 'skipped', 'snapshot_id': str(snapshot.id), 'message': 'Снапшот уже завершен'}
         
-        encrypted_metadata = encryption.encrypt_archive_metadata(metadata)
+        snapshot.refresh_from_db()
+        update_recrawl_schedule(snapshot)
+        try_dispatch_crawls()
         
-        # Обновляем снапшот
-        snapshot.status = 'completed'
-        snapshot.pages_count = pages_saved
-        snapshot.assets_count = assets_saved
-        snapshot._encrypted_metadata = encrypted_metadata
-        snapshot.save()
-        
-        logger.info(f"Сканирование завершено: {pages_saved} страниц, {assets_saved} ресурсов")
+        logger.info(f"Сканирование завершено: {snapshot.pages_count} страниц, {snapshot.assets_count} ресурсов")
         
         return {
             'status': 'completed',
             'snapshot_id': str(snapshot.id),
-            'pages_count': pages_saved,
-            'assets_count': assets_saved,
-            'crawl_time': results['crawl_time']
+            'pages_count': snapshot.pages_count,
+            'assets_count': snapshot.assets_count,
+            'crawl_time': metadata['crawl_time']
         }
         
     except Website.DoesNotExist:
@@ -153,17 +164,217 @@ def crawl_website_task(self, website_id: str, crawl_depth: int = 3, follow_exter
         
     except Exception as e:
         logger.error(f"Ошибка сканирования: {str(e)}")
+        if snapshot is None:
+            return {'status': 'error', 'message': str(e)}
         
-        # Обновляем статус снапшота при ошибке
-        try:
-            snapshot.status = 'failed'
-            snapshot.save()
-        except:
-            pass
-            
+        # Повтор с тем же снапшотом продолжит с несохраненных страниц
+        snapshot.refresh_from_db(fields=['attempts'])
+        if snapshot.attempts < settings.CRAWLER_MAX_ATTEMPTS:
+            raise self.retry(
+                args=(website_id, crawl_depth, follow_external, str(snapshot.id)),
+                exc=e,
+                countdown=settings.CRAWLER_RETRY_DELAY,
+                max_retries=None
+            )
+        
+        fail_snapshot(snapshot.id, str(e), task_id=self.request.id)
+        try_dispatch_crawls()
         return {'status': 'error', 'message': str(e)}
 
 
+def update_recrawl_schedule(snapshot: ArchiveSnapshot) -> None:
+    """Пересчет расписания сайта по завершенному снапшоту (ошибка не срывает сканирование)"""
+    try:
+        record_snapshot_changes(snapshot)
+    except Exception as e:
+        logger.error(f"Ошибка обновления расписания сайта {snapshot.website_id}: {str(e)}")
+
+
+@shared_task(bind=True)
+def start_distributed_crawl_task(self, website_id: str, crawl_depth: int = 3, follow_external: bool = False,
+                                 workers: int = None, snapshot_id: str = None):
+    """
+    Координатор распределенного сканирования одного сайта
+    
+    Создает снапшот, очередь URL в Redis со стартовым URL и запускает
+    воркеры crawl_frontier_worker_task. Снапшот завершает тот воркер,
+    который обработал последний URL очереди. При возобновлении прерванного
+    снапшота очередь в Redis сохраняется и воркеры продолжают с нее.
+    
+    Args:
+        website_id: ID веб-сайта
+        crawl_depth: Глубина сканирования
+        follow_external: Следовать ли за внешними ссылками
+        workers: Количество воркеров (по умолчанию CRAWLER_DISTRIBUTED_WORKERS)
+        snapshot_id: Заранее созданный снапшот в статусе pending (иначе создается новый)
+        
+    Returns:
+        dict: ID снапшота и количество запущенных воркеров
+    """
+    try:
+        website = Website.objects.get(id=website_id)
+    except Website.DoesNotExist:
+        logger.error(f"Веб-сайт {website_id} не найден")
+        return {'status': 'error', 'message': 'Веб-сайт не найден'}
+    
+    workers = workers or settings.CRAWLER_DISTRIBUTED_WORKERS
+    if snapshot_id:
+        if not start_attempt(snapshot_id, self.request.id):
+            return {'status': 'skipped', 'message': 'Снапшот не найден или уже завершен'}
+        snapshot = ArchiveSnapshot.objects.get(id=snapshot_id, website=website)
+    else:
+        snapshot = ArchiveSnapshot.objects.create(
+            website=website,
+            status='processing',
+            task_id=self.request.id or '',
+            heartbeat_at=timezone.now(),
+            attempts=1,
+            crawl_options={
+                'crawl_depth': crawl_depth,
+                'follow_external': follow_external,
+                'distributed': True,
+                'workers': workers,
+            }
+        )
+    
+    frontier = RedisFrontier(snapshot.id)
+    if frontier.exists():
+        # Возобновление: URL, которые обрабатывали прежние воркеры, возвращаются в очередь
+        workers = frontier.meta().get('workers') or workers
+        if frontier.requeue_processing() == 0:
+            if frontier.claim_finalization():
+                finalize_distributed_crawl_task.delay(str(snapshot.id))
+            return {'status': 'finalizing', 'snapshot_id': str(snapshot.id)}
+        logger.info(f"Возобновляем распределенное сканирование снапшота {snapshot.id}")
+    else:
+        frontier.initialize(
+            website.url,
+            max_depth=crawl_depth,
+            max_pages=settings.CRAWLER_MAX_PAGES,
+            follow_external=follow_external,
+            workers=workers
+        )
+    
+    # Воркеры могут ждать слота за другими сканированиями: пока они в брокере,
+    # reaper не считает снапшот прерванным
+    frontier.mark_workers_queued(workers)
+    SnapshotHeartbeat(snapshot.id).beat(force=True)
+    for worker_index in range(workers):
+        crawl_frontier_worker_task.delay(str(snapshot.id), worker_index)
+    
+    logger.info(f"Запущено распределенное сканирование {website.url}: {workers} воркеров, снапшот {snapshot.id}")
+    return {'status': 'started', 'snapshot_id': str(snapshot.id), 'workers': workers}
+
+
+@shared_task
+def crawl_frontier_worker_task(snapshot_id: str, worker_index: int = 0):
+    """
+    Воркер распределенного сканирования: берет URL из общей очереди в Redis
+    
+    Args:
+        snapshot_id: ID снапшота
+        worker_index: Номер воркера (определяет его основной шард очереди)
+        
+    Returns:
+        dict: Количество сохраненных этим воркером страниц
+    """
+    frontier = RedisFrontier(snapshot_id)
+    frontier.worker_started()
+    meta = frontier.meta()
+    try:
+        snapshot = ArchiveSnapshot.objects.get(id=snapshot_id, status='processing')
+    except ArchiveSnapshot.DoesNotExist:
+        return {'status': 'skipped', 'message': 'Снапшот не найден или уже завершен'}
+    
+    base_domain = urlparse(meta['start_url']).netloc
+    crawler = WebArchiveCrawler(
+        max_depth=meta['max_depth'],
+        max_pages=meta['max_pages'],
+        rate_limiter=domain_rate_limiter
+    )
+    encryption = ArchiveFileEncryption()
+    archive_dir = encryption.create_secure_archive_directory(snapshot_id)
+    heartbeat = SnapshotHeartbeat(snapshot_id)
+    
+    pages_saved = 0
+    idle_since = None
+    while True:
+        # Снапшот могли завершить с ошибкой, пока воркер работал
+        if not heartbeat.beat():
+            logger.warning(f"Снапшот {snapshot_id} больше не сканируется, воркер {worker_index} остановлен")
+            break
+        item = frontier.pop(worker_index)
+        if item is None:
+            if frontier.pending() <= 0:
+                break
+            # Очередь пуста, но другие воркеры еще могут добавить ссылки
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since > settings.CRAWLER_WORKER_IDLE_TIMEOUT:
+                break
+            time.sleep(IDLE_POLL_INTERVAL)
+            continue
+        idle_since = None
+        
+        url, depth = item
+        try:
+            if frontier.reserve_page(meta['max_pages']):
+                page_data = crawler.fetch_page(url)
+                if page_data:
+                    if persist_page(snapshot, page_data, encryption, archive_dir):
+                        pages_saved += 1
+                    if depth < meta['max_depth']:
+                        for link in page_data['links']:
+                            if meta['follow_external'] or crawler.is_same_domain(link, base_domain):
+                                frontier.push(link, depth + 1)
+        except Exception as e:
+            logger.error(f"Ошибка обработки {url} в снапшоте {snapshot_id}: {str(e)}")
+        finally:
+            if frontier.complete(url, depth):
+                finalize_distributed_crawl_task.delay(snapshot_id)
+    
+    return {'status': 'completed', 'snapshot_id': snapshot_id, 'pages_saved': pages_saved}
+
+
+@shared_task
+def finalize_distributed_crawl_task(snapshot_id: str):
+    """
+    Завершение снапшота распределенного сканирования после опустошения очереди
+    
+    Args:
+        snapshot_id: ID снапшота
+    """
+    frontier = RedisFrontier(snapshot_id)
+    meta = frontier.meta()
+    
+    metadata = {
+        'crawl_settings': {
+            'max_depth': meta.get('max_depth'),
+            'max_pages': meta.get('max_pages'),
+            'follow_external': meta.get('follow_external'),
+            'workers': meta.get('workers'),
+        },
+        'crawl_time': round(time.time() - meta['started_at'], 1) if meta.get('started_at') else None,
+        'start_url': meta.get('start_url'),
+        'base_domain': urlparse(meta.get('start_url', '')).netloc,
+        'distributed': True
+    }
+    if not finalize_snapshot(snapshot_id, metadata):
+        return {'status': 'skipped', 'snapshot_id': snapshot_id}
+    
+    frontier.cleanup()
+    snapshot = ArchiveSnapshot.objects.get(id=snapshot_id)
+    update_recrawl_schedule(snapshot)
+    try_dispatch_crawls()
+    
+    logger.info(f"Распределенное сканирование завершено: снапшот {snapshot_id}, {snapshot.pages_count} страниц")
+    return {
+        'status': 'completed',
+        'snapshot_id': snapshot_id,
+        'pages_count': snapshot.pages_count,
+        'assets_count': snapshot.assets_count
+    }
+
+
 @shared_task
 def download_asset_task(asset_id: str):
     """
@@ -178,11 +389,13 @@ def download_asset_task(asset_id: str):
     try:
         asset = ArchivedAsset.objects.get(id=asset_id)
         
-        # Используем Scrapling для скачивания ресурса
-        fetcher = StealthyFetcher()
-        response = fetcher.fetch(asset.url)
+        # Запросы к домену ограничены общим для кластера token bucket
+        domain_rate_limiter.acquire(asset.url)
         
-        if response and response.status == 200:
+        # Ресурсам браузер не нужен - загружаем через пул HTTP соединений
+        response = tiered_fetcher.download(asset.url)
+        
+        if response.status_code == 200:
             # Создаем путь для сохранения
             archive_dir = os.path.join(
                 settings.ARCHIVE_ROOT, 
@@ -212,7 +425,7 @@ def download_asset_task(asset_id: str):
         else:
             return {
                 'status': 'error',
-                'message': f'HTTP {response.status if response else "No response"}'
+                'message': f'HTTP {response.status_code}'
             }
             
     except ArchivedAsset.DoesNotExist:
@@ -259,4 +472,50 @@ def cleanup_old_snapshots_task():
         
     except Exception as e:
         logger.error(f"Ошибка очистки старых снапшотов: {str(e)}")
- 
\ No newline at end of file
+ 
+
+
+@shared_task
+def schedule_recrawls_task():
+    """
+    Периодическая задача (celery beat): повторное сканирование сайтов по расписанию
+    
+    Returns:
+        dict: Количество отправленных на сканирование сайтов
+    """
+    if not settings.CRAWLER_RECRAWL_ENABLED:
+        return {'status': 'disabled'}
+    
+    scheduled = schedule_recrawls()
+    return {'status': 'completed', 'scheduled_count': len(scheduled)}
+
+
+@shared_task
+def dispatch_crawls_task():
+    """
+    Периодическая задача (celery beat): допуск ожидающих сканирований
+    
+    Страхует запуски диспетчера при постановке и завершении сканирований.
+    
+    Returns:
+        dict: Количество отправленных в Celery сканирований
+    """
+    return {'status': 'completed', 'dispatched_count': dispatch_crawls()}
+
+
+@shared_task
+def reap_stalled_crawls_task():
+    """
+    Периодическая задача (celery beat): возобновление прерванных сканирований
+    
+    Снапшоты без признаков жизни дольше CRAWLER_STALL_TIMEOUT продолжаются
+    с того же места или, после CRAWLER_MAX_ATTEMPTS попыток, завершаются с
+    ошибкой с удалением частичных данных.
+    
+    Returns:
+        dict: Количество возобновленных и завершенных с ошибкой снапшотов
+    """
+    result = reap_stalled_snapshots()
+    if result['failed']:
+        try_dispatch_crawls()
+    return {'status': 'completed', **result}
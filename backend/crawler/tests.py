@@ -0,0 +1,171 @@
+"""
+Тесты справедливого распределения сканирований (crawler/fair_share.py)
+"""
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from archive.models import ArchiveSnapshot, Website
+from .fair_share import dispatch_crawls, select_crawls
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fair-share-tests'},
+}
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    CRAWLER_DISPATCH_MAX_IN_FLIGHT=4,
+    CRAWLER_USER_MAX_ACTIVE=10,
+    CRAWLER_USER_WEIGHTS={}
+)
+class SelectCrawlsTests(TestCase):
+    """
+    Выбор сканирований по deficit round robin между пользователями
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+        self.queued_at = timezone.now() - timedelta(hours=1)
+
+    def enqueue(self, user, count, priority=0, workers=None):
+        """Ожидающие допуска сканирования сайтов пользователя (с workers - распределенные)"""
+        crawl_options = {'distributed': True, 'workers': workers} if workers else {}
+        snapshots = []
+        for _ in range(count):
+            domain = f'{user.username}-{Website.objects.count()}.example.com'
+            website = Website.objects.create(url=f'https://{domain}/', domain=domain, created_by=user)
+            self.queued_at += timedelta(seconds=1)
+            snapshots.append(ArchiveSnapshot.objects.create(
+                website=website, status='pending', priority=priority, snapshot_date=self.queued_at,
+                crawl_options=crawl_options
+            ))
+        return snapshots
+
+    def dispatch(self):
+        """Один запуск диспетчера: выбранные сканирования помечаются отправленными"""
+        selected = select_crawls()
+        ArchiveSnapshot.objects.filter(pk__in=[snapshot.pk for snapshot in selected]).update(
+            dispatched_at=timezone.now()
+        )
+        return selected
+
+    def owners(self, snapshots):
+        return [snapshot.website.created_by.username for snapshot in snapshots]
+
+    def test_skewed_backlog_is_shared_equally(self):
+        self.enqueue(self.alice, 20)
+        self.enqueue(self.bob, 2)
+
+        selected = self.dispatch()
+
+        self.assertEqual(Counter(self.owners(selected)), {'alice': 2, 'bob': 2})
+
+    def test_user_order_follows_priority_then_queue_time(self):
+        first, second = self.enqueue(self.alice, 2, priority=5)
+        urgent = self.enqueue(self.alice, 1, priority=0)[0]
+
+        selected = self.dispatch()
+
+        self.assertEqual([snapshot.pk for snapshot in selected], [urgent.pk, first.pk, second.pk])
+
+    @override_settings(CRAWLER_DISPATCH_MAX_IN_FLIGHT=6, CRAWLER_USER_WEIGHTS={'alice': 2})
+    def test_weights_split_slots_proportionally(self):
+        self.enqueue(self.alice, 10)
+        self.enqueue(self.bob, 10)
+
+        selected = self.dispatch()
+
+        self.assertEqual(Counter(self.owners(selected)), {'alice': 4, 'bob': 2})
+
+    @override_settings(CRAWLER_USER_WEIGHTS={'bob': 0})
+    def test_zero_weight_user_is_not_dispatched(self):
+        self.enqueue(self.alice, 2)
+        self.enqueue(self.bob, 2)
+
+        selected = self.dispatch()
+
+        self.assertEqual(self.owners(selected), ['alice', 'alice'])
+
+    @override_settings(CRAWLER_USER_MAX_ACTIVE=2)
+    def test_user_cap_leaves_slots_to_others(self):
+        self.enqueue(self.alice, 10)
+        self.enqueue(self.bob, 1)
+
+        selected = self.dispatch()
+        self.assertEqual(Counter(self.owners(selected)), {'alice': 2, 'bob': 1})
+
+        # Слоты есть, но у alice уже CRAWLER_USER_MAX_ACTIVE отправленных
+        self.assertEqual(self.dispatch(), [])
+
+    def test_global_cap_stops_dispatch(self):
+        self.enqueue(self.alice, 6)
+
+        self.assertEqual(len(self.dispatch()), 4)
+        self.assertEqual(self.dispatch(), [])
+
+        ArchiveSnapshot.objects.filter(dispatched_at__isnull=False).update(status='completed')
+        self.assertEqual(len(self.dispatch()), 2)
+
+    @override_settings(CRAWLER_DISPATCH_MAX_IN_FLIGHT=1)
+    def test_single_slot_alternates_between_runs(self):
+        self.enqueue(self.alice, 5)
+        self.enqueue(self.bob, 5)
+
+        owners = []
+        for _ in range(6):
+            selected = self.dispatch()
+            owners += self.owners(selected)
+            # Сканирование завершилось - слот освободился к следующему запуску
+            ArchiveSnapshot.objects.filter(pk__in=[snapshot.pk for snapshot in selected]).update(status='completed')
+
+        self.assertEqual(owners, ['alice', 'bob'] * 3)
+
+    @override_settings(CRAWLER_DISPATCH_MAX_IN_FLIGHT=1, CRAWLER_USER_WEIGHTS={'alice': 2})
+    def test_single_slot_keeps_weighted_credit_between_runs(self):
+        self.enqueue(self.alice, 6)
+        self.enqueue(self.bob, 6)
+
+        owners = []
+        for _ in range(6):
+            selected = self.dispatch()
+            owners += self.owners(selected)
+            ArchiveSnapshot.objects.filter(pk__in=[snapshot.pk for snapshot in selected]).update(status='completed')
+
+        self.assertEqual(owners, ['alice', 'alice', 'bob'] * 2)
+
+    def test_distributed_crawl_takes_a_slot_per_worker(self):
+        self.enqueue(self.alice, 1, workers=3)
+        self.enqueue(self.bob, 3)
+
+        selected = self.dispatch()
+
+        self.assertEqual(self.owners(selected), ['alice', 'bob'])
+        self.assertEqual(self.dispatch(), [])
+
+    def test_distributed_workers_are_capped_by_free_slots(self):
+        self.enqueue(self.bob, 2)
+        self.dispatch()
+        distributed = self.enqueue(self.alice, 1, workers=64)[0]
+
+        with mock.patch('crawler.fair_share.send_crawls'):
+            self.assertEqual(dispatch_crawls(), 1)
+        distributed.refresh_from_db()
+        self.assertEqual(distributed.crawl_options['workers'], 2)
+        self.assertEqual(self.dispatch(), [])
+
+    @override_settings(CRAWLER_DISPATCH_MAX_IN_FLIGHT=8)
+    def test_distributed_crawl_spends_credit_per_worker(self):
+        self.enqueue(self.alice, 2, workers=4)
+        self.enqueue(self.bob, 6)
+
+        selected = self.dispatch()
+
+        self.assertEqual(Counter(self.owners(selected)), {'alice': 1, 'bob': 4})
@@ -3,12 +3,14 @@ URL маршруты для API краулера
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 
 urlpatterns = [
     path('', include(router.urls)),
     path('start-crawl/', views.start_crawl, name='start_crawl'),
+    path('bulk-start-crawl/', views.bulk_start_crawl, name='bulk_start_crawl'),
     path('crawl-status/<str:task_id>/', views.crawl_status, name='crawl_status'),
+    path('crawl-progress/<str:task_id>/', async_views.crawl_progress_stream, name='crawl_progress_stream'),
 ] 
\ No newline at end of file
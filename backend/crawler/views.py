@@ -7,10 +7,11 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 from django.shortcuts import get_object_or_404
-from celery.result import AsyncResult
 from archive.models import Website
-from archive.serializers import CreateSnapshotSerializer
-from .tasks import crawl_website_task
+from archive.serializers import BulkCrawlSerializer, CreateSnapshotSerializer
+from .progress import task_status
+from .queues import CRAWL_PRIORITIES
+from .submission import CrawlRequest, submit_crawl, submit_crawls
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,6 +27,15 @@ def start_crawl(request):
     return view.post(request)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_start_crawl(request):
+    """Функция-обертка для пакетного запуска сканирования"""
+    view = BulkStartCrawlView()
+    view.request = request
+    return view.post(request)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def crawl_status(request, task_id):
@@ -49,8 +59,16 @@ class StartCrawlView(APIView):
         {
             "website_id": "uuid",
             "crawl_depth": 3,
-            "follow_external_links": false
+            "follow_external_links": false,
+            "distributed": false,
+            "workers": 4,
+            "priority": "high"
         }
+        
+        При distributed=true сайт сканируется несколькими воркерами
+        с общей очередью URL в Redis. Если у сайта уже есть ожидающее или
+        идущее сканирование, новое не запускается: возвращается task_id
+        существующего (coalesced=true, статус 200).
         """
         serializer = CreateSnapshotSerializer(data=request.data, context={'request': request})
         
@@ -64,6 +82,9 @@ class StartCrawlView(APIView):
             website_id = serializer.validated_data['website_id']
             crawl_depth = serializer.validated_data.get('crawl_depth', 3)
             follow_external = serializer.validated_data.get('follow_external_links', False)
+            distributed = serializer.validated_data.get('distributed', False)
+            workers = serializer.validated_data.get('workers')
+            priority = serializer.validated_data.get('priority', 'high')
             
             # Проверяем доступ к веб-сайту
             website = get_object_or_404(
@@ -72,18 +93,26 @@ class StartCrawlView(APIView):
                 created_by=request.user
             )
             
-            # Запускаем фоновую задачу
-            task = crawl_website_task.delay(
-                str(website_id),
-                crawl_depth,
-                follow_external
-            )
+            # Запускаем фоновую задачу или присоединяемся к идущей
+            submission = submit_crawl(CrawlRequest(
+                website,
+                crawl_depth=crawl_depth,
+                follow_external=follow_external,
+                distributed=distributed,
+                workers=workers,
+                priority=CRAWL_PRIORITIES[priority]
+            ))
             
-            logger.info(f"Запущено сканирование {website.url}, задача: {task.id}")
+            if submission.coalesced:
+                logger.info(f"Сканирование {website.url} уже идет, задача: {submission.task_id}")
+            else:
+                logger.info(f"Запущено сканирование {website.url}, задача: {submission.task_id}")
             
             return Response({
-                'message': 'Сканирование запущено',
-                'task_id': task.id,
+                'message': 'Сканирование уже выполняется' if submission.coalesced else 'Сканирование запущено',
+                'task_id': submission.task_id,
+                'snapshot_id': submission.snapshot_id,
+                'coalesced': submission.coalesced,
                 'website': {
                     'id': str(website.id),
                     'url': website.url,
@@ -91,9 +120,11 @@ class StartCrawlView(APIView):
                 },
                 'settings': {
                     'crawl_depth': crawl_depth,
-                    'follow_external_links': follow_external
+                    'follow_external_links': follow_external,
+                    'distributed': distributed,
+                    'priority': priority
                 }
-            }, status=status.HTTP_202_ACCEPTED)
+            }, status=status.HTTP_200_OK if submission.coalesced else status.HTTP_202_ACCEPTED)
             
         except Exception as e:
             logger.error(f"Ошибка запуска сканирования: {str(e)}")
@@ -103,6 +134,80 @@ class StartCrawlView(APIView):
             )
 
 
+class BulkStartCrawlView(APIView):
+    """
+    API для пакетного запуска сканирования многих сайтов
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        """
+        Пакетный запуск сканирования
+        
+        POST /api/v1/crawler/bulk-start-crawl/
+        {
+            "website_ids": ["uuid", ...],
+            "websites": [{"website_id": "uuid", "priority": "high", "crawl_depth": 2}, ...],
+            "priority": "normal",
+            "crawl_depth": 3,
+            "follow_external_links": false
+        }
+        
+        Сайты с ожидающим или идущим сканированием не запускаются повторно
+        (status=coalesced, task_id существующего сканирования). Чужие и
+        несуществующие сайты возвращаются в not_found.
+        """
+        serializer = BulkCrawlSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(
+                {'error': 'Неверные данные', 'details': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            data = serializer.validated_data
+            items = data['items']
+            websites = Website.objects.filter(
+                id__in={item['website_id'] for item in items},
+                created_by=request.user
+            ).in_bulk()
+            
+            crawl_requests = []
+            not_found = []
+            for item in items:
+                website = websites.get(item['website_id'])
+                if website is None:
+                    not_found.append(str(item['website_id']))
+                    continue
+                crawl_requests.append(CrawlRequest(
+                    website,
+                    crawl_depth=item.get('crawl_depth') or data.get('crawl_depth'),
+                    follow_external=data['follow_external_links'],
+                    priority=CRAWL_PRIORITIES[item.get('priority') or data['priority']]
+                ))
+            
+            submissions = submit_crawls(crawl_requests)
+            queued = sum(1 for submission in submissions if not submission.coalesced)
+            
+            logger.info(f"Пакетный запуск: {queued} сканирований, {len(submissions) - queued} уже идут")
+            
+            return Response({
+                'message': 'Сканирования запущены',
+                'queued': queued,
+                'coalesced': len(submissions) - queued,
+                'results': [submission.as_dict() for submission in submissions],
+                'not_found': not_found
+            }, status=status.HTTP_202_ACCEPTED)
+            
+        except Exception as e:
+            logger.error(f"Ошибка пакетного запуска сканирования: {str(e)}")
+            return Response(
+                {'error': 'Ошибка запуска сканирования', 'message': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
 class CrawlStatusView(APIView):
     """
     API для проверки статуса сканирования
@@ -116,25 +221,7 @@ class CrawlStatusView(APIView):
         GET /api/v1/crawler/status/<task_id>/
         """
         try:
-            # Получаем результат задачи
-            task_result = AsyncResult(task_id)
-            
-            response_data = {
-                'task_id': task_id,
-                'status': task_result.status,
-                'ready': task_result.ready()
-            }
-            
-            if task_result.ready():
-                if task_result.successful():
-                    response_data['result'] = task_result.result
-                else:
-                    response_data['error'] = str(task_result.info)
-            else:
-                # Задача еще выполняется
-                if task_result.info:
-                    response_data['progress'] = task_result.info
-            
+            response_data = task_status(task_id)
             return Response(response_data)
             
         except Exception as e:
@@ -3,12 +3,19 @@ AES 256 шифрование для безопасного хранения ар
 """
 import os
 import base64
+from typing import Iterator
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
 from django.conf import settings
 
+# Размер фрагмента base64 при потоковой расшифровке (кратен 4)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Длина заголовка зашифрованных данных: соль (16) + IV (16)
+HEADER_SIZE = 32
+
 
 class AESCipher:
     """
@@ -123,6 +130,61 @@ class AESCipher:
         except Exception as e:
             raise ValueError(f"Ошибка дешифрования: {str(e)}")
     
+    def decrypt_stream(self, encrypted_data: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Потоковое дешифрование данных
+        
+        base64 декодируется и расшифровывается фрагментами, поэтому помимо
+        исходной строки в памяти держится только один фрагмент.
+        
+        Args:
+            encrypted_data: Зашифрованные данные в формате base64
+            chunk_size: Размер фрагмента base64 (округляется до кратного 4)
+            
+        Yields:
+            bytes: Фрагменты расшифрованных данных (UTF-8)
+        """
+        if not encrypted_data:
+            return
+        
+        step = max(4, chunk_size - chunk_size % 4)
+        header = b''
+        decryptor = None
+        pending = b''
+        
+        try:
+            for offset in range(0, len(encrypted_data), step):
+                raw = base64.b64decode(encrypted_data[offset:offset + step])
+                
+                if decryptor is None:
+                    # Ждем, пока накопятся соль и IV
+                    header += raw
+                    if len(header) < HEADER_SIZE:
+                        continue
+                    salt, iv, raw = header[:16], header[16:HEADER_SIZE], header[HEADER_SIZE:]
+                    key = self._derive_key(salt)
+                    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+                    decryptor = cipher.decryptor()
+                
+                pending += decryptor.update(raw)
+                
+                # Последний блок содержит padding - придерживаем его до конца
+                if len(pending) > 16:
+                    yield pending[:-16]
+                    pending = pending[-16:]
+            
+            if decryptor is None:
+                raise ValueError("Неполный заголовок зашифрованных данных")
+            
+            pending += decryptor.finalize()
+            padding_length = pending[-1]
+            tail = pending[:-padding_length]
+            if tail:
+                yield tail
+                
+        except Exception as e:
+            raise ValueError(f"Ошибка дешифрования: {str(e)}")
+    
     def encrypt_file(self, file_path: str, output_path: str = None) -> str:
         """
         Шифрование файла
@@ -1,10 +1,13 @@
 """
 Модуль для шифрования файлов архивов
 """
+import ast
+import io
 import os
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 from django.conf import settings
+from PIL import Image
 from .aes_cipher import AESCipher
 
 
@@ -23,19 +26,23 @@ class ArchiveFileEncryption:
         """
         Шифрование метаданных архива
         
+        Метаданные сериализуются в компактный JSON без отступов и пробелов.
+        
         Args:
             metadata: Словарь с метаданными
             
         Returns:
             str: Зашифрованные метаданные
         """
-        metadata_json = json.dumps(metadata, ensure_ascii=False, indent=2)
+        metadata_json = json.dumps(metadata, ensure_ascii=False, separators=(',', ':'), default=str)
         return self.cipher.encrypt(metadata_json)
     
     def decrypt_archive_metadata(self, encrypted_metadata: str) -> Dict[str, Any]:
         """
         Дешифрование метаданных архива
         
+        Понимает и старый формат, в котором метаданные сохранялись как str(dict).
+        
         Args:
             encrypted_metadata: Зашифрованные метаданные
             
@@ -43,7 +50,10 @@ class ArchiveFileEncryption:
             Dict[str, Any]: Расшифрованные метаданные
         """
         decrypted_json = self.cipher.decrypt(encrypted_metadata)
-        return json.loads(decrypted_json)
+        try:
+            return json.loads(decrypted_json)
+        except ValueError:
+            return ast.literal_eval(decrypted_json)
     
     def encrypt_html_content(self, html_content: str) -> str:
         """
@@ -104,20 +114,58 @@ class ArchiveFileEncryption:
             str: Путь к сохраненному файлу
         """
         # Генерируем безопасное имя файла
-        safe_filename = url.replace('://', '_').replace('/', '_').replace('?', '_')
-        safe_filename = f"{safe_filename}_{timestamp}.html.enc"
+        safe_filename = f"{self._safe_filename(url)}_{timestamp}.html.enc"
         
         file_path = os.path.join(archive_dir, 'pages', safe_filename)
         
         # Шифруем контент
         encrypted_content = self.encrypt_html_content(html_content)
         
-        # Сохраняем зашифрованный файл
-        with open(file_path, 'w', encoding='utf-8') as f:
+        # Сохраняем зашифрованный файл атомарно: при сбое не остается
+        # недописанного файла, повторная запись заменяет прежнюю
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             f.write(encrypted_content)
+        os.replace(tmp_path, file_path)
             
         return file_path
     
+    def save_screenshot(self, archive_dir: str, url: str, image: bytes,
+                        timestamp: str) -> Tuple[str, str]:
+        """
+        Сохранение скриншота страницы (JPEG) и его миниатюры
+        
+        Скриншоты, как и ресурсы страниц, хранятся без шифрования.
+        
+        Args:
+            archive_dir: Директория архива
+            url: URL страницы
+            image: Скриншот в формате JPEG
+            timestamp: Метка времени
+            
+        Returns:
+            Tuple[str, str]: Пути к скриншоту и миниатюре
+        """
+        base_path = os.path.join(archive_dir, 'screenshots', f"{self._safe_filename(url)}_{timestamp}")
+        screenshot_path = f"{base_path}.jpg"
+        thumbnail_path = f"{base_path}_thumb.jpg"
+        
+        thumbnail = Image.open(io.BytesIO(image))
+        thumbnail.thumbnail(settings.CRAWLER_THUMBNAIL_SIZE)
+        thumbnail_buffer = io.BytesIO()
+        thumbnail.convert('RGB').save(thumbnail_buffer, format='JPEG', quality=75)
+        
+        for path, data in ((screenshot_path, image), (thumbnail_path, thumbnail_buffer.getvalue())):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        
+        return screenshot_path, thumbnail_path
+    
+    def _safe_filename(self, url: str) -> str:
+        return url.replace('://', '_').replace('/', '_').replace('?', '_')
+    
     def load_encrypted_page(self, file_path: str) -> str:
         """
         Загрузка и дешифрование страницы
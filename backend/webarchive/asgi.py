@@ -0,0 +1,17 @@
+"""
+ASGI config for webarchive project.
+"""
+
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webarchive.settings')
+
+application = get_asgi_application()
+
+# В режиме разработки отдаем статику (админка) тем же процессом
+from django.conf import settings  # noqa: E402
+
+if settings.DEBUG:
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+    application = ASGIStaticFilesHandler(application)
@@ -0,0 +1,188 @@
+"""
+Маршрутизация запросов к БД между основным сервером и репликами
+
+Запись всегда идет в default. Чтение уходит на реплику только внутри
+запроса, помеченного ReplicaRoutingMiddleware (GET/HEAD к API архива);
+Celery-задачи, админка и API краулера читают из default. Отстающая или
+недоступная реплика временно исключается, чтение откатывается на default.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_DB = 'default'
+
+# Куда направлять чтение в текущем контексте: 'primary' или 'replica'
+_read_target: ContextVar[str] = ContextVar('db_read_target', default='primary')
+
+# Задержка репликации в секундах: 0, если реплика догнала основной сервер
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replica_aliases():
+    """Алиасы реплик из settings.DATABASES"""
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaHealth:
+    """
+    Кеш состояния реплик (задержка репликации, доступность) внутри процесса
+    """
+
+    def __init__(self):
+        self._checked_at = {}
+        self._healthy = {}
+        self._lock = threading.Lock()
+
+    def is_healthy(self, alias: str) -> bool:
+        """Реплика доступна и отстает не больше DB_REPLICA_MAX_LAG секунд"""
+        interval = getattr(settings, 'DB_REPLICA_CHECK_INTERVAL', 5)
+        now = time.monotonic()
+        if now - self._checked_at.get(alias, float('-inf')) < interval:
+            return self._healthy.get(alias, False)
+
+        with self._lock:
+            if now - self._checked_at.get(alias, float('-inf')) < interval:
+                return self._healthy.get(alias, False)
+            healthy = self._check(alias)
+            self._healthy[alias] = healthy
+            self._checked_at[alias] = now
+            return healthy
+
+    def _check(self, alias: str) -> bool:
+        max_lag = getattr(settings, 'DB_REPLICA_MAX_LAG', 10)
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError as e:
+            logger.warning(f"Реплика {alias} недоступна, чтение идет в {PRIMARY_DB}: {e}")
+            return False
+
+        if lag > max_lag:
+            logger.warning(f"Реплика {alias} отстает на {lag:.1f} с, чтение идет в {PRIMARY_DB}")
+            return False
+        return True
+
+
+replica_health = ReplicaHealth()
+
+
+@contextmanager
+def use_primary():
+    """Принудительное чтение из основной БД (read-your-writes)"""
+    token = _read_target.set('primary')
+    try:
+        yield
+    finally:
+        _read_target.reset(token)
+
+
+@contextmanager
+def use_replicas():
+    """Разрешение чтения с реплик в текущем контексте"""
+    token = _read_target.set('replica')
+    try:
+        yield
+    finally:
+        _read_target.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Роутер Django: запись в default, чтение - на здоровую реплику, если разрешено
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_target.get() != 'replica':
+            return PRIMARY_DB
+        replicas = [alias for alias in replica_aliases() if replica_health.is_healthy(alias)]
+        if not replicas:
+            return PRIMARY_DB
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # После записи остаток запроса читает из основной БД
+        if _read_target.get() == 'replica':
+            _read_target.set('primary')
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY_DB, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему через репликацию
+        return db == PRIMARY_DB
+
+
+def should_use_replicas(request) -> bool:
+    """
+    Можно ли читать запрос с реплики
+
+    Только безопасные методы к API архива. Запросы клиента, который недавно
+    выполнял запись (cookie DB_PIN_COOKIE), идут в основную БД.
+    """
+    if not replica_aliases() or request.method not in ('GET', 'HEAD'):
+        return False
+    if request.COOKIES.get(getattr(settings, 'DB_PIN_COOKIE', 'db_pin')):
+        return False
+    prefixes = getattr(settings, 'DB_REPLICA_PATH_PREFIXES', ('/api/v1/archive/',))
+    return request.path.startswith(tuple(prefixes))
+
+
+def pin_after_write(request, response) -> None:
+    """Cookie, направляющая чтение клиента в основную БД сразу после записи"""
+    if request.method in ('GET', 'HEAD', 'OPTIONS') or not replica_aliases():
+        return
+    response.set_cookie(
+        getattr(settings, 'DB_PIN_COOKIE', 'db_pin'), '1',
+        max_age=getattr(settings, 'DB_PIN_SECONDS', 15),
+        httponly=True, samesite='Lax'
+    )
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware, включающее чтение с реплик для запросов только на чтение
+
+    Поддерживает синхронные и асинхронные views (WSGI и ASGI).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with (use_replicas() if should_use_replicas(request) else use_primary()):
+            response = self.get_response(request)
+        pin_after_write(request, response)
+        return response
+
+    async def __acall__(self, request):
+        with (use_replicas() if should_use_replicas(request) else use_primary()):
+            response = await self.get_response(request)
+        pin_after_write(request, response)
+        return response
@@ -0,0 +1,181 @@
+"""
+Кеш файлов фронтенда в памяти процесса
+
+Файлы читаются с диска один раз и перечитываются только при изменении
+mtime. Для каждого файла заранее готовятся gzip и brotli версии и
+отпечаток содержимого, который встраивается в URL (styles.<hash>.css),
+поэтому такие URL можно кешировать в браузере бессрочно.
+"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него отдается gzip
+    brotli = None
+
+# Длина отпечатка содержимого в URL
+FINGERPRINT_LENGTH = 12
+
+# Файлы меньше этого размера не сжимаются
+MIN_COMPRESS_SIZE = 512
+
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+
+# Ресурсы, на которые ссылается index.html и которые получают отпечаток
+FINGERPRINTED_ASSETS = ('styles.css', 'main.js')
+
+ASSET_REFERENCE_PATTERN = re.compile(
+    r'(?P<prefix>(?:href|src)\s*=\s*["\'])(?:\./|/)?(?P<name>styles\.css|main\.js)(?P<suffix>["\'])'
+)
+
+
+@dataclass
+class FrontendFile:
+    """
+    Подготовленный к отдаче файл фронтенда
+    """
+    filename: str
+    mtime: float
+    content: bytes
+    content_type: str
+    fingerprint: str
+    variants: Dict[str, bytes] = field(default_factory=dict)
+    dependencies: Tuple[str, ...] = ()
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.fingerprint}"'
+
+    def fingerprinted_name(self) -> str:
+        """Имя файла с отпечатком: styles.css -> styles.<hash>.css"""
+        stem, ext = os.path.splitext(self.filename)
+        return f"{stem}.{self.fingerprint}{ext}"
+
+    def select_encoding(self, accept_encoding: str) -> Tuple[Optional[str], bytes]:
+        """
+        Выбор сжатой версии по заголовку Accept-Encoding
+
+        Returns:
+            Tuple[Optional[str], bytes]: (Content-Encoding или None, тело ответа)
+        """
+        accepted = set()
+        for part in accept_encoding.split(','):
+            name, _, params = part.partition(';')
+            if params.replace(' ', '') in ('q=0', 'q=0.0'):
+                continue
+            accepted.add(name.strip().lower())
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding]
+        return None, self.content
+
+
+def compress_variants(content: bytes) -> Dict[str, bytes]:
+    """Сжатые версии содержимого (только если они меньше исходного)"""
+    variants = {}
+    if len(content) < MIN_COMPRESS_SIZE:
+        return variants
+
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        variants['gzip'] = compressed
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            variants['br'] = compressed
+    return variants
+
+
+class FrontendCache:
+    """
+    Потокобезопасный кеш файлов фронтенда с инвалидацией по mtime
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root: Каталог с файлами фронтенда
+        """
+        self.root = str(root)
+        self._files: Dict[str, FrontendFile] = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> Optional[FrontendFile]:
+        """
+        Файл из кеша (перечитывается, если изменился на диске)
+
+        Returns:
+            FrontendFile или None, если файла нет
+        """
+        file_path = os.path.join(self.root, filename)
+        try:
+            mtime = os.stat(file_path).st_mtime
+        except OSError:
+            self._files.pop(filename, None)
+            return None
+
+        dependencies = self._dependencies(filename)
+        cached = self._files.get(filename)
+        if cached is not None and cached.mtime == mtime and cached.dependencies == dependencies:
+            return cached
+
+        with self._lock:
+            cached = self._files.get(filename)
+            if cached is not None and cached.mtime == mtime and cached.dependencies == dependencies:
+                return cached
+            try:
+                with open(file_path, 'rb') as f:
+                    content = f.read()
+            except OSError:
+                return None
+            if filename == 'index.html':
+                content = self._link_fingerprinted_assets(content)
+
+            frontend_file = FrontendFile(
+                filename=filename,
+                mtime=mtime,
+                content=content,
+                content_type=CONTENT_TYPES.get(os.path.splitext(filename)[1], 'text/plain; charset=utf-8'),
+                fingerprint=hashlib.sha256(content).hexdigest()[:FINGERPRINT_LENGTH],
+                variants=compress_variants(content),
+                dependencies=dependencies,
+            )
+            self._files[filename] = frontend_file
+            return frontend_file
+
+    def _dependencies(self, filename: str) -> Tuple[str, ...]:
+        """Отпечатки ресурсов, встроенных в HTML (смена ресурса пересобирает HTML)"""
+        if filename != 'index.html':
+            return ()
+        fingerprints = []
+        for asset_name in FINGERPRINTED_ASSETS:
+            asset = self.get(asset_name)
+            fingerprints.append(asset.fingerprint if asset else '')
+        return tuple(fingerprints)
+
+    def _link_fingerprinted_assets(self, content: bytes) -> bytes:
+        """Замена ссылок на styles.css и main.js адресами с отпечатком"""
+        html = content.decode('utf-8')
+
+        def replace(match):
+            asset = self._files.get(match.group('name'))
+            if asset is None:
+                return match.group(0)
+            return f"{match.group('prefix')}/{asset.fingerprinted_name()}{match.group('suffix')}"
+
+        return ASSET_REFERENCE_PATTERN.sub(replace, html).encode('utf-8')
+
+
+frontend_cache = FrontendCache(os.path.join(settings.BASE_DIR, 'frontend'))
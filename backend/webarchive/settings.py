@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'archive',
@@ -43,6 +44,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'webarchive.db_router.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'webarchive.urls'
@@ -64,6 +66,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'webarchive.wsgi.application'
+ASGI_APPLICATION = 'webarchive.asgi.application'
 
 # Database
 DATABASES = {
@@ -77,6 +80,31 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения архива: DB_REPLICA_HOSTS=replica1:5432,replica2:5432
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    replica_host, _, replica_port = replica.strip().partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        # Недоступная реплика не должна надолго задерживать запрос
+        'OPTIONS': {'connect_timeout': int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', 2))},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['webarchive.db_router.ReplicaRouter']
+
+# Допустимая задержка репликации (секунды) и период ее проверки
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 10))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 5))
+
+# После записи клиент читает из основной БД указанное время (read-your-writes)
+DB_PIN_COOKIE = 'db_pin'
+DB_PIN_SECONDS = int(os.getenv('DB_PIN_SECONDS', 15))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -140,10 +168,62 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Очереди: crawl (сканирования пользователей), recrawl (плановые),
+# assets (скачивание ресурсов), maintenance (очистка). Маршруты - crawler/queues.py
+CELERY_TASK_DEFAULT_QUEUE = 'crawl'
+CELERY_TASK_ROUTES = ('crawler.queues.route_task',)
+CELERY_TASK_CREATE_MISSING_QUEUES = True
+# Приоритеты 0-9 внутри очереди Redis (0 - наивысший)
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+# Долгие задачи сканирования не резервируются воркером заранее
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', 1))
+
+# Кеш: Redis (общий для всех процессов), если он настроен, иначе память процесса.
+# Алиас local - быстрый кеш первого уровня внутри процесса поверх Redis.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', os.getenv('REDIS_URL', ''))
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'webarchive',
+        },
+        'local': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'webarchive-local',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'webarchive-default',
+        },
+    }
+
+# Время жизни закешированных ответов списков (секунды)
+ARCHIVE_QUERY_CACHE_TIMEOUT = int(os.getenv('ARCHIVE_QUERY_CACHE_TIMEOUT', 15 * 60))
+
 # Архивные настройки
 ARCHIVE_ROOT = BASE_DIR / 'archives'
 ARCHIVE_ROOT.mkdir(exist_ok=True)
 
+# Конфигурация полнотекстового поиска PostgreSQL
+ARCHIVE_SEARCH_CONFIG = os.getenv('ARCHIVE_SEARCH_CONFIG', 'russian')
+# Текст страниц в индексе хранится в открытом виде (см. archive/search.py):
+# 'positions' - лексемы с позициями, 'lexemes' - без позиций, 'none' - без текста
+ARCHIVE_SEARCH_BODY_INDEX = os.getenv('ARCHIVE_SEARCH_BODY_INDEX', 'positions')
+
+# Количество потоков расшифровки при пакетной выгрузке контента
+ARCHIVE_BATCH_WORKERS = int(os.getenv('ARCHIVE_BATCH_WORKERS', min(8, os.cpu_count() or 1)))
+
+# Потоки для расшифровки контента в асинхронных views
+ARCHIVE_CRYPTO_WORKERS = int(os.getenv('ARCHIVE_CRYPTO_WORKERS', min(32, (os.cpu_count() or 1) + 4)))
+
 # AES шифрование настройки
 AES_KEY = os.getenv('AES_KEY', 'your-256-bit-key-here-32-characters')
 AES_ENABLED = os.getenv('AES_ENABLED', 'True').lower() == 'true'
@@ -156,4 +236,93 @@ X_FRAME_OPTIONS = 'DENY'
 # Лимиты для краулера
 CRAWLER_MAX_DEPTH = 10
 CRAWLER_MAX_PAGES = 1000
-CRAWLER_DELAY = 1  # секунды между запросами 
\ No newline at end of file
+CRAWLER_DELAY = 1  # секунды между запросами
+CRAWLER_PROGRESS_INTERVAL = 1.0  # минимальный интервал публикации прогресса (секунды)
+
+# Распределенное сканирование одного сайта несколькими воркерами
+CRAWLER_REDIS_URL = os.getenv('CRAWLER_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+CRAWLER_DISTRIBUTED_WORKERS = int(os.getenv('CRAWLER_DISTRIBUTED_WORKERS', 4))
+CRAWLER_FRONTIER_SHARDS = 16
+CRAWLER_WORKER_IDLE_TIMEOUT = 60  # секунды ожидания новых URL при пустой очереди
+
+# Общий для кластера лимит запросов к регистрируемому домену (token bucket в Redis)
+CRAWLER_DOMAIN_RATE = float(os.getenv('CRAWLER_DOMAIN_RATE', 1 / CRAWLER_DELAY if CRAWLER_DELAY else 0))  # запросов/с
+CRAWLER_DOMAIN_BURST = float(os.getenv('CRAWLER_DOMAIN_BURST', 2))
+CRAWLER_RATE_LIMIT_BATCH = 4  # токенов за одно обращение к Redis
+CRAWLER_DOMAIN_RATE_OVERRIDES = {}  # {'example.com': {'rate': 5, 'burst': 10}}
+
+# Многоуровневая загрузка страниц (crawler/fetcher.py): HTTP по умолчанию,
+# браузер - только для хостов с блокировками и JS-оболочками
+CRAWLER_FETCH_TIERS = ('http', 'browser', 'stealth')  # разрешенные уровни
+CRAWLER_FETCH_TIER_TTL = 7 * 24 * 60 * 60  # срок, на который запоминается уровень хоста
+CRAWLER_FETCH_TIER_LOCAL_TTL = 60  # кеш уровня в процессе (секунды)
+CRAWLER_FETCH_BLOCK_THRESHOLD = 3  # разных URL хоста с 401/403 до эскалации
+CRAWLER_FETCH_BLOCK_WINDOW = 10 * 60  # окно учета отказов (секунды)
+CRAWLER_HTTP_POOL_SIZE = 10  # keep-alive соединений на хост
+CRAWLER_USER_AGENT = os.getenv('CRAWLER_USER_AGENT', '')
+CRAWLER_JS_SHELL_MIN_TEXT = 200  # меньше символов текста - страница строится скриптами
+
+# Пул headless браузеров процесса воркера (crawler/browser_pool.py)
+CRAWLER_BROWSER_CONTEXTS = int(os.getenv('CRAWLER_BROWSER_CONTEXTS', 2))  # одновременных рендеров на процесс
+CRAWLER_BROWSER_CONTEXT_MAX_PAGES = 50  # страниц до пересоздания контекста
+CRAWLER_BROWSER_MAX_PAGES = 1000  # страниц до перезапуска браузера
+CRAWLER_BROWSER_MAX_MEMORY_MB = int(os.getenv('CRAWLER_BROWSER_MAX_MEMORY_MB', 1024))  # RSS процессов браузера
+CRAWLER_BROWSER_IDLE_WAIT = 2.0  # ожидание затихания сети после загрузки страницы (секунды)
+CRAWLER_BROWSER_EXECUTABLE = os.getenv('CRAWLER_BROWSER_EXECUTABLE', '')  # по умолчанию Chromium Playwright
+CRAWLER_SCREENSHOTS = os.getenv('CRAWLER_SCREENSHOTS', 'rendered')  # none | rendered | all
+CRAWLER_SCREENSHOT_QUALITY = 80  # качество JPEG
+CRAWLER_SCREENSHOT_FULL_PAGE = False  # только видимая область 1280x800
+CRAWLER_THUMBNAIL_SIZE = (320, 200)
+
+# Адаптивное повторное сканирование (crawler/scheduler.py): интервал сайта
+# подбирается по наблюдаемой частоте изменения страниц между снапшотами
+CRAWLER_RECRAWL_ENABLED = os.getenv('CRAWLER_RECRAWL_ENABLED', 'True').lower() == 'true'
+CRAWLER_RECRAWL_TICK = 300  # секунды между запусками планировщика
+CRAWLER_RECRAWL_MIN_INTERVAL = 60 * 60
+CRAWLER_RECRAWL_MAX_INTERVAL = 30 * 24 * 60 * 60
+CRAWLER_RECRAWL_DEFAULT_INTERVAL = 24 * 60 * 60  # пока частота изменений неизвестна
+CRAWLER_RECRAWL_CHANGE_TARGET = 0.5  # доля изменившихся страниц, при которой пора сканировать
+CRAWLER_RECRAWL_SMOOTHING = 0.5  # вес нового наблюдения в скользящей оценке частоты
+# Бюджет: не больше сканирований в час (всех, включая ручные) и одновременно
+CRAWLER_RECRAWL_BUDGET_PER_HOUR = int(os.getenv('CRAWLER_RECRAWL_BUDGET_PER_HOUR', 60))
+CRAWLER_RECRAWL_MAX_ACTIVE = int(os.getenv('CRAWLER_RECRAWL_MAX_ACTIVE', 8))
+
+# Справедливый допуск сканирований в Celery (crawler/fair_share.py):
+# deficit round robin по пользователям с ограничением одновременных сканирований
+# Слоты воркеров crawl: -c воркера (docker-compose.yml) и число его реплик
+CRAWLER_CRAWL_CONCURRENCY = int(os.getenv('CRAWLER_CRAWL_CONCURRENCY', 4))
+CRAWLER_CRAWL_WORKERS = int(os.getenv('CRAWLER_CRAWL_WORKERS', 1))
+CRAWLER_DISPATCH_MAX_IN_FLIGHT = int(os.getenv(
+    'CRAWLER_DISPATCH_MAX_IN_FLIGHT', CRAWLER_CRAWL_WORKERS * CRAWLER_CRAWL_CONCURRENCY
+))
+CRAWLER_USER_MAX_ACTIVE = int(os.getenv('CRAWLER_USER_MAX_ACTIVE', 4))
+CRAWLER_USER_WEIGHTS = {}  # {'username': 2.0}; по умолчанию вес 1
+CRAWLER_DISPATCH_TICK = 30  # секунды между страховочными запусками диспетчера
+
+# Восстановление прерванных сканирований (crawler/recovery.py)
+CRAWLER_HEARTBEAT_INTERVAL = 30  # секунды между отметками heartbeat_at снапшота
+CRAWLER_STALL_TIMEOUT = 5 * 60  # без отметок дольше - сканирование прервано
+CRAWLER_DISPATCH_TIMEOUT = 60 * 60  # отправлено в Celery, но не начато дольше - сообщение потеряно
+CRAWLER_MAX_ATTEMPTS = 3  # попыток до завершения снапшота с ошибкой
+CRAWLER_RETRY_DELAY = 60  # секунды до повтора упавшей задачи сканирования
+CRAWLER_REAPER_TICK = 60
+
+# Периодические задачи (celery beat)
+CELERY_BEAT_SCHEDULE = {
+    'schedule-recrawls': {
+        'task': 'crawler.tasks.schedule_recrawls_task',
+        'schedule': float(CRAWLER_RECRAWL_TICK),
+        # Пропущенный запуск не нужен: следующий выберет те же сайты
+        'options': {'expires': CRAWLER_RECRAWL_TICK},
+    },
+    'dispatch-crawls': {
+        'task': 'crawler.tasks.dispatch_crawls_task',
+        'schedule': float(CRAWLER_DISPATCH_TICK),
+        'options': {'expires': CRAWLER_DISPATCH_TICK},
+    },
+    'reap-stalled-crawls': {
+        'task': 'crawler.tasks.reap_stalled_crawls_task',
+        'schedule': float(CRAWLER_REAPER_TICK),
+        'options': {'expires': CRAWLER_REAPER_TICK},
+    },
+}
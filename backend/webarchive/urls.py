@@ -14,6 +14,10 @@ urlpatterns = [
     # Статические файлы фронтенда
     path('styles.css', views.frontend_static, {'filename': 'styles.css'}, name='frontend_css'),
     path('main.js', views.frontend_static, {'filename': 'main.js'}, name='frontend_js'),
+    path('styles.<str:fingerprint>.css', views.frontend_static, {'filename': 'styles.css'},
+         name='frontend_css_fingerprinted'),
+    path('main.<str:fingerprint>.js', views.frontend_static, {'filename': 'main.js'},
+         name='frontend_js_fingerprinted'),
 ]
 
 # Статические файлы в development режиме
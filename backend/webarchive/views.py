@@ -1,48 +1,61 @@
 """
 Представления для главной страницы веб-архива
+
+Файлы фронтенда отдаются из кеша в памяти процесса (см. frontend.py):
+без чтения с диска, со сжатием и заголовками кеширования.
 """
-from django.shortcuts import render
 from django.http import HttpResponse
-from django.views.generic import TemplateView
-from django.conf import settings
-import os
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from .frontend import FrontendFile, frontend_cache
+
+# Год - срок кеширования ресурсов с отпечатком в URL
+FINGERPRINTED_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def frontend_response(request, frontend_file: FrontendFile, immutable: bool = False) -> HttpResponse:
+    """
+    Ответ с файлом фронтенда: 304 по ETag, сжатая версия, Cache-Control
+
+    Args:
+        request: HTTP запрос
+        frontend_file: Файл из кеша
+        immutable: URL содержит актуальный отпечаток, ответ кешируется бессрочно
+    """
+    response = get_conditional_response(request, etag=frontend_file.etag)
+    if response is None:
+        encoding, body = frontend_file.select_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        response = HttpResponse(body, content_type=frontend_file.content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Content-Length'] = len(body)
+        response['ETag'] = frontend_file.etag
+
+    if immutable:
+        patch_cache_control(response, public=True, max_age=FINGERPRINTED_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
 
 
 def home_view(request):
     """Главная страница веб-архива"""
-    # Путь к фронтенд файлам
-    frontend_path = os.path.join(settings.BASE_DIR, 'frontend')
-    
-    # Читаем HTML файл
-    try:
-        with open(os.path.join(frontend_path, 'index.html'), 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        return HttpResponse(html_content)
-    except FileNotFoundError:
+    frontend_file = frontend_cache.get('index.html')
+    if frontend_file is None:
         return HttpResponse('<h1>Фронтенд не найден. Проверьте что frontend/index.html существует.</h1>')
+    # HTML всегда перепроверяется по ETag: в нем ссылки на актуальные версии ресурсов
+    return frontend_response(request, frontend_file)
+
 
+def frontend_static(request, filename, fingerprint=None):
+    """
+    Отдача статических файлов фронтенда
 
-def frontend_static(request, filename):
-    """Отдача статических файлов фронтенда"""
-    frontend_path = os.path.join(settings.BASE_DIR, 'frontend')
-    file_path = os.path.join(frontend_path, filename)
-    
-    if not os.path.exists(file_path):
+    По адресу с актуальным отпечатком (styles.<hash>.css) файл кешируется
+    бессрочно, по старому адресу или без отпечатка - с перепроверкой по ETag.
+    """
+    frontend_file = frontend_cache.get(filename)
+    if frontend_file is None:
         return HttpResponse('Файл не найден', status=404)
-    
-    # Определяем content-type
-    content_type = 'text/plain'
-    if filename.endswith('.css'):
-        content_type = 'text/css'
-    elif filename.endswith('.js'):
-        content_type = 'application/javascript'
-    elif filename.endswith('.html'):
-        content_type = 'text/html'
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return HttpResponse(content, content_type=content_type)
-    except Exception as e:
-        return HttpResponse(f'Ошибка чтения файла: {str(e)}', status=500)
- 
\ No newline at end of file
+    return frontend_response(request, frontend_file, immutable=fingerprint == frontend_file.fingerprint)